@@ -11,11 +11,12 @@ a = Analysis(
     ['src/main.py'],
     pathex=[],
     binaries=[
-        ('external/whisper.exe', 'external'),
+        ('external/*.exe', 'external'),
         ('external/*.dll', 'external'),
     ],
     datas=[
         ('assets/*.ico', 'assets'),
+        ('assets/speech/sense_and_sensibility_0870.wav', 'assets/speech'),
         ('config.json', '.'),
         (customtkinter_path, 'customtkinter'),
     ],
@@ -31,8 +32,20 @@ a = Analysis(
         'settings_window',
         'hotkey_manager',
         'audio_recorder',
+        'capture_buffer',
         'transcriber',
         'transcriber_api',
+        'whisper_worker',
+        'transcriber_lib',
+        'pcm',
+        'vad',
+        'streaming',
+        'job_queue',
+        'cancellation',
+        'audio_codec',
+        'hedging',
+        'calibration',
+        'model_router',
         'keyboard_injector',
         'main_logic',
         'updater',
@@ -0,0 +1,184 @@
+"""
+Audio encoding for uploads to the cloud backend.
+FLAC (lossless) via soundfile; falls back to WAV when it is not installed.
+"""
+
+import io
+import threading
+import logging
+import time
+
+from pcm import PcmBuffer, wav_header, WAV_UNKNOWN_SIZE
+
+try:
+    import soundfile as sf
+    SOUNDFILE_AVAILABLE = True
+except (ImportError, OSError):  # OSError: libsndfile missing
+    SOUNDFILE_AVAILABLE = False
+
+# format -> (upload filename, MIME type)
+UPLOAD_FORMATS = {
+    "wav": ("audio.wav", "audio/wav"),
+    "flac": ("audio.flac", "audio/flac"),
+}
+
+
+def resolve_format(upload_format):
+    """Requested upload format, downgraded to WAV if it cannot be produced here."""
+    if upload_format not in UPLOAD_FORMATS:
+        logging.warning(f"Unknown upload format '{upload_format}', using wav")
+        return "wav"
+    if upload_format == "flac" and not SOUNDFILE_AVAILABLE:
+        logging.warning("soundfile not installed, uploading WAV instead of FLAC (pip install soundfile)")
+        return "wav"
+    return upload_format
+
+
+def _open_flac(buf, sample_rate, channels):
+    return sf.SoundFile(buf, mode="w", samplerate=sample_rate, channels=channels,
+                        format="FLAC", subtype="PCM_16")
+
+
+class _WavStreamWriter:
+    """
+    Minimal SoundFile-like writer for 16-bit WAV. The header is written
+    first with an unknown length and patched on close, so the leading
+    bytes can be sent before the recording ends.
+    """
+
+    def __init__(self, buf, sample_rate, channels):
+        self.buf = buf
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.closed = False
+        self._data_size = 0
+        buf.write(wav_header(WAV_UNKNOWN_SIZE, sample_rate, channels))
+
+    def write(self, frames):
+        self.buf.write(memoryview(frames).cast("B"))
+        self._data_size += frames.nbytes
+
+    def close(self):
+        if self.closed:
+            return
+        end = self.buf.tell()
+        self.buf.seek(0)
+        self.buf.write(wav_header(self._data_size, self.sample_rate, self.channels))
+        self.buf.seek(end)
+        self.closed = True
+
+
+def encode(pcm, upload_format):
+    """Encode a whole PcmBuffer. Returns (payload bytes, filename, MIME type)."""
+    filename, mime = UPLOAD_FORMATS[upload_format]
+    if upload_format == "wav":
+        return pcm.wav_bytes(), filename, mime
+
+    buf = io.BytesIO()
+    with _open_flac(buf, pcm.sample_rate, pcm.channels) as f:
+        f.write(pcm.as_int16().reshape(-1, pcm.channels))
+    return buf.getvalue(), filename, mime
+
+
+class IncrementalEncoder:
+    """
+    Encodes a recording while it is being captured.
+
+    A background thread picks up newly captured samples from the recorder
+    every `poll_interval` seconds, so little is left to encode at release.
+    The stream covers the whole recording: VAD trimming is not re-applied,
+    which costs next to nothing because silence compresses to a few bytes.
+
+    iter_chunks() hands out encoded bytes as they are produced, for
+    uploads that start before the recording ends. Those consumers see the
+    header as first written (FLAC: unknown length, WAV: maximal length).
+    """
+
+    def __init__(self, recorder, upload_format="flac", poll_interval=0.2):
+        self.recorder = recorder
+        self.capture = recorder.buffer  # this recording's buffer, even once the next one starts
+        self.upload_format = upload_format
+        self.poll_interval = poll_interval
+        self._buf = io.BytesIO()
+        if upload_format == "flac":
+            self._file = _open_flac(self._buf, recorder.sample_rate, recorder.channels)
+        else:
+            self._file = _WavStreamWriter(self._buf, recorder.sample_rate, recorder.channels)
+        self._pos = 0
+        self._sent = 0  # bytes already handed out by iter_chunks()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._payload = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self._encode_pending()
+            except Exception as e:
+                logging.error(f"Incremental encoder error: {e}")
+                return
+
+    def _encode_pending(self, end=None):
+        with self._lock:
+            if self._file.closed:
+                return
+            pending = PcmBuffer(self.capture.view(self._pos), self.recorder.sample_rate)
+            if end is not None:
+                pending = pending.slice(0, max(0, end - self._pos))
+            if len(pending):
+                self._file.write(pending.as_int16().reshape(-1, pending.channels))
+                self._pos += len(pending)
+
+    def _take_new(self):
+        """Encoded bytes not yet handed out."""
+        with self._lock:
+            pos = self._buf.tell()
+            self._buf.seek(self._sent)
+            data = self._buf.read()
+            self._buf.seek(pos)
+            self._sent += len(data)
+        return data
+
+    def iter_chunks(self):
+        """Yield encoded bytes as they become available, until stop() or cancel()."""
+        while True:
+            finished = self._stop.is_set() and self._file.closed
+            data = self._take_new()
+            if data:
+                yield data
+            elif finished:
+                return
+            else:
+                time.sleep(self.poll_interval / 2)
+
+    def stop(self, total_frames):
+        """Recording ended at `total_frames`: encode the remainder and finalize the stream."""
+        if self._payload is not None:
+            return
+        self._stop.set()
+        self._thread.join()
+        t0 = time.perf_counter()
+        self._encode_pending(total_frames)
+        with self._lock:
+            self._file.close()
+        self._payload = self._buf.getvalue()
+        logging.info(f"[TIMING] {self.upload_format.upper()} finish: {(time.perf_counter()-t0)*1000:.0f}ms "
+                     f"({self._pos} frames -> {len(self._payload) // 1024} KB)")
+
+    def finish(self):
+        """Encoded recording as (payload, filename, MIME type)."""
+        if self._payload is None:
+            self.stop(None)
+        filename, mime = UPLOAD_FORMATS[self.upload_format]
+        return self._payload, filename, mime
+
+    def cancel(self):
+        self._stop.set()
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
@@ -1,63 +1,181 @@
-
 import sounddevice as sd
 import numpy as np
+import logging
 import threading
-import wave
+import time
 import os
 
+from pcm import PcmBuffer, SUPPORTED_DTYPES
+from capture_buffer import CaptureBuffer
+
+
 class AudioRecorder:
-    def __init__(self, sample_rate=16000, channels=1):
+    INITIAL_CAPACITY_S = 60  # preallocated per recording; doubles if exceeded
+    POLL_INTERVAL_S = 0.5  # recording poller: grows the buffer ahead of the callback, logs timing
+
+    def __init__(self, sample_rate=16000, channels=1, keep_warm=False, preroll_ms=300,
+                 blocksize=0, latency=None, dtype="float32"):
         self.sample_rate = sample_rate
         self.channels = channels
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported capture dtype '{dtype}', expected one of {SUPPORTED_DTYPES}")
+        self.dtype = dtype  # int16 halves capture memory; backends convert lazily via PcmBuffer
         self.recording = False
-        self.frames = []
+        self.buffer = None
         self.stream = None
-        self.lock = threading.Lock()
+        self._pending_start = False
+
+        # Stream tuning (0 / None = PortAudio defaults)
+        self.blocksize = blocksize
+        self.latency = latency
+
+        # Keep-warm mode: stream stays open, recent audio kept in a pre-roll ring
+        self.keep_warm = keep_warm
+        preroll_samples = int(sample_rate * preroll_ms / 1000) if keep_warm else 0
+        self._preroll = np.zeros((preroll_samples, channels), dtype=dtype)
+        self._preroll_pos = 0
+        self._preroll_filled = 0
+
+        # Key-down → first captured sample latency (measured in the callback, logged by the poller)
+        self._t_start = None
+        self.last_start_latency_ms = None
+        self._latency_logged = False
+        self._status = None  # last non-empty callback status, reported by the poller
+        self._poller = None
+
+    def _open_stream(self):
+        kwargs = {}
+        if self.latency is not None:
+            kwargs["latency"] = self.latency
+        self.stream = sd.InputStream(
+            samplerate=self.sample_rate,
+            channels=self.channels,
+            dtype=self.dtype,
+            blocksize=self.blocksize,
+            callback=self._callback,
+            **kwargs
+        )
+        self.stream.start()
+
+    def _close_stream(self):
+        if self.stream:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+
+    def open(self):
+        """Open the always-on input stream (keep-warm mode only)."""
+        if not self.keep_warm or self.stream:
+            return
+        try:
+            self._open_stream()
+            logging.info(f"Audio stream kept warm with {len(self._preroll) * 1000 // self.sample_rate}ms pre-roll")
+        except Exception as e:
+            logging.error(f"Keep-warm audio stream failed, opening per recording instead: {e}")
+            self.stream = None
+            self.keep_warm = False
+
+    def close(self):
+        """Close the input stream."""
+        self.recording = False
+        self._close_stream()
 
-    def _callback(self, indata, frames, time, status):
+    def _callback(self, indata, frames, time_info, status):
         """Callback for sounddevice stream."""
+        # Runs on the PortAudio thread: the only writer of both buffers, no locks,
+        # no logging and no allocation (the poller reports and grows for it).
         if status:
-            print(f"Audio status: {status}")
+            self._status = status
         if self.recording:
-            with self.lock:
-                self.frames.append(indata.copy())
+            buffer = self.buffer
+            if self._pending_start:
+                self._pending_start = False
+                t_start = self._t_start
+                if t_start is not None:
+                    self.last_start_latency_ms = (time.perf_counter() - t_start) * 1000
+                if self._preroll_filled:
+                    self._drain_preroll(buffer)
+            buffer.write(indata)
+        elif len(self._preroll):
+            self._write_preroll(indata)
+
+    def _write_preroll(self, block):
+        size = len(self._preroll)
+        n = len(block)
+        if n >= size:
+            self._preroll[:] = block[-size:]
+            self._preroll_pos = 0
+        else:
+            end = self._preroll_pos + n
+            if end <= size:
+                self._preroll[self._preroll_pos:end] = block
+            else:
+                first = size - self._preroll_pos
+                self._preroll[self._preroll_pos:] = block[:first]
+                self._preroll[:n - first] = block[first:]
+            self._preroll_pos = end % size
+        self._preroll_filled = min(size, self._preroll_filled + n)
+
+    def _drain_preroll(self, buffer):
+        """Write the pre-roll contents to `buffer` in chronological order and reset it."""
+        if self._preroll_filled < len(self._preroll):
+            buffer.write(self._preroll[:self._preroll_filled])
+        else:
+            buffer.write(self._preroll[self._preroll_pos:])
+            buffer.write(self._preroll[:self._preroll_pos])
+        self._preroll_pos = 0
+        self._preroll_filled = 0
+
+    def _poll(self, buffer):
+        """Recording poller: the non-realtime half of the callback."""
+        while self.recording and self.buffer is buffer:
+            buffer.reserve()
+            self._report()
+            time.sleep(self.POLL_INTERVAL_S)
+
+    def _report(self):
+        """Log what the callback recorded (start latency, stream status)."""
+        status, self._status = self._status, None
+        if status:
+            logging.warning(f"Audio status: {status}")
+        if not self._latency_logged and self.last_start_latency_ms is not None:
+            self._latency_logged = True
+            logging.info(f"[TIMING] Key-down to first sample: {self.last_start_latency_ms:.0f}ms")
 
     def start(self):
         """Start recording audio."""
         if self.recording:
             return
+        self._t_start = time.perf_counter()
+        self.last_start_latency_ms = None
+        self._latency_logged = False
+
+        # Fresh buffer per recording: the previous one may still be in use downstream
+        self.buffer = CaptureBuffer(self.channels, int(self.sample_rate * self.INITIAL_CAPACITY_S), self.dtype)
+        self._pending_start = True
+
         self.recording = True
-        self.frames = []
-        self.stream = sd.InputStream(
-            samplerate=self.sample_rate,
-            channels=self.channels,
-            callback=self._callback
-        )
-        self.stream.start()
+        if not (self.keep_warm and self.stream and self.stream.active):
+            self._close_stream()
+            self._open_stream()
+        self._poller = threading.Thread(target=self._poll, args=(self.buffer,), daemon=True)
+        self._poller.start()
 
     def stop(self):
-        """Stop recording and return the audio data as a numpy array."""
+        """Stop recording and return the audio as a PcmBuffer (a view, not a copy)."""
         if not self.recording:
             return None
-        
+
         self.recording = False
-        if self.stream:
-            self.stream.stop()
-            self.stream.close()
-            self.stream = None
+        if not self.keep_warm:
+            self._close_stream()
 
-        with self.lock:
-            if not self.frames:
-                return np.array([], dtype=np.float32)
-            return np.concatenate(self.frames, axis=0)
+        self._t_start = None
+        self._report()
+        if self.buffer.emergency_grows:
+            logging.warning(f"Capture buffer grew on the audio thread {self.buffer.emergency_grows}x")
+        return PcmBuffer(self.buffer.view(), self.sample_rate)
 
     def save_wav(self, filename, audio_data):
-        """Save numpy array to WAV file (helper for debugging/transcription)."""
-        # Ensure float32 is converted to int16 for standard WAV
-        audio_int16 = (audio_data * 32767).astype(np.int16)
-        
-        with wave.open(filename, 'wb') as wf:
-            wf.setnchannels(self.channels)
-            wf.setsampwidth(2)  # 2 bytes for 16-bit
-            wf.setframerate(self.sample_rate)
-            wf.writeframes(audio_int16.tobytes())
+        """Save audio (PcmBuffer or numpy array) to a 16-bit WAV file (helper for debugging)."""
+        PcmBuffer.wrap(audio_data, self.sample_rate).write_wav(filename)
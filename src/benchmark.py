@@ -0,0 +1,404 @@
+"""
+Offline benchmarks for the transcription backends.
+
+Run from the repo root, e.g.:
+    python src/benchmark.py audio-ctx --model base
+    python src/benchmark.py audio-ctx --model small --clips path/to/wavs
+    python src/benchmark.py upload --kbps 1000
+    python src/benchmark.py stream-upload --kbps 500
+    python src/benchmark.py stream-response --delta-ms 80
+
+The default clips are the recorded speech in assets/speech (public-domain
+LibriVox readings with reference transcripts, see its README), plus a few
+of them joined so every row of the audio context table is exercised.
+Quality is reported as word error rate against the reference transcript,
+and as word agreement with the full-context decode for clips without one.
+The synthetic clips (formant-weighted harmonics plus noise bursts) are
+only used where the content does not matter, e.g. the stub server runs.
+"""
+
+import os
+import sys
+import glob
+import time
+import wave
+import difflib
+import logging
+import argparse
+import re
+
+import numpy as np
+
+from pcm import PcmBuffer
+from utils import get_resource_path
+
+SAMPLE_RATE = 16000
+SYNTHETIC_DURATIONS = (2, 4, 6, 10, 16)
+SPEECH_DIR = get_resource_path("assets/speech")
+# Bundled clips are 3-7 s; these joins cover the 8-12 s, 12-18 s and full-window rows
+SPEECH_JOINS = (("0920", "0930"), ("0870", "0890", "0880"), ("0870", "0880", "0890", "0920", "0930"))
+
+# (F1, F2) formant pairs for a few vowels
+_VOWELS = [(730, 1090), (270, 2290), (300, 870), (530, 1840), (570, 840)]
+
+
+def synthetic_clip(duration, seed=0, sample_rate=SAMPLE_RATE):
+    """Speech-like float32 test signal of `duration` seconds."""
+    rng = np.random.default_rng(seed)
+    out = np.zeros(int(duration * sample_rate), dtype=np.float32)
+    pos = int(0.2 * sample_rate)
+
+    while pos < len(out) - sample_rate // 5:
+        # Unvoiced consonant: short band of noise
+        if rng.random() < 0.5:
+            n = int(rng.uniform(0.03, 0.08) * sample_rate)
+            burst = rng.normal(0, 0.03, n) * np.hanning(n)
+            out[pos:pos + n] += burst[:len(out) - pos]
+            pos += n
+
+        # Voiced vowel: harmonic stack shaped by two formants
+        n = int(rng.uniform(0.12, 0.3) * sample_rate)
+        t = np.arange(n) / sample_rate
+        f0 = rng.uniform(100, 220)
+        f1, f2 = _VOWELS[rng.integers(len(_VOWELS))]
+        harmonics = np.arange(1, int(4000 // f0) + 1) * f0
+        weights = np.exp(-((harmonics - f1) / 150) ** 2) + 0.6 * np.exp(-((harmonics - f2) / 200) ** 2)
+        vowel = (weights[:, None] * np.sin(2 * np.pi * harmonics[:, None] * t)).sum(axis=0)
+        vowel *= 0.2 / (np.abs(vowel).max() + 1e-9) * np.hanning(n)
+        end = min(len(out), pos + n)
+        out[pos:end] += vowel[:end - pos].astype(np.float32)
+        pos = end
+
+        # Gap between syllables, occasionally a longer word break
+        pos += int(rng.uniform(0.03, 0.12 if rng.random() < 0.8 else 0.35) * sample_rate)
+
+    out += rng.normal(0, 0.002, len(out)).astype(np.float32)
+    return PcmBuffer(out, sample_rate)
+
+
+def synthetic_clip_set(durations=SYNTHETIC_DURATIONS):
+    """[(name, PcmBuffer), ...] with one synthetic clip per duration."""
+    return [(f"synthetic_{d}s", synthetic_clip(d, seed=i)) for i, d in enumerate(durations)]
+
+
+def load_clip_dir(path):
+    """Load 16-bit mono WAV files from a directory as [(name, PcmBuffer), ...]."""
+    clips = []
+    for filename in sorted(glob.glob(os.path.join(path, "*.wav"))):
+        with wave.open(filename, "rb") as wf:
+            if wf.getsampwidth() != 2 or wf.getnchannels() != 1:
+                logging.warning(f"Skipping {filename}: expected 16-bit mono")
+                continue
+            samples = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+            clips.append((os.path.basename(filename), PcmBuffer(samples, wf.getframerate())))
+    return clips
+
+
+def load_references(path):
+    """Reference transcripts next to the clips ("<clip>.txt") as {clip name: text}."""
+    references = {}
+    for filename in glob.glob(os.path.join(path, "*.txt")):
+        with open(filename, "r", encoding="utf-8") as f:
+            references[os.path.splitext(os.path.basename(filename))[0] + ".wav"] = f.read().strip()
+    return references
+
+
+def speech_clip_set(path=SPEECH_DIR, joins=SPEECH_JOINS):
+    """
+    ([(name, PcmBuffer), ...], {name: reference}) for the bundled speech clips
+    and the SPEECH_JOINS concatenations of them (named by clip number, e.g. "0920+0930").
+    """
+    clips = load_clip_dir(path)
+    references = load_references(path)
+    by_number = {name.rsplit("_", 1)[-1][:-4]: (name, pcm) for name, pcm in clips}
+    for numbers in joins:
+        if not all(n in by_number for n in numbers):
+            continue
+        parts = [by_number[n] for n in numbers]
+        name = "+".join(numbers)
+        samples = np.concatenate([pcm.samples for _, pcm in parts])
+        clips.append((name, PcmBuffer(samples, parts[0][1].sample_rate)))
+        if all(part in references for part, _ in parts):
+            references[name] = " ".join(references[part] for part, _ in parts)
+    return clips, references
+
+
+def default_clips(path=None):
+    """Clips from `path`, else the bundled speech set (the synthetic set if it is missing)."""
+    if path:
+        return load_clip_dir(path)
+    clips, _ = speech_clip_set()
+    return clips or synthetic_clip_set()
+
+
+def _words(text):
+    return re.sub(r"[^\w\s']", " ", text.lower().replace("-", " ")).split()
+
+
+def word_agreement(a, b):
+    """Word-level similarity of two transcripts in [0, 1]."""
+    wa, wb = _words(a), _words(b)
+    if not wa and not wb:
+        return 1.0
+    return difflib.SequenceMatcher(None, wa, wb).ratio()
+
+
+def word_error_rate(reference, hypothesis):
+    """(substitutions + deletions + insertions) / reference words, ignoring case and punctuation."""
+    ref, hyp = _words(reference), _words(hypothesis)
+    row = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        prev, row[0] = row[0], i
+        for j, h in enumerate(hyp, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (r != h))
+    return row[-1] / len(ref) if ref else float(len(hyp))
+
+
+def _timed(fn, repeats):
+    best, result = None, ""
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = fn()
+        elapsed = (time.perf_counter() - t0) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def compare_audio_ctx(transcriber, clips, table=None, repeats=2, references=None):
+    """
+    Decode each clip with the full 30 s window and with the reduced audio
+    context `table` (default: the candidate table) picks, and report latency,
+    agreement and, for clips in `references`, the word error rate of both decodes.
+    """
+    from transcriber import audio_ctx_for, CANDIDATE_AUDIO_CTX_TABLE
+
+    if table is None:
+        table = CANDIDATE_AUDIO_CTX_TABLE
+    if not transcriber.cli_accepts_audio_ctx():
+        raise SystemExit(f"{transcriber.whisper_path} has no -ac option, nothing to compare")
+    references = references or {}
+
+    saved = transcriber.audio_ctx_table
+    rows = []
+    try:
+        for name, pcm in clips:
+            transcriber.audio_ctx_table = []
+            full_ms, full_text = _timed(lambda: transcriber.transcribe(pcm), repeats)
+            transcriber.audio_ctx_table = table
+            reduced_ms, reduced_text = _timed(lambda: transcriber.transcribe(pcm), repeats)
+            rows.append({
+                "clip": name,
+                "duration": pcm.duration,
+                "audio_ctx": audio_ctx_for(pcm.duration, table),
+                "full_ms": full_ms,
+                "reduced_ms": reduced_ms,
+                "speedup": full_ms / reduced_ms if reduced_ms else 0.0,
+                "agreement": word_agreement(full_text, reduced_text),
+                "full_wer": word_error_rate(references[name], full_text) if name in references else None,
+                "reduced_wer": word_error_rate(references[name], reduced_text) if name in references else None,
+            })
+    finally:
+        transcriber.audio_ctx_table = saved
+    return rows
+
+
+def compare_upload_formats(clips, kbps=0, formats=("wav", "flac")):
+    """
+    Upload each clip to a local stub endpoint in every format and report
+    payload size and end-to-end request time. The stub reads the body at
+    `kbps` to emulate an uplink; it does not transcribe.
+    """
+    import audio_codec
+    from transcriber_api import TranscriberAPI
+
+    rows = []
+    with _stub_server(kbps) as url:
+        for name, pcm in clips:
+            for fmt in formats:
+                api = TranscriberAPI(api_key="benchmark", upload_format=fmt, url=url)
+                if api.upload_format != fmt:
+                    raise SystemExit(f"Cannot encode {fmt} here (is soundfile installed?)")
+                payload, _, _ = audio_codec.encode(pcm, fmt)
+                t0 = time.perf_counter()
+                api.transcribe(pcm)
+                rows.append({
+                    "clip": name,
+                    "format": fmt,
+                    "duration": pcm.duration,
+                    "kbytes": len(payload) / 1024,
+                    "total_ms": (time.perf_counter() - t0) * 1000,
+                })
+                api.close()
+    return rows
+
+
+def _stub_server(kbps=0, words=2, delta_ms=0):
+    """Local stand-in for the transcription endpoint (tests/fake_transcription_api.py); yields its URL."""
+    tests_dir = get_resource_path("tests")
+    if tests_dir not in sys.path:
+        sys.path.insert(0, tests_dir)
+    from fake_transcription_api import stub_server
+    return stub_server(kbps=kbps, words=words, delta_ms=delta_ms)
+
+
+class _ReplayRecorder:
+    """Stands in for AudioRecorder: feeds a clip into a CaptureBuffer in real time."""
+
+    BLOCK_MS = 20
+
+    def __init__(self, pcm):
+        from capture_buffer import CaptureBuffer
+        self.pcm = pcm
+        self.sample_rate = pcm.sample_rate
+        self.channels = pcm.channels
+        self.buffer = CaptureBuffer(pcm.channels, len(pcm))
+
+    def play(self):
+        samples = self.pcm.as_float32().reshape(-1, self.channels)
+        block = self.sample_rate * self.BLOCK_MS // 1000
+        t0 = time.perf_counter()
+        for i in range(0, len(samples), block):
+            self.buffer.write(samples[i:i + block])
+            # Sleep until the next block would arrive from a live microphone
+            delay = t0 + (i + block) / self.sample_rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+
+def compare_stream_upload(clips, kbps=0, upload_format="flac"):
+    """
+    Replay each clip as a live recording and measure the wait after release
+    with the upload sent after stop vs streamed while recording.
+    """
+    from transcriber_api import TranscriberAPI
+
+    rows = []
+    with _stub_server(kbps) as url:
+        for name, pcm in clips:
+            for stream in (False, True):
+                api = TranscriberAPI(api_key="benchmark", upload_format=upload_format, stream_upload=stream,
+                                     url=url)
+                recorder = _ReplayRecorder(pcm)
+                api.prepare()
+                encoded = api.start_encoder(recorder)
+                recorder.play()
+
+                t0 = time.perf_counter()
+                if encoded:
+                    encoded.stop(len(pcm))
+                text = api.transcribe(pcm, encoded_audio=encoded)
+                rows.append({
+                    "clip": name,
+                    "mode": "stream" if stream else "after",
+                    "duration": pcm.duration,
+                    "release_ms": (time.perf_counter() - t0) * 1000,
+                    "ok": bool(text),
+                })
+                api.close()
+    return rows
+
+
+def compare_stream_response(word_counts=(10, 40, 120), delta_ms=50):
+    """
+    Time to first text and to the complete text, with the transcript sent
+    in one piece vs streamed as events. The stub emits a word every
+    `delta_ms` either way, standing in for the server's decode.
+    """
+    from transcriber_api import TranscriberAPI
+
+    pcm = synthetic_clip(4)
+    rows = []
+    for words in word_counts:
+        with _stub_server(words=words, delta_ms=delta_ms) as url:
+            for stream in (False, True):
+                api = TranscriberAPI(api_key="benchmark", stream_response=stream,
+                                     model="gpt-4o-mini-transcribe", url=url)
+                first = []
+                t0 = time.perf_counter()
+                text = api.transcribe(pcm, on_text=lambda d: first or first.append(time.perf_counter()))
+                t1 = time.perf_counter()
+                rows.append({
+                    "words": words,
+                    "mode": "events" if stream else "whole",
+                    "first_ms": ((first[0] if first else t1) - t0) * 1000,
+                    "total_ms": (t1 - t0) * 1000,
+                    "ok": len(text.split()) == words,
+                })
+                api.close()
+    return rows
+
+
+def _print_rows(rows, columns):
+    print("  ".join(f"{c:>12}" for c in columns))
+    for row in rows:
+        cells = []
+        for c in columns:
+            v = row[c]
+            cells.append(f"{v:>12.2f}" if isinstance(v, float) else f"{'-' if v is None else v!s:>12}")
+        print("  ".join(cells))
+
+
+def _make_transcriber(model_name, language):
+    import model_manager
+    from transcriber import Transcriber
+    from utils import get_resource_path
+
+    if not model_manager.is_model_installed(model_name):
+        raise SystemExit(f"Model '{model_name}' is not installed")
+    # Always the one-shot CLI so every decode includes the same fixed costs
+    return Transcriber(
+        model_path=model_manager.get_model_path(model_name),
+        whisper_path=get_resource_path("external/whisper.exe"),
+        language=language,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="VoiceTyper local transcription benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ctx = sub.add_parser("audio-ctx", help="full vs reduced audio context")
+    ctx.add_argument("--model", default="base")
+    ctx.add_argument("--language", default="en")
+    ctx.add_argument("--clips", help="directory of 16 kHz 16-bit mono WAV files (default: bundled speech clips)")
+    ctx.add_argument("--repeats", type=int, default=2)
+
+    up = sub.add_parser("upload", help="WAV vs FLAC upload size and time against a local stub")
+    up.add_argument("--kbps", type=float, default=0, help="emulated uplink in kbit/s (0 = unthrottled)")
+    up.add_argument("--clips", help="directory of 16 kHz 16-bit mono WAV files (default: bundled speech clips)")
+
+    stream = sub.add_parser("stream-upload", help="upload after release vs while recording (real-time replay)")
+    stream.add_argument("--kbps", type=float, default=0, help="emulated uplink in kbit/s (0 = unthrottled)")
+    stream.add_argument("--format", default="flac", choices=["wav", "flac"])
+    stream.add_argument("--clips", help="directory of 16 kHz 16-bit mono WAV files (default: bundled speech clips)")
+
+    resp = sub.add_parser("stream-response", help="whole response vs server-sent text deltas")
+    resp.add_argument("--delta-ms", type=float, default=50, help="stub delay per word")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.command == "audio-ctx":
+        if args.clips:
+            clips, references = load_clip_dir(args.clips), load_references(args.clips)
+        else:
+            clips, references = speech_clip_set()
+        transcriber = _make_transcriber(args.model, args.language)
+        rows = compare_audio_ctx(transcriber, clips, repeats=args.repeats, references=references)
+        _print_rows(rows, ["clip", "duration", "audio_ctx", "full_ms", "reduced_ms", "speedup", "agreement",
+                           "full_wer", "reduced_wer"])
+    elif args.command == "upload":
+        clips = default_clips(args.clips)
+        rows = compare_upload_formats(clips, kbps=args.kbps)
+        _print_rows(rows, ["clip", "format", "duration", "kbytes", "total_ms"])
+    elif args.command == "stream-upload":
+        clips = default_clips(args.clips)
+        rows = compare_stream_upload(clips, kbps=args.kbps, upload_format=args.format)
+        _print_rows(rows, ["clip", "mode", "duration", "release_ms", "ok"])
+    elif args.command == "stream-response":
+        rows = compare_stream_response(delta_ms=args.delta_ms)
+        _print_rows(rows, ["words", "mode", "first_ms", "total_ms", "ok"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
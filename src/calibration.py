@@ -0,0 +1,265 @@
+"""
+Thread-count calibration and model benchmarks for the local whisper.cpp engines.
+Decodes a fixed recorded speech clip at several thread / processor counts and
+reports the fastest, which is stored per model in config "local_threads"
+together with its real-time factor (a starting point for the model router).
+The machine benchmark times every installed model on the same clip and
+recommends the most accurate one that meets a latency target.
+"""
+
+import os
+import platform
+import threading
+import logging
+import time
+import wave
+
+import numpy as np
+
+from pcm import PcmBuffer
+from utils import get_resource_path, process_memory_mb
+import model_manager
+
+CLIP_SECONDS = 8
+SAMPLE_RATE = 16000
+# 7.1 s public-domain LibriVox reading (see assets/speech/README.md)
+REFERENCE_CLIP = "assets/speech/sense_and_sensibility_0870.wav"
+
+
+def reference_clip(seconds=CLIP_SECONDS):
+    """
+    The recorded speech clip, padded with silence to `seconds` so RTFs stay
+    comparable with earlier results; the synthetic clip if it is missing.
+    Decoder cost depends on the words decoded, which a tone does not produce.
+    """
+    path = get_resource_path(REFERENCE_CLIP)
+    try:
+        with wave.open(path, "rb") as wf:
+            samples = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+            sample_rate = wf.getframerate()
+    except (OSError, wave.Error) as e:
+        logging.warning(f"Reference clip unavailable ({e}), timing the synthetic clip instead")
+        return synthetic_clip(seconds)
+    padded = np.zeros(max(len(samples), int(seconds * sample_rate)), dtype=np.int16)
+    padded[:len(samples)] = samples
+    return PcmBuffer(padded, sample_rate)
+
+
+def synthetic_clip(seconds=CLIP_SECONDS, sample_rate=SAMPLE_RATE):
+    """Deterministic speech-like clip: voiced syllables with a wandering pitch and short pauses."""
+    rng = np.random.default_rng(1234)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    f0 = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+    syllables = np.clip(np.sin(2 * np.pi * 4 * t), 0, None)
+    phrases = (np.sin(2 * np.pi * 0.3 * t) > -0.6).astype(np.float64)
+    audio = 0.2 * voiced * syllables * phrases + 0.005 * rng.standard_normal(len(t))
+    return PcmBuffer(audio.astype(np.float32), sample_rate)
+
+
+def candidate_configs(engine, cores=None):
+    """(threads, processors) pairs worth timing on a machine with `cores` logical cores."""
+    cores = cores or os.cpu_count() or 1
+    threads = {t for t in (2, 4, 8, 16, 32) if t <= cores} | {max(1, cores // 2), cores}
+    configs = [(t, 1) for t in sorted(threads)]
+    # whisper.cpp can also split the audio across processors (not via the library API)
+    if engine != "library" and cores >= 8:
+        configs.append((cores // 2, 2))
+    return configs
+
+
+def make_engine(engine, model_path, language, threads=0, processors=1):
+    """A standalone local transcriber (no model cache, no load back-off) for timing runs."""
+    if engine == "library":
+        from transcriber_lib import TranscriberLib
+        return TranscriberLib(model_path=model_path, language=language, threads=threads, busy_threshold=0)
+
+    from transcriber import Transcriber
+    whisper_exe = get_resource_path("external/whisper.exe")
+    server_path = None
+    if engine == "server":
+        server_exe = get_resource_path("external/whisper-server.exe")
+        if os.path.exists(server_exe):
+            server_path = server_exe
+    if not server_path and not os.path.exists(whisper_exe):
+        raise FileNotFoundError(f"whisper.cpp binary not found at {whisper_exe}")
+    return Transcriber(model_path=model_path, whisper_path=whisper_exe, language=language,
+                       server_path=server_path, threads=threads, processors=processors, busy_threshold=0)
+
+
+def _warm_up(transcriber, clip, timeout):
+    """Untimed first decode; an empty result means the engine failed (e.g. rejected an option)."""
+    if not transcriber.transcribe(clip, timeout=timeout).strip():
+        raise RuntimeError("The engine returned no transcript for the reference clip")
+
+
+def time_config(engine, model_path, language, threads, processors, clip, repeats=2):
+    """Best decode time of `clip` in seconds, after one untimed warm-up decode."""
+    transcriber = make_engine(engine, model_path, language, threads, processors)
+    try:
+        transcriber.start()
+        _warm_up(transcriber, clip, timeout=120)
+        best = float("inf")
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            transcriber.transcribe(clip, timeout=120)
+            best = min(best, time.perf_counter() - t0)
+        return best
+    finally:
+        transcriber.close()
+
+
+def calibrate(model_name, model_path, engine="server", language="en",
+              progress_callback=None, done_callback=None):
+    """
+    Calibrate the thread count for one model in a background thread.
+
+    progress_callback(model_name, finished_runs, total_runs) — after each configuration
+    done_callback(model_name, best, error_msg) — best is {"threads", "processors", "seconds"}
+    """
+    def _calibrate():
+        try:
+            configs = candidate_configs(engine)
+            clip = reference_clip()
+            results = []
+            for i, (threads, processors) in enumerate(configs):
+                seconds = time_config(engine, model_path, language, threads, processors, clip)
+                logging.info(f"[TIMING] Calibration {model_name}: -t {threads} -p {processors}: "
+                             f"{seconds*1000:.0f}ms for a {CLIP_SECONDS}s clip")
+                results.append((seconds, threads, processors))
+                if progress_callback:
+                    progress_callback(model_name, i + 1, len(configs))
+            seconds, threads, processors = min(results)
+            logging.info(f"Calibration {model_name}: fastest is {threads} threads x {processors} processor(s)")
+            if done_callback:
+                done_callback(model_name, {"threads": threads, "processors": processors,
+                                           "seconds": round(seconds, 3)}, "")
+        except Exception as e:
+            logging.error(f"Calibration of '{model_name}' failed: {e}")
+            if done_callback:
+                done_callback(model_name, None, str(e))
+
+    threading.Thread(target=_calibrate, daemon=True).start()
+
+
+# ── Machine benchmark ──────────────────────────────────────────
+
+def machine_id():
+    """Key for cached benchmark results (a portable config may move between machines)."""
+    return f"{platform.node()}|{platform.machine()}|{platform.processor() or '?'}|{os.cpu_count()}"
+
+
+class _MemorySampler:
+    """Polls the resident memory of the engine's process(es) and keeps the peak."""
+
+    def __init__(self, get_pids, interval=0.05):
+        self.get_pids = get_pids
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            sizes = [process_memory_mb(pid) for pid in self.get_pids()]
+            sizes = [size for size in sizes if size is not None]
+            if sizes:
+                self.peak = max(self.peak or 0.0, sum(sizes))
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.peak
+
+
+def _engine_pids(transcriber):
+    worker = getattr(transcriber, "worker", None)
+    if worker:
+        return [worker.process.pid] if worker.process else []
+    procs = getattr(transcriber, "_procs", None)
+    if procs is not None:
+        with transcriber._procs_lock:  # decodes add and remove themselves concurrently
+            return [process.pid for process in procs]  # one-shot whisper.exe decodes
+    return [os.getpid()]  # in-process library
+
+
+def measure_model(model_name, engine, language, clip, threads=0, processors=1, repeats=2):
+    """
+    Load time, decode time, real-time factor and peak resident memory of one
+    model on this machine. With one-shot whisper.exe decodes the model is
+    loaded by every decode, so load_s is None and the load counts towards the RTF.
+    """
+    in_process = engine == "library"
+    baseline = (process_memory_mb() or 0.0) if in_process else 0.0
+    transcriber = make_engine(engine, model_manager.get_model_path(model_name), language, threads, processors)
+    sampler = _MemorySampler(lambda: _engine_pids(transcriber)).start()
+    try:
+        t0 = time.perf_counter()
+        transcriber.start()
+        worker = getattr(transcriber, "worker", None)
+        if worker:
+            worker.ensure_running()
+        load_s = time.perf_counter() - t0 if (worker or in_process) else None
+
+        _warm_up(transcriber, clip, timeout=300)  # first-inference allocations, not timed
+        decode_s = float("inf")
+        for _ in range(repeats):
+            t1 = time.perf_counter()
+            transcriber.transcribe(clip, timeout=300)
+            decode_s = min(decode_s, time.perf_counter() - t1)
+    finally:
+        peak = sampler.stop()
+        transcriber.close()
+
+    return {
+        "load_s": round(load_s, 2) if load_s is not None else None,
+        "decode_s": round(decode_s, 3),
+        "rtf": round(decode_s / clip.duration, 4),
+        "peak_rss_mb": round(peak - baseline) if peak else None,
+    }
+
+
+def recommend(results, target_s):
+    """Most accurate benchmarked model whose clip decode meets `target_s`, else the fastest one."""
+    measured = [name for name, result in results.items() if name in model_manager.MODELS and result]
+    if not measured:
+        return None
+    fast_enough = [name for name in measured if results[name]["decode_s"] <= target_s]
+    return model_manager.by_speed(fast_enough)[-1] if fast_enough else model_manager.by_speed(measured)[0]
+
+
+def benchmark_models(model_names, engine="server", language="en", tuned=None,
+                     progress_callback=None, done_callback=None):
+    """
+    Benchmark models one after another in a background thread.
+
+    tuned: config "local_threads" (calibrated thread counts per model)
+    progress_callback(model_name, finished, total) — after each model
+    done_callback(results, error_msg) — results is {model name: measure_model() dict}
+    """
+    tuned = tuned or {}
+
+    def _benchmark():
+        clip = reference_clip()
+        results, errors = {}, []
+        names = model_manager.by_speed(model_names)
+        for i, name in enumerate(names):
+            try:
+                settings = tuned.get(name, {})
+                results[name] = measure_model(name, engine, language, clip,
+                                              settings.get("threads", 0), settings.get("processors", 1))
+                logging.info(f"[TIMING] Benchmark {name} ({engine}): {results[name]}")
+            except Exception as e:
+                logging.error(f"Benchmark of '{name}' failed: {e}")
+                errors.append(f"{name}: {e}")
+            if progress_callback:
+                progress_callback(name, i + 1, len(names))
+        if done_callback:
+            done_callback(results, "; ".join(errors))
+
+    threading.Thread(target=_benchmark, daemon=True).start()
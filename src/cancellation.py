@@ -0,0 +1,60 @@
+"""
+Per-call cancellation for transcriptions.
+A CancelToken belongs to one transcribe() call (a queued job, one side of a
+hedge); the engine registers how to abort its in-flight work while it runs,
+so cancelling one call never touches another caller's decode.
+"""
+
+import threading
+import contextlib
+import itertools
+
+
+class CancelToken:
+    """Cancellation handle for one transcription call."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._aborts = {}
+        self._keys = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        """Cancel the call and abort whatever it is running right now."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            aborts = list(self._aborts.values())
+        for abort in aborts:
+            abort()
+
+    @contextlib.contextmanager
+    def registered(self, abort):
+        """Call `abort()` if the token is cancelled while the block runs (or already was)."""
+        with self._lock:
+            key = next(self._keys)
+            cancelled = self._event.is_set()
+            if not cancelled:
+                self._aborts[key] = abort
+        if cancelled:
+            abort()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._aborts.pop(key, None)
+
+
+@contextlib.contextmanager
+def linked(token, *children):
+    """Cancel `children` too when `token` (may be None) is cancelled during the block."""
+    if token is None:
+        yield
+        return
+    with token.registered(lambda: [child.cancel() for child in children]):
+        yield
@@ -0,0 +1,69 @@
+"""
+Sample buffer the audio callback records into.
+Kept apart from audio_recorder so it can be used (and tested) without
+sounddevice / PortAudio, e.g. by the benchmark's replay recorder.
+"""
+
+import numpy as np
+
+
+class CaptureBuffer:
+    """
+    Preallocated, growable sample buffer filled by the audio callback.
+
+    Single producer / single consumer: only the callback writes, and it
+    advances `write_pos` after the samples are in place, so readers can take
+    everything below `write_pos` without a lock.
+
+    Growing allocates, so it happens off the audio thread: reserve() (called
+    by the recorder's poller) prepares a larger array once GROW_AT of the
+    capacity is used, and write() only copies the few blocks that arrived
+    since then and swaps it in.
+    """
+
+    GROW_AT = 0.5
+
+    def __init__(self, channels, capacity, dtype=np.float32):
+        self.data = np.empty((capacity, channels), dtype=dtype)
+        self.write_pos = 0
+        self._next = None  # larger array from reserve(), holding data[:_next_filled]
+        self._next_filled = 0
+        self.emergency_grows = 0
+
+    def write(self, block):
+        pos = self.write_pos
+        end = pos + len(block)
+        if self._next is not None:
+            self._swap()
+        if end > len(self.data):
+            self._grow(end)
+        self.data[pos:end] = block
+        self.write_pos = end
+
+    def reserve(self):
+        """Prepare the next, twice larger array once the buffer is GROW_AT full (not on the audio thread)."""
+        if self._next is not None or self.write_pos < len(self.data) * self.GROW_AT:
+            return
+        data, filled = self.data, self.write_pos
+        grown = np.empty((len(data) * 2, data.shape[1]), dtype=data.dtype)
+        grown[:filled] = data[:filled]
+        self._next_filled = filled
+        self._next = grown  # published last: write() only sees it complete
+
+    def _swap(self):
+        grown, filled = self._next, self._next_filled
+        self._next = None
+        grown[filled:self.write_pos] = self.data[filled:self.write_pos]
+        self.data = grown  # swapped in before write_pos moves on
+
+    def _grow(self, needed):
+        # reserve() fell behind: allocate on the audio thread as a last resort
+        self.emergency_grows += 1
+        grown = np.empty((max(needed, len(self.data) * 2), self.data.shape[1]), dtype=self.data.dtype)
+        grown[:self.write_pos] = self.data[:self.write_pos]
+        self.data = grown  # swapped in before write_pos moves past the old capacity
+
+    def view(self, start=0):
+        """Samples written so far (from `start`), without copying."""
+        end = self.write_pos  # read the index before the array
+        return self.data[start:end]
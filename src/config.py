@@ -10,11 +10,68 @@ DEFAULT_CONFIG = {
     "auto_start": False,
 
     # Transcription settings
-    "transcription_backend": "local",  # "local" or "api"
+    "transcription_backend": "local",  # "local", "api" or "hedged" (both, racing under a budget)
     "openai_api_key": "",  # Required for API mode
-    "local_model": "small",  # "tiny", "base", or "small"
+    "api_upload_format": "flac",  # "flac" (smaller upload, needs soundfile) or "wav"
+    "api_stream_upload": False,  # send audio while recording (chunked request opened at key-down)
+    "api_url": "",  # OpenAI-compatible transcription endpoint; empty = api.openai.com
+    "api_auth_scheme": "bearer",  # "bearer" (Authorization header), "api-key" (api-key header) or "none"
+    "api_model": "whisper-1",
+    "api_stream_response": False,  # type text as the server streams it (needs e.g. gpt-4o-mini-transcribe)
+    "api_chunk_s": 30.0,  # longer recordings are split at pauses and sent in parallel
+    "api_max_parallel": 4,
+    "api_chunk_retries": 2,
+
+    # Hybrid ("hedged") backend
+    "hedge_primary": "local",  # backend tried first: "local" or "cloud"
+    "hedge_budget_s": 1.5,  # start the other backend if the first has not answered by then
+    "api_breaker_failures": 3,  # consecutive API failures before routing straight to local
+    "api_breaker_cooldown_s": 60.0,
+    "local_model": "small",  # any model_manager.MODELS name, e.g. "base", "small-q5_1", "large-v3-turbo-q5_0"
+    "local_engine": "server",  # "server" (persistent worker), "library" (in-process libwhisper) or "cli"
+    "audio_transport": "pipe",  # "pipe" (stdin, no disk) or "file" (temp WAV) for whisper.exe
+    "audio_ctx_table": None,  # [[max_seconds, audio_ctx], ...] for short utterances; None / [] = off (needs whisper.exe with -ac)
+    "model_router": False,  # pick the local model per utterance to meet router_target_s
+    "router_target_s": 1.5,  # stop-to-text target for the router
+    "router_models": [],  # models the router may use; [] = every installed model
+    "router_rtf": {},  # learned decode seconds per audio second, per model (kept across sessions)
+    "escalation": False,  # decode with escalation_fast_model, re-decode low-confidence results
+    "escalation_fast_model": "base",  # a fast model, e.g. "tiny", "base" or "base-q5_1"
+    "escalation_model": "small",
+    "escalation_threshold": 0.6,  # geometric mean token probability below which the accurate model re-decodes
+    "local_threads": {},  # per model {"threads": n, "processors": n}, set by Settings > Calibrate Threads
+    "thread_backoff_load": 0.75,  # use fewer threads while CPU load is above this share, 0 = never
+    "local_segment_s": 30.0,  # recordings of 2+ segments are split at pauses and decoded in parallel, 0 = off
+    "local_max_parallel": 4,  # whisper.exe processes for those segments (each loads the model), 0 = cores / 2
+    "benchmark_target_s": 1.5,  # Settings > Benchmark: recommend the best model decoding the 8 s clip within this many seconds
+    "model_benchmarks": {},  # cached benchmark results per machine and engine
+    "model_memory_budget_mb": 1024,  # loaded models kept resident (server / library engines)
+    "model_idle_evict_min": 15,  # unload a resident model after this many idle minutes, 0 = never
     "language": "de",
 
+    # Audio capture
+    "audio_keep_warm": False,  # keep the input stream open between recordings
+    "audio_preroll_ms": 300,  # audio kept from before key-down (keep-warm only)
+    "audio_blocksize": 0,  # frames per callback, 0 = PortAudio default
+    "audio_latency": None,  # "low", "high" or seconds; None = sounddevice default
+    "capture_dtype": "float32",  # "float32" or "int16" (half the memory)
+
+    # Voice activity detection (silence trimming before transcription)
+    "vad_enabled": True,
+    "vad_threshold_db": -48.0,  # minimum frame level counted as speech (dBFS)
+    "vad_min_speech_ms": 150,  # recordings with less voiced audio are dropped
+
+    # Streaming: transcribe completed chunks while the hotkey is still held
+    "streaming_mode": False,
+    "streaming_min_chunk_s": 4.0,  # never cut a chunk shorter than this
+    "streaming_max_chunk_s": 20.0,  # force a cut if no pause is found by then
+
+    # Transcription queue
+    "max_queued_jobs": 4,
+    "job_timeout_base_s": 20.0,  # per-job timeout = base + per_audio_s * recording seconds
+    "job_timeout_per_audio_s": 2.0,
+    "discard_modifier": "shift",  # hold with the hotkey to discard unfinished transcriptions
+
     # Clipboard
     "clipboard_hotkey": "left alt",
 
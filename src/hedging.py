@@ -0,0 +1,203 @@
+"""
+Hedged transcription across the local and cloud backends.
+The primary backend gets a latency budget; if it has not answered by then
+the secondary starts as well, and the first usable answer wins.
+"""
+
+import threading
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from pcm import PcmBuffer
+from cancellation import CancelToken, linked
+
+
+class CircuitBreaker:
+    """
+    Stops routing to a backend after `failure_threshold` consecutive
+    failures. Once `cooldown_s` has passed a single trial request is let
+    through (half-open); its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold=3, cooldown_s=60.0, name="API"):
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self.name = name
+        self.failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        """True while cooling down (requests are refused)."""
+        with self._lock:
+            return self._opened_at is not None and time.monotonic() - self._opened_at < self.cooldown_s
+
+    def allow(self):
+        """Whether a request may go out now. Hands out the half-open trial at most once."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown_s or self._trial_running:
+                return False
+            self._trial_running = True
+            logging.info(f"{self.name} circuit half-open, sending a trial request")
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logging.info(f"{self.name} circuit closed")
+            self.failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            trial_failed = self._trial_running
+            self._trial_running = False
+            if trial_failed or (self._opened_at is None and self.failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                logging.warning(f"{self.name} circuit open after {self.failures} failure(s), "
+                                f"routing around it for {self.cooldown_s:.0f}s")
+
+    def release_trial(self):
+        """The trial request ended without an outcome (cancelled): the next request may be the trial."""
+        with self._lock:
+            self._trial_running = False
+
+
+class HedgedTranscriber:
+    """
+    Runs `local` and `cloud` transcribers as primary and backup.
+
+    The primary starts immediately; if it has not produced text within
+    `budget_s`, the secondary starts too and whichever answers first is
+    used. Each side runs under its own CancelToken, so cancelling the loser
+    stops only its work (its whisper.exe processes or worker request,
+    uploads still in progress), never another caller's decode.
+    While the cloud circuit breaker is open, only the local backend runs.
+    """
+
+    def __init__(self, local, cloud, primary="local", budget_s=1.5, breaker=None):
+        if primary not in ("local", "cloud"):
+            raise ValueError(f"Unknown hedge primary '{primary}', expected 'local' or 'cloud'")
+        self.backends = {"local": local, "cloud": cloud}
+        self.primary = primary
+        self.secondary = "cloud" if primary == "local" else "local"
+        self.budget_s = budget_s
+        self.breaker = breaker or CircuitBreaker()
+        cloud.breaker = self.breaker
+        self.wins = {"local": 0, "cloud": 0}
+        # Losers keep running in the background, so allow a few at once
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hedge")
+
+    def prepare(self):
+        if hasattr(self.backends["local"], "prepare"):
+            self.backends["local"].prepare()
+        if not self.breaker.is_open:
+            self.backends["cloud"].prepare()
+
+    def start_encoder(self, recorder):
+        if self.breaker.is_open:
+            return None
+        return self.backends["cloud"].start_encoder(recorder)
+
+    def close(self):
+        for backend in self.backends.values():
+            if hasattr(backend, "close"):
+                backend.close()
+        self._pool.shutdown(wait=False)
+
+    def _call(self, name, pcm, timeout, encoded_audio, cancel):
+        backend = self.backends[name]
+        if name == "local":
+            return backend.transcribe(pcm, timeout=timeout, cancel=cancel)
+        try:
+            if encoded_audio is not None:
+                return backend.transcribe(pcm, timeout=timeout, encoded_audio=encoded_audio, cancel=cancel)
+            return backend.transcribe(pcm, timeout=timeout, cancel=cancel)
+        finally:
+            if cancel.cancelled:
+                # A cancelled call records no outcome; a half-open trial it held must not stay taken
+                self.breaker.release_trial()
+
+    @staticmethod
+    def _text(future):
+        try:
+            return future.result() or ""
+        except Exception as e:
+            logging.error(f"Hedged backend failed: {e}")
+            return ""
+
+    @staticmethod
+    def _cancel(name, tokens, encoded_audio):
+        tokens[name].cancel()
+        if name == "cloud" and encoded_audio is not None:
+            encoded_audio.cancel()  # also when the cloud was never called
+
+    def transcribe(self, audio_data, sample_rate=16000, timeout=60, encoded_audio=None, cancel=None):
+        if len(audio_data) == 0:
+            return ""
+        pcm = PcmBuffer.wrap(audio_data, sample_rate)
+        tokens = {"local": CancelToken(), "cloud": CancelToken()}
+        with linked(cancel, *tokens.values()):
+            return self._hedge(pcm, timeout, encoded_audio, tokens)
+
+    def _hedge(self, pcm, timeout, encoded_audio, tokens):
+        # The breaker is consulted only when the cloud is about to be called,
+        # so a half-open trial is never handed out for a request not sent
+        if self.primary == "cloud" and not self.breaker.allow():
+            logging.info("Hedge: API circuit open, transcribing locally")
+            self._cancel("cloud", tokens, encoded_audio)
+            return self.backends["local"].transcribe(pcm, timeout=timeout, cancel=tokens["local"])
+
+        t0 = time.perf_counter()
+        first = self._pool.submit(self._call, self.primary, pcm, timeout, encoded_audio, tokens[self.primary])
+        futures = {first: self.primary}
+        done, _ = wait(futures, timeout=self.budget_s)
+        if done:
+            text = self._text(first)
+            if text:
+                self._declare(self.primary, t0, hedged=False)
+                self._cancel(self.secondary, tokens, encoded_audio)
+                return text
+            logging.info(f"Hedge: {self.primary} returned nothing, trying {self.secondary}")
+        else:
+            logging.info(f"Hedge: {self.primary} over the {self.budget_s:.1f}s budget, starting {self.secondary}")
+
+        if self.secondary == "cloud" and not self.breaker.allow():
+            logging.info("Hedge: API circuit open, waiting for local")
+            self._cancel("cloud", tokens, encoded_audio)
+            done, _ = wait(futures, timeout=max(0.0, t0 + timeout - time.perf_counter()))
+            return self._text(first) if done else ""
+
+        futures[self._pool.submit(self._call, self.secondary, pcm, timeout, encoded_audio,
+                                  tokens[self.secondary])] = self.secondary
+        pending = {f for f in futures if not f.done()}
+        deadline = t0 + timeout
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.perf_counter()),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                logging.error("Hedge: no backend answered in time")
+                break
+            for future in done:
+                text = self._text(future)
+                if text:
+                    winner = futures[future]
+                    self._declare(winner, t0, hedged=True)
+                    if pending:
+                        self._cancel(futures[pending.pop()], tokens, encoded_audio)
+                    return text
+        for future in pending:
+            self._cancel(futures[future], tokens, encoded_audio)
+        return ""
+
+    def _declare(self, winner, t0, hedged):
+        self.wins[winner] += 1
+        logging.info(f"[TIMING] Hedge: {winner} answered in {(time.perf_counter()-t0)*1000:.0f}ms"
+                     f"{' (hedged)' if hedged else ''}; wins local {self.wins['local']} / cloud {self.wins['cloud']}")
@@ -11,6 +11,7 @@ class HotkeyManager:
         self.on_start_recording = on_start_recording
         self.on_stop_recording = on_stop_recording
         self.on_show_clipboard = None  # callback set by main.py
+        self.on_discard_previous = None  # callback set by main_logic ("discard previous" gesture)
         self.is_recording = False
         self.lock = threading.Lock()
         self._hook = None
@@ -51,9 +52,16 @@ class HotkeyManager:
 
             self._hook = keyboard.hook(hook_callback, suppress=True)
 
+    def _check_discard_gesture(self):
+        """Modifier held while starting a recording discards earlier, unfinished transcriptions."""
+        modifier = self.config.get("discard_modifier", "shift")
+        if modifier and self.on_discard_previous and keyboard.is_pressed(modifier):
+            self.on_discard_previous()
+
     def _on_press_hold(self, event):
         with self.lock:
             if not self.is_recording:
+                self._check_discard_gesture()
                 self.is_recording = True
                 self.on_start_recording()
 
@@ -69,6 +77,7 @@ class HotkeyManager:
                 self.is_recording = False
                 self.on_stop_recording()
             else:
+                self._check_discard_gesture()
                 self.is_recording = True
                 self.on_start_recording()
 
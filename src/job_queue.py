@@ -0,0 +1,146 @@
+"""
+Ordered transcription job queue.
+A single worker thread decodes recordings one at a time, so utterances never
+compete for CPU and are injected in the order they were spoken. Streaming
+chunk decodes run on the same worker, in line with the jobs.
+"""
+
+import itertools
+import queue
+import threading
+import logging
+from concurrent.futures import Future
+
+from cancellation import CancelToken
+
+
+class TranscriptionJob:
+    """One recording waiting to be transcribed and injected."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, audio, stream_session=None, timeout=60, encoder=None):
+        self.id = next(self._ids)
+        self.audio = audio
+        self.stream_session = stream_session
+        self.encoder = encoder  # IncrementalEncoder holding the compressed upload, if any
+        self.timeout = timeout
+        self.cancel_token = CancelToken()  # aborts this job's decode
+
+    @property
+    def cancelled(self):
+        return self.cancel_token.cancelled
+
+    def cancel(self):
+        """Discard the job: abort its decode and never inject its text."""
+        self.cancel_token.cancel()
+        if self.stream_session:
+            self.stream_session.cancel()
+        if self.encoder:
+            self.encoder.cancel()
+
+
+def scaled_timeout(duration, base=20.0, per_second=2.0):
+    """Job timeout in seconds, growing with the length of the audio."""
+    return base + per_second * duration
+
+
+class _Task:
+    """A function call (a streaming chunk decode) run on the queue's worker."""
+
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+        self.future = Future()
+
+    def run(self):
+        if not self.future.set_running_or_notify_cancel():
+            return  # cancelled while queued
+        try:
+            self.future.set_result(self.fn(*self.args))
+        except Exception as e:
+            self.future.set_exception(e)
+
+
+class TranscriptionQueue:
+    """
+    FIFO of TranscriptionJobs processed by one worker thread. At most
+    `maxsize` jobs wait at a time; tasks from run_task() are never dropped.
+    """
+
+    def __init__(self, handler, maxsize=4):
+        self.handler = handler  # handler(job), runs on the worker thread
+        self.maxsize = maxsize
+        self._queue = queue.Queue()  # jobs and tasks, in submission order
+        self._waiting = 0  # jobs in _queue
+        self._current = None
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="transcription-queue")
+        self._thread.start()
+
+    @property
+    def pending(self):
+        """Jobs waiting to start."""
+        return self._waiting
+
+    @property
+    def depth(self):
+        """Jobs waiting or in progress."""
+        return self.pending + (1 if self._current is not None else 0)
+
+    def submit(self, job):
+        """Queue a job. Returns False (and drops it) if the queue is full."""
+        with self._lock:
+            if self.maxsize and self._waiting >= self.maxsize:
+                logging.warning(f"Transcription queue full, dropping job {job.id}")
+                return False
+            self._waiting += 1
+            self._queue.put(job)
+        logging.info(f"Queued job {job.id} (depth {self.depth}, timeout {job.timeout:.0f}s)")
+        return True
+
+    def run_task(self, fn, *args):
+        """Run fn(*args) on the worker after everything queued so far. Returns a Future."""
+        task = _Task(fn, args)
+        self._queue.put(task)
+        return task.future
+
+    def cancel_all(self):
+        """Discard every queued job and the one in progress."""
+        with self._lock:
+            jobs = [item for item in list(self._queue.queue) if isinstance(item, TranscriptionJob)]
+            if self._current is not None:
+                jobs.append(self._current)
+        for job in jobs:
+            job.cancel()
+        if jobs:
+            logging.info(f"Discarded {len(jobs)} transcription job(s)")
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            if isinstance(job, _Task):
+                job.run()
+                self._queue.task_done()
+                continue
+            with self._lock:
+                self._waiting -= 1
+                self._current = job
+            try:
+                if job.cancelled:
+                    logging.info(f"Skipping discarded job {job.id}")
+                else:
+                    self.handler(job)
+            except Exception as e:
+                logging.error(f"Job {job.id} failed: {e}")
+            finally:
+                with self._lock:
+                    self._current = None
+                self._queue.task_done()
+
+    def shutdown(self):
+        """Stop the worker after discarding outstanding jobs."""
+        self.cancel_all()
+        self._queue.put(None)
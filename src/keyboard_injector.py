@@ -19,6 +19,16 @@ class TextInjector:
         except Exception as e:
             print(f"Injection error: {e}")
 
+    def inject_partial(self, text):
+        """Type a fragment of a longer text as-is (keeps the spaces between fragments)."""
+        if not text:
+            return
+
+        try:
+            self.keyboard.type(text)
+        except Exception as e:
+            print(f"Injection error: {e}")
+
     def inject_enter(self):
         self.keyboard.press(Key.enter)
         self.keyboard.release(Key.enter)
@@ -198,15 +198,24 @@ def _rebuild_tray_menu():
 def update_icon():
     while tray_icon:
         try:
+            depth = app_logic.jobs.depth
             if app_logic.hotkey_manager.is_recording:
                 tray_icon.icon = icons["recording"]
-            elif (app_logic.processing_thread
-                  and app_logic.processing_thread.is_alive()):
+            elif depth or app_logic.warming_up:
                 tray_icon.icon = icons["loading"]
             elif _update_available:
                 tray_icon.icon = icons["update"]
             else:
                 tray_icon.icon = icons["idle"]
+
+            if depth > 1:
+                title = f"VoiceTyper ({depth} transcribing)"
+            elif app_logic.warming_up:
+                title = "VoiceTyper (loading model)"
+            else:
+                title = "VoiceTyper"
+            if tray_icon.title != title:
+                tray_icon.title = title
         except Exception:
             pass
         time.sleep(0.1)
@@ -1,17 +1,23 @@
 
-import threading
 import logging
 import time
 import os
 import ctypes
+import threading
 from collections import deque
 
+import numpy as np
+
 from config import ConfigManager
 from audio_recorder import AudioRecorder
 from keyboard_injector import TextInjector
 from hotkey_manager import HotkeyManager
-from utils import setup_logging, notify, get_app_dir
+from utils import setup_logging, notify, get_app_dir, start_cpu_sampler
 import model_manager
+import vad
+from pcm import PcmBuffer
+from streaming import StreamingSession
+from job_queue import TranscriptionQueue, TranscriptionJob, scaled_timeout
 
 class VoiceTyperApp:
     def __init__(self):
@@ -23,15 +29,38 @@ class VoiceTyperApp:
         logging.info("Initializing VoiceTyper...")
         
         self.config = ConfigManager()
-        self.recorder = AudioRecorder()
-        
+        self.recorder = AudioRecorder(
+            keep_warm=self.config.get("audio_keep_warm", False),
+            preroll_ms=self.config.get("audio_preroll_ms", 300),
+            blocksize=self.config.get("audio_blocksize", 0),
+            latency=self.config.get("audio_latency", None),
+            dtype=self.config.get("capture_dtype", "float32"),
+        )
+        self.recorder.open()
+
+        # Loaded models stay resident across settings reloads, within a memory budget
+        self.models = model_manager.ModelResidency(
+            budget_mb=self.config.get("model_memory_budget_mb", 1024),
+            idle_evict_s=self.config.get("model_idle_evict_min", 15) * 60,
+        )
+
+        # Thread back-off and the model router read the recent CPU load
+        start_cpu_sampler()
+
         # Initialize transcriber based on config
+        self._warmup_done = threading.Event()
         self.transcriber = self._init_transcriber()
+        self._start_warmup()
 
         self.injector = TextInjector()
         
         # State
-        self.processing_thread = None
+        # One worker decodes recordings in order; depth is shown by the tray icon
+        self.jobs = TranscriptionQueue(
+            self._run_job, maxsize=self.config.get("max_queued_jobs", 4)
+        )
+        self.stream_session = None  # active StreamingSession while recording in streaming mode
+        self.active_encoder = None  # encoder / streaming upload of the current recording (API backend)
         self.on_state_change = None  # UI callback: ("recording"|"processing"|"done"|"idle")
         self.clipboard_history = deque(maxlen=5)
 
@@ -41,6 +70,7 @@ class VoiceTyperApp:
             self.start_recording,
             self.stop_recording
         )
+        self.hotkey_manager.on_discard_previous = self.discard_pending
 
         logging.info("VoiceTyper initialized and ready.")
 
@@ -90,6 +120,47 @@ class VoiceTyperApp:
             except Exception:
                 pass
 
+    @property
+    def warming_up(self):
+        """True until the current transcriber has finished its warm-up decode."""
+        return not self._warmup_done.is_set()
+
+    def _start_warmup(self):
+        """Warm the new transcriber in the background; the tray shows "loading" meanwhile."""
+        done = threading.Event()
+        self._warmup_done = done
+        threading.Thread(target=self._warm_up, args=(self.transcriber, done),
+                         daemon=True, name="warm-up").start()
+
+    def _warm_up(self, transcriber, done):
+        """
+        Pull the local model into the page cache and run two short silent
+        decodes, so the first dictation does not pay for cold disk reads and
+        whisper's first-inference allocations. Cloud backends only get prepare().
+        """
+        try:
+            # Hybrid mode: the local side is the one that needs warming
+            local = getattr(transcriber, "backends", {}).get("local", transcriber)
+            model_path = getattr(local, "model_path", None)
+            if not model_path:
+                if transcriber and hasattr(transcriber, "prepare"):
+                    transcriber.prepare()
+                return
+            t0 = time.perf_counter()
+            size = model_manager.preload_model_file(model_path)
+            t_read = time.perf_counter()
+            silence = PcmBuffer(np.zeros(16000, dtype=np.float32), 16000)
+            local.transcribe(silence, timeout=60)
+            t_cold = time.perf_counter()
+            local.transcribe(silence, timeout=60)
+            t_warm = time.perf_counter()
+            logging.info(f"[TIMING] Warm-up: model read {(t_read-t0)*1000:.0f}ms ({size // (1024 * 1024)} MB), "
+                         f"cold decode {(t_cold-t_read)*1000:.0f}ms, warm decode {(t_warm-t_cold)*1000:.0f}ms")
+        except Exception as e:
+            logging.error(f"Warm-up failed: {e}")
+        finally:
+            done.set()
+
     def _notify_state(self, state):
         if self.on_state_change:
             self.on_state_change(state)
@@ -97,56 +168,157 @@ class VoiceTyperApp:
     def start_recording(self):
         logging.info("Starting recording...")
         self.recorder.start()
+        # Let the backend get ready (e.g. open the API connection) while the user speaks
+        if self.transcriber and hasattr(self.transcriber, "prepare"):
+            self.transcriber.prepare()
+        if self.config.get("streaming_mode", False) and self.transcriber:
+            self.stream_session = StreamingSession(
+                self.recorder, self.transcriber, self.jobs,
+                min_chunk_s=self.config.get("streaming_min_chunk_s", 4.0),
+                max_chunk_s=self.config.get("streaming_max_chunk_s", 20.0),
+                threshold_db=self.config.get("vad_threshold_db", -48.0),
+                chunk_timeout=self._job_timeout,
+            )
+            self.stream_session.start()
+        elif self.transcriber and hasattr(self.transcriber, "start_encoder"):
+            try:
+                self.active_encoder = self.transcriber.start_encoder(self.recorder)
+            except Exception as e:
+                logging.error(f"Failed to start upload encoder: {e}")
         self._notify_state("recording")
 
     def stop_recording(self):
         logging.info("Stopping recording...")
         audio_data = self.recorder.stop()
+        stream_session, self.stream_session = self.stream_session, None
+        encoder, self.active_encoder = self.active_encoder, None
+        if stream_session:
+            stream_session.stop()
 
         if len(audio_data) == 0:
             logging.warning("No audio recorded.")
+            if stream_session:
+                stream_session.cancel()
+            if encoder:
+                encoder.cancel()
+            self._notify_state("idle")
+            return
+
+        if encoder:
+            encoder.stop(len(audio_data))
+
+        # Drop accidental taps / silent recordings and trim silent edges before transcribing
+        # (streaming sessions trim each chunk themselves, frame offsets must stay intact)
+        if self.config.get("vad_enabled", True) and not stream_session:
+            audio_data = vad.trim_silence(
+                audio_data,
+                threshold_db=self.config.get("vad_threshold_db", -48.0),
+                min_speech_ms=self.config.get("vad_min_speech_ms", 150),
+            )
+            if audio_data is None:
+                if encoder:
+                    encoder.cancel()
+                self._notify_state("idle")
+                return
+
+        # Queue for the background worker (keeps injection order, timeout scales with length)
+        job = TranscriptionJob(
+            audio_data,
+            stream_session=stream_session,
+            encoder=encoder,
+            timeout=self._job_timeout(audio_data.duration),
+        )
+        if not self.jobs.submit(job):
+            job.cancel()
+            notify("Busy", "Still transcribing earlier recordings, this one was dropped")
             self._notify_state("idle")
             return
 
         self._notify_state("processing")
 
-        # Start processing in background
-        self.processing_thread = threading.Thread(
-            target=self.process_audio,
-            args=(audio_data,)
+    def _job_timeout(self, duration):
+        return scaled_timeout(
+            duration,
+            base=self.config.get("job_timeout_base_s", 20.0),
+            per_second=self.config.get("job_timeout_per_audio_s", 2.0),
         )
-        self.processing_thread.start()
 
-    def process_audio(self, audio_data):
+    def discard_pending(self):
+        """'Discard previous' gesture: drop queued and in-flight transcriptions."""
+        self.jobs.cancel_all()
+
+    def _run_job(self, job):
+        self.process_audio(job.audio, job.stream_session, job)
+
+    def _notify_job_state(self, state):
+        """Overlay update after a job, unless a recording or more jobs still own it."""
+        if self.hotkey_manager.is_recording:
+            return
+        if self.jobs.pending:
+            state = "processing"
+        self._notify_state(state)
+
+    def process_audio(self, audio_data, stream_session=None, job=None):
         import time
         t_start = time.perf_counter()
 
         logging.info(f"Processing {len(audio_data)} samples...")
         if not self.transcriber:
             logging.error("Transcriber not available")
-            self._notify_state("idle")
+            self._notify_job_state("idle")
             return
 
+        typed = []  # fragments already typed while the response was streaming in
+
+        def type_partial(delta):
+            if job and job.cancelled:
+                return
+            if not typed:
+                delta = delta.lstrip()
+                if not delta:
+                    return
+                logging.info(f"[TIMING] First character: {(time.perf_counter()-t_start)*1000:.0f}ms")
+            typed.append(delta)
+            self.injector.inject_partial(delta)
+
+        kwargs = {"timeout": job.timeout if job else 60}
+        if job:
+            kwargs["cancel"] = job.cancel_token
+        if job and job.encoder:
+            kwargs["encoded_audio"] = job.encoder
+        if getattr(self.transcriber, "stream_response", False):
+            kwargs["on_text"] = type_partial
         try:
-            text = self.transcriber.transcribe(audio_data)
+            if stream_session:
+                text = stream_session.finish(audio_data, timeout=kwargs["timeout"])
+            else:
+                text = self.transcriber.transcribe(audio_data, **kwargs)
         except Exception as e:
             logging.error(f"Transcription failed: {e}")
-            self._notify_state("idle")
+            if not (job and job.cancelled):
+                notify("Transcription failed", str(e))
+            self._notify_job_state("idle")
             return
 
         t_transcribed = time.perf_counter()
 
+        if job and job.cancelled:
+            logging.info(f"Job {job.id} was discarded, not injecting")
+            self._notify_job_state("idle")
+            return
+
         if text:
             logging.info(f"Transcribed: '{text}'")
-            self.injector.inject(text)
+            if not typed:
+                self.injector.inject(text)
             self._copy_to_clipboard(text)
             self.clipboard_history.appendleft(text)
             t_injected = time.perf_counter()
             logging.info(f"[TIMING] Full pipeline: {(t_injected-t_start)*1000:.0f}ms (transcribe: {(t_transcribed-t_start)*1000:.0f}ms, inject: {(t_injected-t_transcribed)*1000:.0f}ms)")
-            self._notify_state("done")
+            self._notify_job_state("done")
         else:
             logging.info("No text transcribed.")
-            self._notify_state("idle")
+            self._notify_job_state("idle")
 
     def run(self):
         # Keep main thread alive for hotkeys
@@ -161,7 +333,9 @@ class VoiceTyperApp:
         """Re-initialize components that depend on config values."""
         logging.info("Reloading after settings change...")
         # Re-init transcriber (backend / model / key may have changed)
+        self._close_transcriber()
         self.transcriber = self._init_transcriber()
+        self._start_warmup()
         # Re-init hotkey (key or mode may have changed)
         self.hotkey_manager.config = self.config
         self.hotkey_manager.setup_hotkey()
@@ -173,6 +347,28 @@ class VoiceTyperApp:
         logging.info("Cleaning up...")
         if self.hotkey_manager:
             self.hotkey_manager.cleanup()
+        self.jobs.shutdown()
+        self.recorder.close()
+        self._close_transcriber()
+        self.models.close_all()
+        logging.info(f"Model cache stats: {self.models.stats()}")
+
+    def _close_transcriber(self):
+        """Release resources held by the current transcriber (e.g. worker process)."""
+        local = getattr(self.transcriber, "backends", {}).get("local", self.transcriber)
+        if hasattr(local, "learned_rtf"):
+            # Keep the speeds the model router measured for the next session, except
+            # for models calibrated since it was built (their old speed no longer applies)
+            tuned = self.config.get("local_threads") or {}
+            learned = dict(self.config.get("router_rtf") or {})
+            learned.update({name: round(rtf, 4) for name, rtf in local.learned_rtf().items()
+                            if tuned.get(name) == self._router_tuned.get(name)})
+            self.config.set("router_rtf", learned)
+        if self.transcriber and hasattr(self.transcriber, "close"):
+            try:
+                self.transcriber.close()
+            except Exception as e:
+                logging.error(f"Failed to close transcriber: {e}")
 
     def _init_transcriber(self):
         """Initialize the appropriate transcriber based on config."""
@@ -180,45 +376,185 @@ class VoiceTyperApp:
         language = self.config.get("language", "en")
 
         if backend == "api":
-            api_key = self.config.get("openai_api_key", "")
-            if not api_key:
-                logging.error("API mode selected but no API key provided")
-                notify("Error", "API key required for cloud transcription")
-                return None
-            try:
-                from transcriber_api import TranscriberAPI
-                logging.info("Using OpenAI Whisper API backend (fast)")
-                return TranscriberAPI(api_key=api_key, language=language)
-            except Exception as e:
-                logging.error(f"Failed to init API transcriber: {e}")
-                notify("Error", f"API transcriber failed: {e}")
-                return None
-        else:
-            # Local whisper.cpp — use model_manager for path resolution
-            model_name = self.config.get("local_model", "small")
-
-            # Check if model is installed
-            if not model_manager.is_model_installed(model_name):
-                # Try to fall back to any installed model
-                installed = model_manager.get_installed_models()
-                if installed:
-                    model_name = installed[0]
-                    logging.warning(f"Configured model not installed, falling back to '{model_name}'")
-                    self.config.set("local_model", model_name)
-                else:
-                    logging.warning("No local models installed. Please download one from Settings > Transcription.")
-                    notify("No Model", "Download a model in Settings to use local mode")
-                    return None
+            return self._init_api_transcriber(language)
+        if backend == "hedged":
+            return self._init_hedged_transcriber(language)
+        return self._init_local_transcriber(language)
+
+    def _init_hedged_transcriber(self, language):
+        """Local and cloud backends racing under a latency budget; either alone if the other fails."""
+        local = self._init_local_transcriber(language)
+        cloud = self._init_api_transcriber(language)
+        if not local or not cloud:
+            logging.warning("Hybrid mode needs both backends, using the one that is available")
+            return local or cloud
+        from hedging import HedgedTranscriber, CircuitBreaker
+        primary = self.config.get("hedge_primary", "local")
+        budget_s = self.config.get("hedge_budget_s", 1.5)
+        logging.info(f"Using hybrid backend: {primary} first, other backend after {budget_s}s")
+        return HedgedTranscriber(
+            local, cloud, primary=primary, budget_s=budget_s,
+            breaker=CircuitBreaker(
+                failure_threshold=self.config.get("api_breaker_failures", 3),
+                cooldown_s=self.config.get("api_breaker_cooldown_s", 60.0),
+            ),
+        )
 
-            model_path = model_manager.get_model_path(model_name)
+    def _init_api_transcriber(self, language):
+        """Cloud backend (OpenAI Whisper API or a compatible server)."""
+        api_key = self.config.get("openai_api_key", "")
+        auth_scheme = self.config.get("api_auth_scheme", "bearer")
+        if not api_key and auth_scheme != "none":
+            logging.error("API mode selected but no API key provided")
+            notify("Error", "API key required for cloud transcription")
+            return None
+        try:
+            from transcriber_api import TranscriberAPI, DEFAULT_API_URL
+            url = self.config.get("api_url") or DEFAULT_API_URL
+            logging.info(f"Using transcription API backend at {url}")
+            return TranscriberAPI(api_key=api_key, language=language, url=url, auth_scheme=auth_scheme,
+                                  upload_format=self.config.get("api_upload_format", "flac"),
+                                  stream_upload=self.config.get("api_stream_upload", False),
+                                  stream_response=self.config.get("api_stream_response", False),
+                                  model=self.config.get("api_model", "whisper-1"),
+                                  chunk_s=self.config.get("api_chunk_s", 30.0),
+                                  max_parallel=self.config.get("api_max_parallel", 4),
+                                  chunk_retries=self.config.get("api_chunk_retries", 2))
+        except Exception as e:
+            logging.error(f"Failed to init API transcriber: {e}")
+            notify("Error", f"API transcriber failed: {e}")
+            return None
+
+    def _init_local_transcriber(self, language):
+        """Local whisper.cpp — use model_manager for path resolution."""
+        model_name = self.config.get("local_model", "small")
+
+        # Check if model is installed
+        if not model_manager.is_model_installed(model_name):
+            # Try to fall back to any installed model
+            installed = model_manager.get_installed_models()
+            if installed:
+                model_name = installed[0]
+                logging.warning(f"Configured model not installed, falling back to '{model_name}'")
+                self.config.set("local_model", model_name)
+            else:
+                logging.warning("No local models installed. Please download one from Settings > Transcription.")
+                notify("No Model", "Download a model in Settings to use local mode")
+                return None
 
+        if self.config.get("model_router", False):
+            router = self._init_model_router(language)
+            if router:
+                return router
+        elif self.config.get("escalation", False):
+            escalating = self._init_escalation(language)
+            if escalating:
+                return escalating
+        return self._make_local_engine(model_name, language)
+
+    def _init_escalation(self, language):
+        """Fast model for every utterance, accurate model only for low-confidence ones."""
+        fast_name = self.config.get("escalation_fast_model", "base")
+        accurate_name = self.config.get("escalation_model", "small")
+        missing = [name for name in (fast_name, accurate_name) if not model_manager.is_model_installed(name)]
+        if missing:
+            logging.warning(f"Escalation needs model(s) {', '.join(missing)}, using a single model")
+            return None
+        fast = self._make_local_engine(fast_name, language)
+        accurate = self._make_local_engine(accurate_name, language)
+        if not fast or not accurate:
+            for engine in (fast, accurate):
+                if engine:
+                    engine.close()
+            return None
+        from model_router import EscalatingTranscriber
+        threshold = self.config.get("escalation_threshold", 0.6)
+        logging.info(f"Using {fast_name} with escalation to {accurate_name} below confidence {threshold}")
+        return EscalatingTranscriber(fast, accurate, threshold=threshold,
+                                     fast_name=fast_name, accurate_name=accurate_name)
+
+    def _init_model_router(self, language):
+        """One local engine per installed model, chosen per utterance by a ModelRouter."""
+        wanted = self.config.get("router_models") or list(model_manager.MODELS)
+        installed = model_manager.get_installed_models()
+        names = model_manager.by_speed([name for name in installed if name in wanted])
+        if len(names) < 2:
+            logging.warning("Model router needs at least two installed models, using a single model")
+            return None
+        engines = []
+        for name in names:
+            engine = self._make_local_engine(name, language)
+            if engine:
+                engines.append((name, engine))
+        if len(engines) < 2:
+            for _, engine in engines:
+                engine.close()
+            return None
+        from model_router import ModelRouter
+        target_s = self.config.get("router_target_s", 1.5)
+        # Speeds learned in earlier sessions, else the ones measured by thread calibration
+        # (calibrating a model drops its learned speed, see settings_window)
+        tuned = self.config.get("local_threads") or {}
+        rtf = {name: values["rtf"] for name, values in tuned.items() if values.get("rtf")}
+        rtf.update(self.config.get("router_rtf") or {})
+        self._router_tuned = {name: tuned.get(name) for name in names}
+        logging.info(f"Using model router over {', '.join(names)} with a {target_s}s target")
+        return ModelRouter(engines, target_s=target_s, rtf=rtf,
+                           busy_threshold=self.config.get("thread_backoff_load", 0.75))
+
+    def _make_local_engine(self, model_name, language):
+        """A started local transcriber for one installed model, or None."""
+        model_path = model_manager.get_model_path(model_name)
+
+        engine = self.config.get("local_engine", "server")
+        # Fastest thread setup found by Settings > Calibrate Threads (whisper.cpp defaults otherwise)
+        tuned = (self.config.get("local_threads") or {}).get(model_name, {})
+        threads = tuned.get("threads", 0)
+        busy_threshold = self.config.get("thread_backoff_load", 0.75)
+
+        if engine == "library":
             try:
-                from transcriber import Transcriber
-                from utils import get_resource_path
-                whisper_exe = get_resource_path("external/whisper.exe")
-                logging.info(f"Using local whisper.cpp backend with '{model_name}' model at {model_path}, language={language}")
-                return Transcriber(model_path=model_path, whisper_path=whisper_exe, language=language)
+                from transcriber_lib import TranscriberLib
+                transcriber = TranscriberLib(model_path=model_path, language=language,
+                                             audio_ctx_table=self.config.get("audio_ctx_table"),
+                                             residency=self.models, threads=threads,
+                                             busy_threshold=busy_threshold)
+                logging.info(f"Using in-process libwhisper backend ({transcriber.lib_path}) with "
+                             f"'{model_name}' model at {model_path}, language={language}")
+                transcriber.start()
+                return transcriber
             except Exception as e:
-                logging.error(f"Failed to init local transcriber: {e}")
-                notify("Error", f"Local transcriber failed: {e}")
-                return None
+                logging.error(f"Failed to load libwhisper, falling back to whisper.cpp binaries: {e}")
+
+        try:
+            from transcriber import Transcriber
+            from utils import get_resource_path
+            whisper_exe = get_resource_path("external/whisper.exe")
+
+            # Persistent worker keeps the model loaded between dictations
+            server_path = None
+            if engine == "server":
+                server_exe = get_resource_path("external/whisper-server.exe")
+                if os.path.exists(server_exe):
+                    server_path = server_exe
+                else:
+                    logging.warning("whisper-server.exe not found, using one-shot whisper.exe")
+
+            logging.info(f"Using local whisper.cpp backend with '{model_name}' model at {model_path}, "
+                         f"language={language}, engine={'server' if server_path else 'cli'}")
+            use_pipe = self.config.get("audio_transport", "pipe") == "pipe"
+            transcriber = Transcriber(model_path=model_path, whisper_path=whisper_exe,
+                                      language=language, server_path=server_path,
+                                      use_pipe=use_pipe,
+                                      audio_ctx_table=self.config.get("audio_ctx_table"),
+                                      residency=self.models, threads=threads,
+                                      processors=tuned.get("processors", 1),
+                                      busy_threshold=busy_threshold,
+                                      segment_s=self.config.get("local_segment_s", 30.0),
+                                      max_parallel=self.config.get("local_max_parallel", 4))
+            transcriber.start()
+            return transcriber
+        except Exception as e:
+            logging.error(f"Failed to init local transcriber: {e}")
+            notify("Error", f"Local transcriber failed: {e}")
+            return None
@@ -1,42 +1,83 @@
 
 """
 Model manager for whisper.cpp GGML models.
-Handles checking installed status, downloading from Hugging Face, and deleting.
+Handles checking installed status, downloading from Hugging Face, and deleting,
+and keeps loaded models resident within a memory budget (ModelResidency).
 """
 
 import os
 import threading
 import logging
+import time
+import contextlib
+from collections import OrderedDict
+
 import requests
 
 from utils import get_resource_path, get_app_dir
 
-# ── Model definitions ──────────────────────────────────────────
+# ── Model catalog ──────────────────────────────────────────────
+# Quantized variants trade a little accuracy for a much smaller download and
+# less RAM. ram_mb is the expected resident memory while decoding (whisper.cpp
+# figures), speed the class from whisper.cpp CPU benchmarks (1 = fastest).
+HF_BASE_URL = "https://huggingface.co/ggerganov/whisper.cpp/resolve/main/"
+
+SPEED_CLASSES = {1: "Fastest", 2: "Fast", 3: "Moderate", 4: "Slow", 5: "Slowest"}
+
+
+def _model(label, file, size_mb, ram_mb, params, speed, desc, detail, quant=None):
+    return {
+        "label": label,
+        "file": file,
+        "size_mb": size_mb,
+        "ram_mb": ram_mb,
+        "params": params,
+        "quant": quant,  # None = full precision (f16)
+        "speed": speed,
+        "desc": desc,
+        "detail": detail,
+        "url": HF_BASE_URL + file,
+    }
+
+
 MODELS = {
-    "tiny": {
-        "file": "ggml-tiny.bin",
-        "size_mb": 75,
-        "desc": "Fastest, lower accuracy",
-        "detail": "Good for quick notes",
-        "url": "https://huggingface.co/ggerganov/whisper.cpp/resolve/main/ggml-tiny.bin",
-    },
-    "base": {
-        "file": "ggml-base.bin",
-        "size_mb": 142,
-        "desc": "Balanced speed & accuracy",
-        "detail": "Recommended for most use",
-        "url": "https://huggingface.co/ggerganov/whisper.cpp/resolve/main/ggml-base.bin",
-    },
-    "small": {
-        "file": "ggml-small.bin",
-        "size_mb": 466,
-        "desc": "Slowest, highest accuracy",
-        "detail": "Best for long speech",
-        "url": "https://huggingface.co/ggerganov/whisper.cpp/resolve/main/ggml-small.bin",
-    },
+    "tiny": _model("Tiny", "ggml-tiny.bin", 75, 273, "39 M", 1,
+                   "Fastest, lower accuracy", "Good for quick notes"),
+    "tiny-q5_1": _model("Tiny Q5_1", "ggml-tiny-q5_1.bin", 31, 229, "39 M", 1,
+                        "Tiny, 5-bit quantized", "Smallest download", quant="q5_1"),
+    "tiny-q8_0": _model("Tiny Q8_0", "ggml-tiny-q8_0.bin", 42, 240, "39 M", 1,
+                        "Tiny, 8-bit quantized", "Near full-precision accuracy", quant="q8_0"),
+    "base": _model("Base", "ggml-base.bin", 142, 388, "74 M", 2,
+                   "Balanced speed & accuracy", "Recommended for most use"),
+    "base-q5_1": _model("Base Q5_1", "ggml-base-q5_1.bin", 57, 303, "74 M", 2,
+                        "Base, 5-bit quantized", "Good for low-memory machines", quant="q5_1"),
+    "base-q8_0": _model("Base Q8_0", "ggml-base-q8_0.bin", 78, 324, "74 M", 2,
+                        "Base, 8-bit quantized", "Near full-precision accuracy", quant="q8_0"),
+    "small": _model("Small", "ggml-small.bin", 466, 852, "244 M", 3,
+                    "Slower, high accuracy", "Best for long speech"),
+    "small-q5_1": _model("Small Q5_1", "ggml-small-q5_1.bin", 181, 567, "244 M", 3,
+                         "Small, 5-bit quantized", "Small accuracy at a third of the size", quant="q5_1"),
+    "small-q8_0": _model("Small Q8_0", "ggml-small-q8_0.bin", 252, 638, "244 M", 3,
+                         "Small, 8-bit quantized", "Near full-precision accuracy", quant="q8_0"),
+    "medium-q5_0": _model("Medium Q5_0", "ggml-medium-q5_0.bin", 514, 1080, "769 M", 4,
+                          "Medium, 5-bit quantized", "Higher accuracy, needs a fast CPU", quant="q5_0"),
+    "medium-q8_0": _model("Medium Q8_0", "ggml-medium-q8_0.bin", 785, 1350, "769 M", 4,
+                          "Medium, 8-bit quantized", "Higher accuracy, needs a fast CPU", quant="q8_0"),
+    "large-v3-turbo-q5_0": _model("Large v3 Turbo Q5_0", "ggml-large-v3-turbo-q5_0.bin", 547, 1000, "809 M", 5,
+                                  "Large v3 Turbo, 5-bit quantized", "Best accuracy per MB", quant="q5_0"),
+    "large-v3-turbo-q8_0": _model("Large v3 Turbo Q8_0", "ggml-large-v3-turbo-q8_0.bin", 834, 1290, "809 M", 5,
+                                  "Large v3 Turbo, 8-bit quantized", "Best accuracy, needs a fast CPU",
+                                  quant="q8_0"),
+    "large-v3-turbo": _model("Large v3 Turbo", "ggml-large-v3-turbo.bin", 1624, 2080, "809 M", 5,
+                             "Slowest, highest accuracy", "Best with a GPU build of whisper.cpp"),
 }
 
 
+def by_speed(names):
+    """Model names ordered fastest first (speed class, then size)."""
+    return sorted(names, key=lambda name: (MODELS[name]["speed"], MODELS[name]["size_mb"]))
+
+
 def get_models_dir():
     """Return the path to the models directory, creating it if needed."""
     # In dev: VoiceTyper/external/models/
@@ -58,6 +99,15 @@ def get_model_path(model_name):
     return os.path.join(get_models_dir(), info["file"])
 
 
+def resolve_model_path(model):
+    """Path for a catalog name (e.g. "small-q5_1") or a model file path, returned as is."""
+    if model in MODELS:
+        path = get_model_path(model)
+        bundled = get_resource_path(os.path.join("external", "models", MODELS[model]["file"]))
+        return path if os.path.exists(path) or not os.path.exists(bundled) else bundled
+    return get_resource_path(model)
+
+
 def is_model_installed(model_name):
     """Check if a model file exists on disk."""
     path = get_model_path(model_name)
@@ -144,3 +194,204 @@ def download_model(model_name, progress_callback=None, done_callback=None):
     thread = threading.Thread(target=_download, daemon=True)
     thread.start()
     return thread
+
+
+# ── Resident models ────────────────────────────────────────────
+
+def model_size_mb(model_path):
+    """Approximate resident size of a loaded model: its file size."""
+    try:
+        return os.path.getsize(model_path) / (1024 * 1024)
+    except OSError:
+        return 0.0
+
+
+def preload_model_file(model_path, block_size=4 * 1024 * 1024):
+    """Read the model file once so it is in the OS page cache. Returns bytes read."""
+    total = 0
+    with open(model_path, "rb", buffering=0) as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                return total
+            total += len(block)
+
+
+class _Resident:
+    def __init__(self, engine, size_mb):
+        self.engine = engine
+        self.size_mb = size_mb
+        self.last_used = time.monotonic()
+        self.in_use = 0
+
+
+class ModelResidency:
+    """
+    Keeps loaded whisper engines (worker processes, library contexts)
+    resident between dictations, keyed by (model, language, threads).
+
+    Engines are evicted least recently used first when a load would exceed
+    `budget_mb`, and unloaded after `idle_evict_s` without use. Engines in
+    use are never evicted. prefetch() loads in the background, so a model
+    evicted while idle is usually warm again by the time it is needed.
+    Engines only need a close() method.
+    """
+
+    def __init__(self, budget_mb=1024, idle_evict_s=900, check_interval=30):
+        self.budget_mb = budget_mb
+        self.idle_evict_s = idle_evict_s
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.prefetches = 0
+        self._resident = OrderedDict()  # key -> _Resident, least recently used first
+        self._loading = {}  # key -> threading.Event set when the load ends
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._check_interval = check_interval
+        self._reaper = threading.Thread(target=self._reap_idle, daemon=True, name="model-residency")
+        self._reaper.start()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "prefetches": self.prefetches,
+                "resident": [key for key in self._resident],
+                "resident_mb": sum(r.size_mb for r in self._resident.values()),
+            }
+
+    def is_resident(self, key):
+        with self._lock:
+            return key in self._resident
+
+    @contextlib.contextmanager
+    def use(self, key, loader, size_mb):
+        """Borrow the engine for `key`, loading it with loader() on a miss."""
+        resident = self._acquire(key, loader, size_mb, count=True)
+        try:
+            yield resident.engine
+        finally:
+            with self._lock:
+                resident.in_use -= 1
+                resident.last_used = time.monotonic()
+
+    def prefetch(self, key, loader, size_mb):
+        """Start loading `key` in the background unless it is resident or loading."""
+        with self._lock:
+            if key in self._resident or key in self._loading:
+                return
+            self.prefetches += 1
+
+        def _load():
+            try:
+                resident = self._acquire(key, loader, size_mb, count=False)
+                with self._lock:
+                    resident.in_use -= 1
+            except Exception as e:
+                logging.error(f"Prefetching model {key} failed: {e}")
+
+        logging.info(f"Model cache: prefetching {key}")
+        threading.Thread(target=_load, daemon=True).start()
+
+    def _acquire(self, key, loader, size_mb, count):
+        while True:
+            with self._lock:
+                resident = self._resident.get(key)
+                if resident:
+                    self._resident.move_to_end(key)
+                    resident.in_use += 1
+                    if count:
+                        self.hits += 1
+                    return resident
+                event = self._loading.get(key)
+                if event is None:
+                    self._loading[key] = threading.Event()
+                    if count:
+                        self.misses += 1
+                        logging.info(f"Model cache miss: {key} ({self._counters()})")
+                    break
+            # Someone else (usually a prefetch) is loading it: wait and look again
+            event.wait()
+            if count:
+                with self._lock:
+                    if key not in self._resident:
+                        continue
+                    self.hits += 1
+                    resident = self._resident[key]
+                    self._resident.move_to_end(key)
+                    resident.in_use += 1
+                    return resident
+
+        try:
+            t0 = time.perf_counter()
+            engine = loader()
+            logging.info(f"[TIMING] Model cache load {key}: {(time.perf_counter()-t0)*1000:.0f}ms")
+        except Exception:
+            with self._lock:
+                self._loading.pop(key).set()
+            raise
+
+        with self._lock:
+            victims = self._make_room(size_mb)
+            resident = _Resident(engine, size_mb)
+            resident.in_use = 1
+            self._resident[key] = resident
+            self._loading.pop(key).set()
+        self._unload(victims, "over memory budget")
+        return resident
+
+    def _make_room(self, size_mb):
+        """Pick idle LRU engines to drop so `size_mb` more fits the budget. Call with the lock held."""
+        victims = []
+        total = sum(r.size_mb for r in self._resident.values())
+        for key in list(self._resident):
+            if total + size_mb <= self.budget_mb:
+                break
+            resident = self._resident[key]
+            if resident.in_use:
+                continue
+            victims.append((key, self._resident.pop(key)))
+            total -= resident.size_mb
+        if total + size_mb > self.budget_mb:
+            logging.warning(f"Model cache over budget: {total + size_mb:.0f} MB of {self.budget_mb} MB")
+        return victims
+
+    def _unload(self, victims, reason):
+        for key, resident in victims:
+            with self._lock:
+                self.evictions += 1
+            try:
+                resident.engine.close()
+            except Exception as e:
+                logging.error(f"Unloading model {key} failed: {e}")
+            logging.info(f"Model cache: evicted {key} ({reason}; {self._counters()})")
+
+    def _counters(self):
+        return f"hits {self.hits}, misses {self.misses}, evictions {self.evictions}"
+
+    def _reap_idle(self):
+        while not self._stop.wait(self._check_interval):
+            if not self.idle_evict_s:
+                continue
+            now = time.monotonic()
+            with self._lock:
+                victims = [(key, r) for key, r in self._resident.items()
+                           if not r.in_use and now - r.last_used > self.idle_evict_s]
+                for key, _ in victims:
+                    del self._resident[key]
+            self._unload(victims, f"idle for {self.idle_evict_s / 60:.0f} min")
+
+    def close_all(self):
+        """Unload every resident engine and stop the idle timer."""
+        self._stop.set()
+        with self._lock:
+            victims = list(self._resident.items())
+            self._resident.clear()
+        for key, resident in victims:
+            try:
+                resident.engine.close()
+            except Exception as e:
+                logging.error(f"Unloading model {key} failed: {e}")
@@ -0,0 +1,219 @@
+"""
+Per-utterance model choice for the local backend.
+ModelRouter picks the most accurate installed model that is expected to
+deliver text within a stop-to-text target, from the utterance length and a
+rolling real-time factor per model. EscalatingTranscriber decodes with a
+fast model and re-decodes with an accurate one only when confidence is low.
+"""
+
+import threading
+import logging
+import time
+
+from pcm import PcmBuffer
+from utils import cpu_load
+from model_manager import MODELS
+
+# Decode seconds per audio second before a model has been measured, by
+# catalog speed class (whisper.cpp on a mid-range 4-core CPU, reduced audio context)
+DEFAULT_RTF = {1: 0.05, 2: 0.1, 3: 0.3, 4: 0.8, 5: 1.2}
+MAX_LOAD_SLOWDOWN = 4.0
+EXPLORE_MARGIN = 1.5  # how far over the target an exploration pick may be estimated
+
+
+class ModelRouter:
+    """
+    Routes each utterance to one of several local transcribers.
+
+    `engines` is a list of (model name, transcriber), fastest first. The
+    estimate for a model is its rolling RTF times the utterance length
+    (at least one second, which covers the fixed per-call cost), scaled up
+    when CPU load is above `busy_threshold`. The slowest model whose
+    estimate meets `target_s` wins; if none does, the fastest is used.
+
+    RTFs are kept for an idle machine: each timing is divided by the load
+    factor it was taken under. So that a model once measured slow is not
+    ruled out for good, every `explore_every` picks the next more accurate
+    model is tried if its estimate is within EXPLORE_MARGIN of the target.
+    """
+
+    def __init__(self, engines, target_s=1.5, busy_threshold=0.75, smoothing=0.3, rtf=None,
+                 explore_every=20):
+        if not engines:
+            raise ValueError("ModelRouter needs at least one engine")
+        self.engines = list(engines)
+        self.target_s = target_s
+        self.busy_threshold = busy_threshold
+        self.smoothing = smoothing
+        # Starting point: measured RTFs (earlier sessions, calibration), else rough defaults
+        rtf = rtf or {}
+        self.rtf = {name: rtf.get(name) or DEFAULT_RTF[MODELS.get(name, {}).get("speed", 3)]
+                    for name, _ in self.engines}
+        self.picks = {name: 0 for name, _ in self.engines}
+        self.explore_every = explore_every
+        self._since_explore = 0
+        self._warm = set()  # models whose first (cold) decode has been skipped
+        self._measured = set()  # models with at least one timing this session
+        self._last = self.engines[-1][0]
+        self._lock = threading.Lock()
+
+    @property
+    def model_path(self):
+        """Model file of the most accurate engine (what warm-up pre-reads)."""
+        return getattr(self.engines[-1][1], "model_path", None)
+
+    def _engine(self, name):
+        return dict(self.engines)[name]
+
+    def start(self):
+        for _, engine in self.engines:
+            if hasattr(engine, "start"):
+                engine.start()
+
+    def prepare(self):
+        """Recording started: get the fastest and the last used model ready."""
+        for name in {self.engines[0][0], self._last}:
+            engine = self._engine(name)
+            if hasattr(engine, "prepare"):
+                engine.prepare()
+
+    def close(self):
+        for _, engine in self.engines:
+            if hasattr(engine, "close"):
+                engine.close()
+
+    def _load_factor(self, load):
+        if load is None or not self.busy_threshold or load <= self.busy_threshold:
+            return 1.0
+        excess = (min(load, 1.0) - self.busy_threshold) / max(1e-6, 1.0 - self.busy_threshold)
+        return 1.0 + excess * (MAX_LOAD_SLOWDOWN - 1.0)
+
+    def pick(self, duration):
+        """(model name, load factor) for an utterance of `duration` seconds. Logs the decision."""
+        load = cpu_load()
+        factor = self._load_factor(load)
+        with self._lock:
+            estimates = {name: self.rtf[name] * max(duration, 1.0) * factor for name, _ in self.engines}
+        names = [name for name, _ in self.engines]
+        chosen = names[0]
+        for name in reversed(names):
+            if estimates[name] <= self.target_s:
+                chosen = name
+                break
+
+        explore = ""
+        self._since_explore += 1
+        index = names.index(chosen)
+        if self.explore_every and self._since_explore >= self.explore_every and index + 1 < len(names):
+            candidate = names[index + 1]
+            if estimates[candidate] <= self.target_s * EXPLORE_MARGIN:
+                chosen, explore = candidate, ", exploring"
+                self._since_explore = 0
+
+        summary = ", ".join(f"{name} {est:.2f}s" for name, est in estimates.items())
+        load_text = f"{load:.0%}" if load is not None else "n/a"
+        logging.info(f"Router: {duration:.1f}s utterance -> {chosen} (target {self.target_s:.1f}s; "
+                     f"estimates {summary}; CPU load {load_text}{explore})")
+        return chosen, factor
+
+    def _observe(self, name, elapsed, duration, factor=1.0):
+        with self._lock:
+            if name not in self._warm:
+                # First decode pays for loading and one-time allocations
+                self._warm.add(name)
+                return
+            # Stored as the idle-machine speed; pick() applies the current load
+            sample = elapsed / max(duration, 1.0) / factor
+            self.rtf[name] += self.smoothing * (sample - self.rtf[name])
+            self._measured.add(name)
+
+    def learned_rtf(self):
+        """RTFs of the models timed this session (worth keeping for the next one)."""
+        with self._lock:
+            return {name: self.rtf[name] for name in self._measured}
+
+    def transcribe(self, audio_data, sample_rate=16000, timeout=60, cancel=None):
+        if len(audio_data) == 0:
+            return ""
+        pcm = PcmBuffer.wrap(audio_data, sample_rate)
+        name, factor = self.pick(pcm.duration)
+        self._last = name
+        self.picks[name] += 1
+
+        t0 = time.perf_counter()
+        text = self._engine(name).transcribe(pcm, timeout=timeout, cancel=cancel)
+        elapsed = time.perf_counter() - t0
+        if text:
+            # An empty result is usually an error or a cancel, not a real timing
+            self._observe(name, elapsed, pcm.duration, factor)
+        logging.info(f"[TIMING] Router: {name} took {elapsed*1000:.0f}ms "
+                     f"(RTF now {self.rtf[name]:.3f}; picks {self.picks})")
+        return text
+
+
+class EscalatingTranscriber:
+    """
+    Two-tier local decoding. Every utterance is decoded by `fast` first;
+    only when its geometric mean token probability is below `threshold` is the same
+    audio decoded again by `accurate`. Both engines need transcribe_scored().
+    """
+
+    def __init__(self, fast, accurate, threshold=0.6, fast_name="fast", accurate_name="accurate"):
+        self.fast = fast
+        self.accurate = accurate
+        self.threshold = threshold
+        self.fast_name = fast_name
+        self.accurate_name = accurate_name
+        self.decodes = 0
+        self.escalations = 0
+        self._unscored = 0
+
+    @property
+    def model_path(self):
+        """Model file of the accurate engine (what warm-up pre-reads)."""
+        return getattr(self.accurate, "model_path", None)
+
+    def _both(self, method):
+        for engine in (self.fast, self.accurate):
+            if hasattr(engine, method):
+                getattr(engine, method)()
+
+    def start(self):
+        self._both("start")
+
+    def prepare(self):
+        self._both("prepare")
+
+    def close(self):
+        self._both("close")
+
+    def transcribe(self, audio_data, sample_rate=16000, timeout=60, cancel=None):
+        if len(audio_data) == 0:
+            return ""
+        pcm = PcmBuffer.wrap(audio_data, sample_rate)
+
+        t0 = time.perf_counter()
+        text, confidence = self.fast.transcribe_scored(pcm, timeout=timeout, cancel=cancel)
+        elapsed = time.perf_counter() - t0
+        self.decodes += 1
+        if confidence is None:
+            self._unscored += 1
+            if self._unscored == 1:
+                logging.warning(f"{self.fast_name} gave no token probabilities, escalation is inactive")
+            return text
+        if not text or confidence >= self.threshold or (cancel and cancel.cancelled):
+            logging.info(f"[TIMING] Escalation: {self.fast_name} {elapsed*1000:.0f}ms, confidence "
+                         f"{confidence:.2f}, kept ({self._rate()})")
+            return text
+
+        self.escalations += 1
+        logging.info(f"Escalation: {self.fast_name} confidence {confidence:.2f} < {self.threshold:.2f}, "
+                     f"re-decoding with {self.accurate_name} ({self._rate()})")
+        t1 = time.perf_counter()
+        better = self.accurate.transcribe(pcm, timeout=max(1.0, timeout - elapsed), cancel=cancel)
+        logging.info(f"[TIMING] Escalation: {self.fast_name} {elapsed*1000:.0f}ms + "
+                     f"{self.accurate_name} {(time.perf_counter()-t1)*1000:.0f}ms")
+        return better or text
+
+    def _rate(self):
+        return f"escalated {self.escalations}/{self.decodes} = {self.escalations / max(1, self.decodes):.0%}"
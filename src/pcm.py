@@ -0,0 +1,104 @@
+"""
+PCM audio buffer shared by the recorder and all transcriber backends.
+Holds samples in their capture dtype and converts lazily, at most once.
+"""
+
+import struct
+import numpy as np
+
+SUPPORTED_DTYPES = ("float32", "int16")
+
+WAV_HEADER_SIZE = 44
+WAV_UNKNOWN_SIZE = 0xFFFFFFFF - 36  # data size for a stream whose length is not known yet
+
+
+def wav_header(data_size, sample_rate, channels):
+    """44-byte header of a 16-bit PCM WAV file with `data_size` payload bytes."""
+    block_align = channels * 2
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate,
+        sample_rate * block_align, block_align, 16,
+        b"data", data_size,
+    )
+
+
+class PcmBuffer:
+    """
+    Contiguous block of PCM samples (int16 or float32) with cached
+    conversions and a WAV encoder.
+    """
+
+    def __init__(self, samples, sample_rate=16000):
+        samples = np.asarray(samples)
+        if samples.dtype.name not in SUPPORTED_DTYPES:
+            samples = samples.astype(np.float32)
+        if samples.ndim == 1:
+            samples = samples.reshape(-1, 1)
+
+        self.samples = samples
+        self.sample_rate = sample_rate
+        self.channels = samples.shape[1]
+        self._float32 = None
+        self._int16 = None
+        self._wav = None
+
+    @classmethod
+    def wrap(cls, audio, sample_rate=16000):
+        """Return `audio` as a PcmBuffer, wrapping plain NumPy arrays."""
+        if isinstance(audio, cls):
+            return audio
+        return cls(audio, sample_rate)
+
+    def __len__(self):
+        return len(self.samples)
+
+    @property
+    def dtype(self):
+        return self.samples.dtype.name
+
+    @property
+    def duration(self):
+        """Length in seconds."""
+        return len(self.samples) / self.sample_rate
+
+    def slice(self, start, end=None):
+        """Sub-range of frames as a new PcmBuffer (a view, no copy)."""
+        return PcmBuffer(self.samples[start:end], self.sample_rate)
+
+    def as_float32(self):
+        """Samples as flat float32 in [-1, 1] (no copy when captured as float32)."""
+        if self._float32 is None:
+            flat = self.samples.reshape(-1)
+            if self.samples.dtype == np.float32:
+                self._float32 = flat
+            else:
+                self._float32 = flat.astype(np.float32) / 32768.0
+        return self._float32
+
+    def as_int16(self):
+        """Samples as flat int16, clipped so out-of-range floats saturate instead of wrapping."""
+        if self._int16 is None:
+            flat = self.samples.reshape(-1)
+            if self.samples.dtype == np.int16:
+                self._int16 = flat
+            else:
+                scaled = np.clip(flat, -1.0, 1.0)
+                scaled *= 32767
+                self._int16 = scaled.astype(np.int16)
+        return self._int16
+
+    def wav_bytes(self):
+        """16-bit PCM WAV file contents, header and payload in one buffer."""
+        if self._wav is None:
+            pcm = self.as_int16()
+            wav = bytearray(WAV_HEADER_SIZE + pcm.nbytes)
+            wav[:WAV_HEADER_SIZE] = wav_header(pcm.nbytes, self.sample_rate, self.channels)
+            wav[WAV_HEADER_SIZE:] = memoryview(pcm).cast("B")
+            self._wav = wav
+        return self._wav
+
+    def write_wav(self, filename):
+        with open(filename, "wb") as f:
+            f.write(self.wav_bytes())
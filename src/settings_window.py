@@ -6,6 +6,7 @@ import keyboard
 
 from config import ConfigManager
 import model_manager
+import calibration
 import updater
 
 
@@ -58,18 +59,19 @@ LANGUAGE_MAP = {
 
 LANGUAGE_REVERSE = {v: k for k, v in LANGUAGE_MAP.items()}
 
-MODEL_OPTIONS = ["tiny", "base", "small"]
-MODEL_DESCRIPTIONS = {
-    "tiny":  "~75 MB \u2022 Fastest, lower accuracy \u2022 Good for quick notes",
-    "base":  "~142 MB \u2022 Balanced speed & accuracy \u2022 Recommended",
-    "small": "~466 MB \u2022 Slowest, highest accuracy \u2022 Best for long speech",
-}
-
 OVERLAY_POSITIONS = ["Top Center", "Top Right", "Top Left",
                      "Bottom Right", "Bottom Left"]
 
 MAX_SAVED_KEYS = 5
 
+# Settings label -> api_auth_scheme
+AUTH_OPTIONS = {
+    "Bearer token": "bearer",
+    "api-key header": "api-key",
+    "No auth (LAN)": "none",
+}
+AUTH_REVERSE = {v: k for k, v in AUTH_OPTIONS.items()}
+
 
 class SettingsWindow:
     """Modern dark-themed settings window for VoiceTyper."""
@@ -159,12 +161,13 @@ class SettingsWindow:
         bottom.pack_propagate(False)
 
         # Save — full width, prominent
-        ctk.CTkButton(
+        self.save_btn = ctk.CTkButton(
             bottom, text="Save Changes", height=44,
             fg_color=CYAN, hover_color=CYAN_HOVER,
             text_color=BG_BLACK, font=FONT_BUTTON,
             corner_radius=10, command=self._on_save
-        ).pack(fill="x", side="top")
+        )
+        self.save_btn.pack(fill="x", side="top")
 
         # Cancel — subtle text-style button
         cancel_btn = ctk.CTkButton(
@@ -377,6 +380,21 @@ class SettingsWindow:
             font=("Segoe UI Variable", 10), text_color=TEXT_SECONDARY
         ).pack(anchor="w", padx=(24, 0))
 
+        # Hybrid option
+        hedged_col = ctk.CTkFrame(backend_row, fg_color="transparent")
+        hedged_col.pack(side="left", expand=True, fill="x", padx=(6, 0))
+
+        ctk.CTkRadioButton(
+            hedged_col, text="Hybrid", variable=self.backend_var, value="hedged",
+            font=FONT_VALUE, text_color=LIGHT_GREY,
+            fg_color=PURPLE, hover_color=PURPLE, border_color=NARDO_GREY
+        ).pack(anchor="w")
+
+        ctk.CTkLabel(
+            hedged_col, text="Local, cloud takes over if slow",
+            font=("Segoe UI Variable", 10), text_color=TEXT_SECONDARY
+        ).pack(anchor="w", padx=(24, 0))
+
         # ── Local sub-panel — Model Manager ───────────────────
         self.local_frame = ctk.CTkFrame(card, fg_color=PANEL_DARK,
                                          corner_radius=8, border_width=1,
@@ -405,7 +423,7 @@ class SettingsWindow:
         self._model_widgets = {}
         self._downloading = set()
 
-        for name in MODEL_OPTIONS:
+        for name in model_manager.MODELS:
             self._build_model_row(name)
 
         # No model warning label (hidden by default)
@@ -415,6 +433,44 @@ class SettingsWindow:
         )
         # Will be shown/hidden by _refresh_model_rows
 
+        # Thread-count calibration for the selected model
+        calib_row = ctk.CTkFrame(local_inner, fg_color="transparent")
+        calib_row.pack(fill="x", pady=(8, 0))
+
+        self.calib_btn = ctk.CTkButton(
+            calib_row, text="Calibrate Threads", height=32,
+            fg_color=PANEL_DARK, hover_color=BORDER_GLOW,
+            border_width=1, border_color=BORDER_DARK,
+            text_color=LIGHT_GREY, font=FONT_SMALL,
+            corner_radius=8, command=self._on_calibrate
+        )
+        self.calib_btn.pack(side="left")
+
+        self.calib_status = ctk.CTkLabel(
+            calib_row, text="", font=FONT_SMALL, text_color=TEXT_SECONDARY
+        )
+        self.calib_status.pack(side="left", padx=(10, 0))
+
+        # Benchmark of every installed model (results cached per machine)
+        bench_row = ctk.CTkFrame(local_inner, fg_color="transparent")
+        bench_row.pack(fill="x", pady=(8, 0))
+
+        self.bench_btn = ctk.CTkButton(
+            bench_row, text="Benchmark this machine", height=32,
+            fg_color=PANEL_DARK, hover_color=BORDER_GLOW,
+            border_width=1, border_color=BORDER_DARK,
+            text_color=LIGHT_GREY, font=FONT_SMALL,
+            corner_radius=8, command=self._on_benchmark
+        )
+        self.bench_btn.pack(side="left")
+
+        self.bench_status = ctk.CTkLabel(
+            bench_row, text="", font=FONT_SMALL, text_color=TEXT_SECONDARY,
+            wraplength=240, justify="left"
+        )
+        self.bench_status.pack(side="left", padx=(10, 0))
+        self._show_recommendation()
+
         # ── API sub-panel ──────────────────────────────────────
         self.api_frame = ctk.CTkFrame(card, fg_color=PANEL_DARK,
                                        corner_radius=8, border_width=1,
@@ -460,6 +516,62 @@ class SettingsWindow:
         )
         self.eye_btn.pack(side="left")
 
+        # Endpoint — OpenAI or any compatible server (e.g. one on the LAN)
+        from transcriber_api import DEFAULT_API_URL
+
+        ctk.CTkLabel(
+            api_inner, text="Endpoint", font=FONT_LABEL,
+            text_color=NARDO_GREY
+        ).pack(anchor="w", pady=(12, 6))
+
+        self.api_url_var = ctk.StringVar(value="")
+        ctk.CTkEntry(
+            api_inner, textvariable=self.api_url_var,
+            height=36, corner_radius=8, fg_color=BORDER_DARK,
+            border_color=NARDO_GREY, text_color=LIGHT_GREY,
+            font=FONT_VALUE, placeholder_text=DEFAULT_API_URL
+        ).pack(fill="x")
+
+        endpoint_row = ctk.CTkFrame(api_inner, fg_color="transparent")
+        endpoint_row.pack(fill="x", pady=(8, 0))
+
+        self.api_model_var = ctk.StringVar(value="whisper-1")
+        ctk.CTkEntry(
+            endpoint_row, textvariable=self.api_model_var,
+            height=36, corner_radius=8, fg_color=BORDER_DARK,
+            border_color=NARDO_GREY, text_color=LIGHT_GREY,
+            font=FONT_VALUE, placeholder_text="Model"
+        ).pack(side="left", fill="x", expand=True, padx=(0, 8))
+
+        self.auth_var = ctk.StringVar(value=AUTH_REVERSE["bearer"])
+        ctk.CTkOptionMenu(
+            endpoint_row, variable=self.auth_var,
+            values=list(AUTH_OPTIONS),
+            width=160, height=36, corner_radius=8,
+            fg_color=BORDER_DARK, button_color=NARDO_GREY,
+            button_hover_color=CYAN, dropdown_fg_color=PANEL_DARK,
+            dropdown_hover_color=BORDER_GLOW, dropdown_text_color=LIGHT_GREY,
+            text_color=LIGHT_GREY, font=FONT_VALUE
+        ).pack(side="left")
+
+        probe_row = ctk.CTkFrame(api_inner, fg_color="transparent")
+        probe_row.pack(fill="x", pady=(8, 0))
+
+        self.probe_btn = ctk.CTkButton(
+            probe_row, text="Test Connection", height=32,
+            fg_color=PANEL_DARK, hover_color=BORDER_GLOW,
+            border_width=1, border_color=BORDER_DARK,
+            text_color=LIGHT_GREY, font=FONT_SMALL,
+            corner_radius=8, command=self._on_probe_endpoint
+        )
+        self.probe_btn.pack(side="left")
+
+        self.probe_status = ctk.CTkLabel(
+            probe_row, text="", font=FONT_SMALL, text_color=TEXT_SECONDARY
+        )
+        self.probe_status.pack(side="left", padx=(10, 0))
+        self._probe_results = {}  # (url, auth scheme, key) -> probe_endpoint() result
+
     # ──────────────────────────────────────────────────────────
     #   MODEL MANAGER ROWS
     # ──────────────────────────────────────────────────────────
@@ -482,7 +594,10 @@ class SettingsWindow:
         top.pack(fill="x")
 
         # Radio select with model name — only enabled if installed
-        radio_text = f"{name.capitalize()}  ~{info['size_mb']} MB"
+        radio_text = f"{info['label']}  ~{info['size_mb']} MB"
+        bench = self._bench_results().get(name) if installed else None
+        if installed and name == self._recommended_model():
+            radio_text += "  \u2605 Recommended"
         radio = ctk.CTkRadioButton(
             top, text=radio_text, variable=self.model_var, value=name,
             font=("Segoe UI Variable", 12, "bold"),
@@ -517,7 +632,12 @@ class SettingsWindow:
         bottom = ctk.CTkFrame(inner, fg_color="transparent")
         bottom.pack(fill="x", padx=(28, 0), pady=(2, 0))
 
-        desc_text = info['desc']
+        speed = model_manager.SPEED_CLASSES[info["speed"]]
+        desc_text = f"{info['desc']}  •  {speed}  •  {info['params']} params, ~{info['ram_mb']} MB RAM"
+        if bench:
+            load = f"load {bench['load_s']:.1f}s, " if bench.get("load_s") is not None else ""
+            peak = f", {bench['peak_rss_mb']} MB peak" if bench.get("peak_rss_mb") else ""
+            desc_text += f"\nMeasured: {load}RTF {bench['rtf']:.2f}{peak}"
         if installed:
             desc_text += "  •  Installed"
             desc_color = GREEN_OK
@@ -528,7 +648,8 @@ class SettingsWindow:
         desc_label = ctk.CTkLabel(
             bottom, text=desc_text,
             font=("Segoe UI Variable", 10),
-            text_color=desc_color
+            text_color=desc_color,
+            wraplength=380, justify="left"
         )
         desc_label.pack(anchor="w")
 
@@ -564,7 +685,7 @@ class SettingsWindow:
         self._model_widgets.clear()
 
         # Rebuild
-        for name in MODEL_OPTIONS:
+        for name in model_manager.MODELS:
             self._build_model_row(name)
 
         # If currently selected model is not installed, deselect
@@ -664,6 +785,127 @@ class SettingsWindow:
         logging.info(f"Model '{name}' deleted.")
         self._refresh_model_rows()
 
+    def _on_calibrate(self):
+        """Time the selected model at several thread counts in the background."""
+        name = self.model_var.get()
+        if not name or not model_manager.is_model_installed(name):
+            self.calib_status.configure(text="Select an installed model first", text_color=RED_ACCENT)
+            return
+
+        self.calib_btn.configure(state="disabled")
+        self.calib_status.configure(text=f"Calibrating '{name}'...", text_color=TEXT_SECONDARY)
+
+        def on_progress(model_name, finished, total):
+            text = f"Calibrating '{model_name}'... {finished}/{total}"
+            try:
+                self.window.after(0, lambda: self.calib_status.configure(text=text))
+            except Exception:
+                pass
+
+        def on_done(model_name, best, error_msg):
+            try:
+                self.window.after(0, lambda: self._on_calibrate_done(model_name, best, error_msg))
+            except Exception:
+                pass
+
+        calibration.calibrate(name, model_manager.get_model_path(name),
+                              engine=self.config.get("local_engine", "server"),
+                              language=self.config.get("language", "en"),
+                              progress_callback=on_progress, done_callback=on_done)
+
+    def _on_calibrate_done(self, name, best, error_msg):
+        """Store the fastest configuration (main thread); it takes effect on Save."""
+        if not self.window or not self.window.winfo_exists():
+            return
+        self.calib_btn.configure(state="normal")
+        if not best:
+            self.calib_status.configure(text=f"Calibration failed: {error_msg[:50]}", text_color=RED_ACCENT)
+            return
+        tuned = dict(self.config.get("local_threads") or {})
+        tuned[name] = {"threads": best["threads"], "processors": best["processors"],
+                       "rtf": round(best["seconds"] / calibration.CLIP_SECONDS, 4)}
+        self.config.set("local_threads", tuned)
+        # The fresh measurement replaces the speed the model router learned under the old setup
+        learned = dict(self.config.get("router_rtf") or {})
+        if learned.pop(name, None) is not None:
+            self.config.set("router_rtf", learned)
+        procs = f" x {best['processors']} processors" if best["processors"] > 1 else ""
+        self.calib_status.configure(
+            text=f"'{name}': {best['threads']} threads{procs}, {best['seconds']:.1f}s per clip. Applied on Save",
+            text_color=GREEN_OK
+        )
+
+    def _bench_results(self):
+        """Cached benchmark results for this machine and the configured engine."""
+        machines = self.config.get("model_benchmarks") or {}
+        engine = self.config.get("local_engine", "server")
+        return machines.get(calibration.machine_id(), {}).get(engine, {})
+
+    def _recommended_model(self):
+        installed = set(model_manager.get_installed_models())
+        results = {name: r for name, r in self._bench_results().items() if name in installed}
+        return calibration.recommend(results, self.config.get("benchmark_target_s", 1.5))
+
+    def _show_recommendation(self):
+        name = self._recommended_model()
+        if not name:
+            self.bench_status.configure(text="Measures speed and memory of your installed models",
+                                        text_color=TEXT_SECONDARY)
+            return
+        result = self._bench_results()[name]
+        self.bench_status.configure(
+            text=f"Recommended: {model_manager.MODELS[name]['label']} "
+                 f"({result['decode_s']:.1f}s per {calibration.CLIP_SECONDS}s clip)",
+            text_color=GREEN_OK
+        )
+
+    def _on_benchmark(self):
+        """Benchmark installed models not measured on this machine yet (all of them if none are new)."""
+        installed = model_manager.get_installed_models()
+        if not installed:
+            self.bench_status.configure(text="Download a model first", text_color=RED_ACCENT)
+            return
+        cached = self._bench_results()
+        todo = [name for name in installed if name not in cached] or installed
+
+        self.bench_btn.configure(state="disabled")
+        self.bench_status.configure(text=f"Benchmarking 0/{len(todo)}...", text_color=TEXT_SECONDARY)
+
+        def on_progress(model_name, finished, total):
+            text = f"Benchmarking {finished}/{total} ({model_name} done)..."
+            try:
+                self.window.after(0, lambda: self.bench_status.configure(text=text))
+            except Exception:
+                pass
+
+        def on_done(results, error_msg):
+            try:
+                self.window.after(0, lambda: self._on_benchmark_done(results, error_msg))
+            except Exception:
+                pass
+
+        calibration.benchmark_models(todo, engine=self.config.get("local_engine", "server"),
+                                     language=self.config.get("language", "en"),
+                                     tuned=self.config.get("local_threads"),
+                                     progress_callback=on_progress, done_callback=on_done)
+
+    def _on_benchmark_done(self, results, error_msg):
+        """Cache the results for this machine and show the recommendation (main thread)."""
+        if not self.window or not self.window.winfo_exists():
+            return
+        self.bench_btn.configure(state="normal")
+        machines = dict(self.config.get("model_benchmarks") or {})
+        machine = dict(machines.get(calibration.machine_id(), {}))
+        engine = self.config.get("local_engine", "server")
+        machine[engine] = {**machine.get(engine, {}), **results}
+        machines[calibration.machine_id()] = machine
+        self.config.set("model_benchmarks", machines)
+
+        self._refresh_model_rows()
+        self._show_recommendation()
+        if error_msg:
+            self.bench_status.configure(text=f"Benchmark failed for {error_msg[:60]}", text_color=RED_ACCENT)
+
     def _build_language_card(self, parent):
         card = self._make_card(parent, "Language", CYAN)
 
@@ -841,6 +1083,9 @@ class SettingsWindow:
         self.mode_var.set(self.config.get("recording_mode", "hold"))
         self.backend_var.set(self.config.get("transcription_backend", "local"))
         self.api_key_var.set(self.config.get("openai_api_key", ""))
+        self.api_url_var.set(self.config.get("api_url", ""))
+        self.api_model_var.set(self.config.get("api_model", "whisper-1"))
+        self.auth_var.set(AUTH_REVERSE.get(self.config.get("api_auth_scheme", "bearer"), AUTH_REVERSE["bearer"]))
         self.autostart_var.set(self.config.get("auto_start", False))
         self.overlay_var.set(self.config.get("overlay_position", "Top Center"))
 
@@ -862,6 +1107,19 @@ class SettingsWindow:
         self._refresh_model_rows()
 
     def _on_save(self):
+        # A changed endpoint is probed first, so its round-trip time is shown before saving
+        if self.backend_var.get() in ("api", "hedged"):
+            endpoint = self._endpoint_settings()
+            saved = (self.config.get("api_url", ""), self.config.get("api_auth_scheme", "bearer"),
+                     self.config.get("openai_api_key", ""))
+            if endpoint != saved and endpoint not in self._probe_results:
+                self._run_probe(endpoint, then_save=True)
+                return
+        self._save_settings()
+
+    def _save_settings(self):
+        if not (self.window and self.window.winfo_exists()):
+            return
         # Save current API key to history
         current_key = self.api_key_var.get().strip()
         if current_key and current_key.startswith("sk-"):
@@ -883,6 +1141,9 @@ class SettingsWindow:
         if selected_model and model_manager.is_model_installed(selected_model):
             self.config.set("local_model", selected_model)
         self.config.set("openai_api_key", current_key)
+        self.config.set("api_url", self.api_url_var.get().strip())
+        self.config.set("api_model", self.api_model_var.get().strip() or "whisper-1")
+        self.config.set("api_auth_scheme", AUTH_OPTIONS.get(self.auth_var.get(), "bearer"))
         self.config.set("language", LANGUAGE_MAP.get(self.lang_var.get(), "de"))
         self.config.set("auto_start", self.autostart_var.get())
         self.config.set("overlay_position", self.overlay_var.get())
@@ -921,6 +1182,12 @@ class SettingsWindow:
             self.local_frame.pack_forget()
             self.api_frame.pack(fill="x", pady=(0, 0),
                                 in_=self.api_frame.master)
+        elif self.backend_var.get() == "hedged":
+            self.api_frame.pack_forget()
+            self.local_frame.pack(fill="x", pady=(0, 8),
+                                  in_=self.local_frame.master)
+            self.api_frame.pack(fill="x", pady=(0, 0),
+                                in_=self.api_frame.master)
         else:
             self.api_frame.pack_forget()
             self.local_frame.pack(fill="x", pady=(0, 0),
@@ -930,6 +1197,43 @@ class SettingsWindow:
         """Model selection changed — nothing extra needed now (rows self-manage)."""
         pass
 
+    def _endpoint_settings(self):
+        return (self.api_url_var.get().strip(), AUTH_OPTIONS.get(self.auth_var.get(), "bearer"),
+                self.api_key_var.get().strip())
+
+    def _on_probe_endpoint(self):
+        self._run_probe(self._endpoint_settings())
+
+    def _run_probe(self, endpoint, then_save=False):
+        from transcriber_api import probe_endpoint, DEFAULT_API_URL
+        url, auth_scheme, api_key = endpoint
+        url = url or DEFAULT_API_URL
+        self.probe_btn.configure(state="disabled", text="Testing...")
+        self.save_btn.configure(state="disabled")
+        self.probe_status.configure(text="Contacting endpoint...", text_color=TEXT_SECONDARY)
+
+        def _probe():
+            result = probe_endpoint(url, api_key, auth_scheme)
+            if self.window and self.window.winfo_exists():
+                self.window.after(0, self._on_probe_result, endpoint, result, then_save)
+
+        threading.Thread(target=_probe, daemon=True).start()
+
+    def _on_probe_result(self, endpoint, result, then_save):
+        self._probe_results[endpoint] = result
+        self.probe_btn.configure(state="normal", text="Test Connection")
+        self.save_btn.configure(state="normal")
+        self.probe_status.configure(
+            text=result["message"],
+            text_color=GREEN_OK if result["ok"] else RED_ACCENT
+        )
+        if then_save:
+            if result["ok"]:
+                # Leave the round-trip time on screen for a moment before closing
+                self.window.after(1200, self._save_settings)
+            else:
+                self.probe_status.configure(text=result["message"] + " \u2014 Save again to keep it")
+
     def _toggle_key_visibility(self):
         self._key_visible = not self._key_visible
         if self._key_visible:
@@ -0,0 +1,145 @@
+"""
+Streaming transcription while the hotkey is still held.
+Completed chunks (cut at natural pauses) are decoded in the background, so
+only the final chunk is left to transcribe when recording stops.
+"""
+
+import threading
+import logging
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import vad
+from pcm import PcmBuffer
+from cancellation import CancelToken
+from job_queue import scaled_timeout
+
+
+class StreamingSession:
+    """
+    Cuts an in-progress recording at pauses and transcribes chunks in order.
+
+    Chunk decodes run on the TranscriptionQueue's worker (`jobs`), in line
+    with queued jobs, so they never compete with another recording's decode.
+    `chunk_timeout(seconds)` gives the decode timeout for a chunk.
+    """
+
+    def __init__(self, recorder, transcriber, jobs, min_chunk_s=4.0, max_chunk_s=20.0,
+                 pause_ms=400, poll_interval=0.25, threshold_db=-48.0, chunk_timeout=scaled_timeout):
+        self.recorder = recorder
+        self.capture = recorder.buffer  # this recording's buffer, even once the next one starts
+        self.transcriber = transcriber
+        self.jobs = jobs
+        self.chunk_timeout = chunk_timeout
+        self.min_chunk_s = min_chunk_s
+        self.max_chunk_s = max_chunk_s
+        self.pause_ms = pause_ms
+        self.poll_interval = poll_interval
+        self.threshold_db = threshold_db
+
+        self._cut = 0  # first frame not yet handed to the transcriber
+        self._results = []  # futures, in recording order
+        self._stop = threading.Event()
+        self._thread = None
+        self._cancel = CancelToken()  # aborts this session's chunk decodes
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self._maybe_cut()
+            except Exception as e:
+                logging.error(f"Streaming chunker error: {e}")
+
+    def _find_cut(self, pending):
+        """Frame offset (within `pending`) to cut at, or None to keep waiting."""
+        sr = pending.sample_rate
+        if pending.duration < self.min_chunk_s:
+            return None
+
+        pauses = vad.find_pauses(pending, min_pause_ms=self.pause_ms, threshold_db=self.threshold_db)
+        min_frames = int(self.min_chunk_s * sr)
+        # Ignore a pause that runs to the end: the speaker may just be breathing.
+        # Pauses end on VAD frame boundaries, so "the end" is the last full frame.
+        frame = int(sr * vad.FRAME_MS / 1000)
+        last_frame_end = len(pending) // frame * frame
+        candidates = [(a, b) for a, b in pauses if a >= min_frames and b < last_frame_end]
+        if candidates:
+            a, b = candidates[-1]
+            return (a + b) // 2
+
+        if pending.duration >= self.max_chunk_s:
+            # No pause found: cut at the quietest frame of the last second
+            return vad.quietest_point(pending, len(pending) - sr, len(pending))
+        return None
+
+    def _maybe_cut(self):
+        pending = PcmBuffer(self.capture.view(self._cut), self.recorder.sample_rate)
+        cut = self._find_cut(pending)
+        if cut is None:
+            return
+        chunk = pending.slice(0, cut)
+        logging.info(f"Streaming: chunk {len(self._results) + 1} "
+                     f"({chunk.duration:.1f}s) queued while recording")
+        self._submit(chunk)
+        self._cut += cut
+
+    def _submit(self, chunk):
+        self._results.append(self.jobs.run_task(self._transcribe_chunk, chunk,
+                                                self.chunk_timeout(chunk.duration)))
+
+    def _transcribe_chunk(self, chunk, timeout):
+        trimmed = vad.trim_silence(chunk, threshold_db=self.threshold_db)
+        if trimmed is None:
+            return ""
+        return self.transcriber.transcribe(trimmed, timeout=timeout, cancel=self._cancel)
+
+    def stop(self):
+        """Stop cutting new chunks (recording has ended)."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def finish(self, audio_data, timeout=60):
+        """
+        Stop chunking, transcribe whatever follows the last cut and return
+        all chunk texts joined in order. Runs on the queue worker, after the
+        chunk decodes queued before it; `timeout` bounds the whole call.
+        """
+        self.stop()
+
+        t0 = time.perf_counter()
+        deadline = t0 + timeout
+        parts = []
+        for future in self._results:
+            try:
+                text = future.result(timeout=max(0.0, deadline - time.perf_counter()))
+            except FutureTimeout:
+                logging.error("Streaming chunk did not finish in time")
+                self.cancel()
+                return ""
+            except Exception as e:
+                logging.error(f"Streaming chunk failed: {e}")
+                text = ""
+            if text:
+                parts.append(text.strip())
+
+        tail = audio_data.slice(self._cut)
+        if len(tail):
+            text = self._transcribe_chunk(tail, max(1.0, deadline - time.perf_counter()))
+            if text:
+                parts.append(text.strip())
+
+        logging.info(f"[TIMING] Streaming final chunk ({tail.duration:.1f}s): "
+                     f"{(time.perf_counter()-t0)*1000:.0f}ms, {len(self._results) + bool(len(tail))} chunks total")
+        return " ".join(parts)
+
+    def cancel(self):
+        """Abandon the session: drop queued chunks and abort the one decoding."""
+        self._stop.set()
+        for future in self._results:
+            future.cancel()
+        self._cancel.cancel()
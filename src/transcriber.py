@@ -1,76 +1,477 @@
 import subprocess
+import threading
+import time
 import os
 import tempfile
-import numpy as np
-import wave
-from utils import get_resource_path
+import logging
+import contextlib
+import json
+import math
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import vad
+from pcm import PcmBuffer
+from utils import get_resource_path, hidden_subprocess_kwargs, cpu_load
+from model_manager import model_size_mb, resolve_model_path
+
+# whisper's encoder sees 50 frames per second of audio (1500 = full 30 s window).
+# (max utterance seconds, audio context) pairs; longer audio uses the full window.
+# Off by default: the bundled whisper.exe has no -ac option, and the candidate
+# table below is uncalibrated (each context is the frames of the row's longest
+# utterance rounded up to a multiple of 256; no accuracy or latency measurements
+# exist for it). Measure it with `python src/benchmark.py audio-ctx` on a whisper.cpp
+# build that has -ac before enabling it via config "audio_ctx_table".
+DEFAULT_AUDIO_CTX_TABLE = []
+CANDIDATE_AUDIO_CTX_TABLE = [
+    (4, 256),
+    (8, 512),
+    (12, 768),
+    (18, 1024),
+]
+
+
+class TranscriptionCancelled(Exception):
+    """A one-shot decode was killed through its CancelToken."""
+
+
+def audio_ctx_for(duration, table=None):
+    """Reduced audio context for an utterance of `duration` seconds (0 = full window)."""
+    if table is None:
+        table = DEFAULT_AUDIO_CTX_TABLE
+    for max_seconds, ctx in sorted(table):
+        if duration <= max_seconds:
+            # Never let the context cut off audio, whatever the table says
+            return max(int(ctx), int(duration * 50) + 64)
+    return 0
+
+
+def _pipe_rejected(stderr):
+    """Whether whisper.exe's error output says it could not read audio from stdin (`-f -`)."""
+    return "'-'" in stderr or "stdin" in stderr.lower()
+
+
+def _is_special_token(text):
+    return text.startswith("[_") or text.startswith("<|")
+
+
+def token_confidence(probs):
+    """
+    Confidence of a decode: the geometric mean of its token probabilities
+    (exp of the mean log-probability). whisper-server only reports the
+    latter, so every engine uses this measure and one escalation threshold
+    fits all of them. None without tokens.
+    """
+    probs = list(probs)
+    if not probs:
+        return None
+    return math.exp(sum(math.log(max(p, 1e-10)) for p in probs) / len(probs))
+
+
+def confidence_from_cli_json(data):
+    """Token confidence from whisper.cpp's -ojf output (None if it has no tokens)."""
+    return token_confidence(
+        token["p"]
+        for segment in data.get("transcription", [])
+        for token in segment.get("tokens", [])
+        if "p" in token and not _is_special_token(token.get("text", ""))
+    )
+
+
+def parse_verbose_json(reply):
+    """
+    (text, confidence) from a whisper-server verbose_json reply. Per-token
+    probabilities are used when the server includes them; otherwise the
+    segments' mean log-probabilities, weighted by token count, give the
+    same geometric mean.
+    """
+    try:
+        data = json.loads(reply)
+    except ValueError:
+        return reply.strip(), None  # server too old for verbose_json
+    segments = data.get("segments", [])
+    text = data.get("text", "").strip()
+
+    probs = [
+        token["p"]
+        for segment in segments
+        for token in segment.get("tokens", [])
+        if isinstance(token, dict) and "p" in token and not _is_special_token(token.get("text", ""))
+    ]
+    if probs:
+        return text, token_confidence(probs)
+
+    total, count = 0.0, 0
+    for segment in segments:
+        if "avg_logprob" in segment:
+            n = max(1, len(segment.get("tokens", [])))
+            total += segment["avg_logprob"] * n
+            count += n
+    return text, (math.exp(total / count) if count else None)
+
+
+def threads_for_load(threads, busy_threshold=0.75):
+    """
+    Thread count for a decode starting now (0 = whisper.cpp default). When
+    the machine is busier than `busy_threshold`, back off to the cores the
+    other work leaves idle instead of competing with it.
+    """
+    load = cpu_load() if busy_threshold else None
+    if load is None or load < busy_threshold:
+        return threads
+    cores = os.cpu_count() or 1
+    wanted = threads or min(4, cores)  # whisper.cpp's own default
+    backed_off = max(1, min(wanted, int(cores * (1.0 - min(load, 1.0)))))
+    if backed_off < wanted:
+        logging.info(f"CPU load {load:.0%}, decoding with {backed_off} instead of {wanted} threads")
+        return backed_off
+    return threads
 
 
 class Transcriber:
-    """Local speech-to-text using whisper.cpp."""
+    """
+    Local speech-to-text using whisper.cpp.
+
+    If a whisper.cpp server binary is given, a persistent worker keeps the
+    model loaded between utterances; otherwise whisper.exe is spawned per call
+    and fed the audio over stdin (temp WAV file as fallback).
+
+    With a ModelResidency the worker is borrowed from the shared model cache
+    instead of owned, so it can be evicted when idle and prefetched on key-down.
+
+    `threads` / `processors` are passed as -t / -p (0 / 1 = whisper.cpp
+    defaults). One-shot decodes use fewer threads while the machine is busy;
+    a server worker keeps the count it was started with.
 
-    def __init__(self, model_path="external/models/ggml-small.bin", whisper_path="external/whisper.exe", language="de"):
-        self.model_path = get_resource_path(model_path)
+    Recordings of at least two `segment_s` windows are split at pauses and
+    the segments decoded concurrently by up to `max_parallel` whisper.exe
+    processes (each loads its own copy of the model; 0 = as many as the
+    cores allow), sharing the cores between them, then joined in order.
+    """
+
+    def __init__(self, model_path="external/models/ggml-small.bin", whisper_path="external/whisper.exe",
+                 language="de", server_path=None, use_pipe=True, audio_ctx_table=None,
+                 residency=None, threads=0, processors=1, busy_threshold=0.75,
+                 segment_s=30.0, max_parallel=4):
+        self.model_path = resolve_model_path(model_path)  # any model_manager.MODELS name, or a file
         self.whisper_path = get_resource_path(whisper_path)
         self.language = language
+        self.threads = threads  # 0 = whisper.cpp default
+        self.processors = processors
+        self.busy_threshold = busy_threshold
+        self.segment_s = segment_s
+        self.max_parallel = max_parallel
+        self.worker = None
+        self.server_path = None
+        self.residency = residency
+        self.resident_key = None
+        # Pipe audio over stdin instead of a temp WAV (avoids antivirus scans / file locks)
+        self.use_pipe = use_pipe
+        self._pipe_supported = None  # unknown until the first stdin decode
+        self._audio_ctx_supported = None  # whether whisper.exe has -ac, probed on first use
+        # Reduced encoder context for short utterances ([] disables, None = default table)
+        self.audio_ctx_table = audio_ctx_table
+        self._procs = set()  # in-flight whisper.exe processes (the benchmark samples their memory)
+        self._procs_lock = threading.Lock()
 
         if not os.path.exists(self.model_path):
             raise FileNotFoundError(f"Model not found at {self.model_path}")
         if not os.path.exists(self.whisper_path):
             raise FileNotFoundError(f"Whisper binary not found at {self.whisper_path}")
 
-    def transcribe(self, audio_data, sample_rate=16000):
-        """Transcribe audio data (numpy float32 array) to text."""
-        if len(audio_data) == 0:
+        if server_path:
+            server_path = get_resource_path(server_path)
+            if not os.path.exists(server_path):
+                raise FileNotFoundError(f"Whisper server not found at {server_path}")
+            self.server_path = server_path
+            if residency:
+                self.resident_key = (os.path.basename(self.model_path), self.language,
+                                     self.threads, self.processors)
+            else:
+                from whisper_worker import WhisperWorker
+                self.worker = WhisperWorker(server_path, self.model_path, language=self.language,
+                                            extra_args=self._thread_args())
+
+    def _thread_args(self, threads=None):
+        threads = self.threads if threads is None else threads
+        args = ["-t", str(threads)] if threads else []
+        if self.processors > 1:
+            args += ["-p", str(self.processors)]
+        return args
+
+    def _load_worker(self):
+        """Start a worker and wait until its model is loaded (ModelResidency loader)."""
+        from whisper_worker import WhisperWorker
+        worker = WhisperWorker(self.server_path, self.model_path, language=self.language,
+                               extra_args=self._thread_args())
+        try:
+            worker.start()
+            worker.ensure_running()
+        except Exception:
+            worker.stop()
+            raise
+        return worker
+
+    def _borrow_worker(self):
+        if self.resident_key:
+            return self.residency.use(self.resident_key, self._load_worker, model_size_mb(self.model_path))
+        return contextlib.nullcontext(self.worker)
+
+    def start(self):
+        """Start the persistent worker, if one is configured."""
+        if self.worker:
+            self.worker.start()
+        elif self.resident_key:
+            self.prepare()
+
+    def prepare(self):
+        """Recording started: make sure the resident worker is loading (no-op without a cache)."""
+        if self.resident_key:
+            self.residency.prefetch(self.resident_key, self._load_worker, model_size_mb(self.model_path))
+
+    def close(self):
+        """Shut down an owned worker (cached workers stay with the ModelResidency)."""
+        if self.worker:
+            self.worker.stop()
+
+    def transcribe(self, audio_data, sample_rate=16000, timeout=60, cancel=None):
+        """
+        Transcribe audio (PcmBuffer or numpy array) to text.
+        Cancelling `cancel` (a CancelToken) kills this call's whisper.exe
+        processes or restarts the worker it is waiting on, and returns "".
+        """
+        return self._decode(audio_data, sample_rate, timeout, scored=False, cancel=cancel)[0]
+
+    def transcribe_scored(self, audio_data, sample_rate=16000, timeout=60, cancel=None):
+        """Like transcribe(), but returns (text, token_confidence() or None)."""
+        return self._decode(audio_data, sample_rate, timeout, scored=True, cancel=cancel)
+
+    def _decode(self, audio_data, sample_rate, timeout, scored, cancel=None):
+        if len(audio_data) == 0 or (cancel and cancel.cancelled):
+            return "", None
+        pcm = PcmBuffer.wrap(audio_data, sample_rate)
+        if self.segment_s and pcm.duration >= 2 * self.segment_s and self._parallel_plan(2)[0] > 1:
+            return self._decode_segments(pcm, timeout, scored, cancel)
+
+        audio_ctx = audio_ctx_for(pcm.duration, self.audio_ctx_table)
+        if audio_ctx:
+            logging.info(f"Using audio context {audio_ctx} for {pcm.duration:.1f}s utterance")
+
+        if self.worker or self.resident_key:
+            from whisper_worker import WorkerError
+            fields = {"audio_ctx": str(audio_ctx)} if audio_ctx else {}
+            if scored:
+                fields["response_format"] = "verbose_json"
+            t0 = time.perf_counter()
+            try:
+                with self._borrow_worker() as worker:
+                    reply = worker.inference(pcm.wav_bytes(), timeout=timeout, fields=fields or None,
+                                             cancel=cancel)
+                return parse_verbose_json(reply) if scored else (reply, None)
+            except (WorkerError, OSError) as e:
+                if cancel and cancel.cancelled:
+                    return "", None
+                # The fallback gets what is left of the caller's budget, not a fresh one
+                remaining = timeout - (time.perf_counter() - t0)
+                if remaining < 1.0:
+                    logging.error(f"Whisper worker failed with no time left for whisper.exe: {e}")
+                    return "", None
+                logging.error(f"Whisper worker failed, falling back to whisper.exe: {e}")
+                timeout = remaining
+
+        extra_args = self._thread_args(threads_for_load(self.threads, self.busy_threshold))
+        if audio_ctx and self.cli_accepts_audio_ctx():
+            extra_args += ["-ac", str(audio_ctx)]
+        return self._decode_cli(pcm, extra_args, timeout, scored, cancel)
+
+    def cli_accepts_audio_ctx(self):
+        """
+        Whether whisper.exe has the -ac option. Builds without it answer an
+        unknown argument with their usage text and exit 0 without a transcript.
+        """
+        if self._audio_ctx_supported is None:
+            try:
+                process = subprocess.run([self.whisper_path, "-m", self.model_path, "-h"],
+                                         capture_output=True, timeout=10, **hidden_subprocess_kwargs())
+                usage = (process.stdout + process.stderr).decode("utf-8", errors="replace")
+                self._audio_ctx_supported = "--audio-ctx" in usage
+            except (OSError, subprocess.SubprocessError) as e:
+                logging.warning(f"Could not read whisper.exe options: {e}")
+                self._audio_ctx_supported = False
+            if not self._audio_ctx_supported:
+                logging.warning("whisper.exe has no -ac option, short utterances use the full audio context")
+        return self._audio_ctx_supported
+
+    def _parallel_plan(self, segments):
+        """(processes, threads each) for decoding `segments` segments side by side."""
+        cores = threads_for_load(os.cpu_count() or 1, self.busy_threshold)
+        workers = min(segments, max(1, cores // 2))  # at least two threads per process
+        if self.max_parallel:
+            workers = min(workers, self.max_parallel)
+        return workers, max(1, cores // workers)
+
+    def _decode_segments(self, pcm, timeout, scored, cancel=None):
+        """Split a long recording at pauses and decode the pieces in a bounded process pool."""
+        segments = vad.split_at_pauses(pcm, target_s=self.segment_s, min_s=self.segment_s / 2,
+                                       max_s=self.segment_s * 1.5)
+        workers, threads = self._parallel_plan(len(segments))
+        logging.info(f"Long recording ({pcm.duration:.0f}s): {len(segments)} segments, "
+                     f"{workers} whisper.exe processes x {threads} threads")
+        extra_args = ["-t", str(threads)]
+        deadline = time.perf_counter() + timeout
+
+        def decode(segment):
+            # More segments than processes run in waves: each gets what is left of the shared budget
+            remaining = deadline - time.perf_counter()
+            if remaining < 1.0:
+                logging.error("Long recording: no time left for the remaining segments")
+                return "", None
+            return self._decode_cli(segment, extra_args, remaining, scored, cancel)
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="whisper-segment") as pool:
+            results = list(pool.map(decode, segments))
+
+        text = " ".join(part.strip() for part, _ in results if part and part.strip())
+        # Overall confidence: geometric mean of the segments' confidences, weighted by length
+        scored_parts = [(conf, seg.duration) for (_, conf), seg in zip(results, segments) if conf is not None]
+        confidence = None
+        if scored_parts:
+            confidence = math.exp(sum(math.log(max(c, 1e-10)) * d for c, d in scored_parts)
+                                  / sum(d for _, d in scored_parts))
+        return text, confidence
+
+    def _decode_cli(self, pcm, extra_args, timeout, scored, cancel=None):
+        """One whisper.exe decode; with `scored`, also read token probabilities."""
+        if not scored:
+            return self._transcribe_cli(pcm, extra_args, timeout, cancel), None
+
+        # Token probabilities only come out of the full JSON output file
+        json_base = os.path.join(tempfile.gettempdir(), f"voicetyper-{uuid.uuid4().hex}")
+        try:
+            text = self._transcribe_cli(pcm, extra_args + ["-ojf", "-of", json_base], timeout, cancel)
+            with open(json_base + ".json", "r", encoding="utf-8") as f:
+                confidence = confidence_from_cli_json(json.load(f))
+        except (OSError, ValueError) as e:
+            logging.debug(f"No token probabilities from whisper.exe: {e}")
+            confidence = None
+        finally:
+            if os.path.exists(json_base + ".json"):
+                os.remove(json_base + ".json")
+        return text, confidence
+
+    def _transcribe_cli(self, pcm, extra_args=(), timeout=60, cancel=None):
+        """One-shot transcription by spawning whisper.exe."""
+        wav_bytes = pcm.wav_bytes()
+
+        if self.use_pipe and self._pipe_supported is not False:
+            text = self._run_whisper_pipe(wav_bytes, extra_args, timeout, cancel)
+            if text is not None:
+                return text
+            # The pipe was rejected, or the very first stdin decode failed for an unclear
+            # reason: if the same audio decodes from a file, stdin is what does not work
+            text = self._run_whisper_file(wav_bytes, extra_args, timeout, cancel)
+            if text is not None and self._pipe_supported is None:
+                logging.warning("whisper.exe could not read audio from stdin, falling back to temp WAV files")
+                self._pipe_supported = False
+            return text or ""
+
+        return self._run_whisper_file(wav_bytes, extra_args, timeout, cancel) or ""
+
+    def _run_whisper(self, audio_arg, input_bytes=None, extra_args=(), timeout=60, cancel=None):
+        """Run whisper.cpp — stdout captures transcribed text, stderr has system info."""
+        if cancel and cancel.cancelled:
+            raise TranscriptionCancelled()
+        cmd = [
+            self.whisper_path,
+            "-m", self.model_path,
+            "-f", audio_arg,
+            "-l", self.language,
+            "--no-timestamps",
+            *extra_args
+        ]
+
+        process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE if input_bytes is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            **hidden_subprocess_kwargs()
+        )
+        with self._procs_lock:
+            self._procs.add(process)
+        try:
+            with cancel.registered(process.kill) if cancel else contextlib.nullcontext():
+                stdout, stderr = process.communicate(input_bytes, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise
+        finally:
+            with self._procs_lock:
+                self._procs.discard(process)
+
+        if cancel and cancel.cancelled:
+            raise TranscriptionCancelled()
+        return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+    def _run_whisper_pipe(self, wav_bytes, extra_args=(), timeout=60, cancel=None):
+        """
+        Stream the WAV to whisper.exe over stdin. Returns None if the pipe was
+        rejected, or if the first stdin decode failed (the caller retries from
+        a file to find out why); "" after any other whisper error.
+        """
+        try:
+            process = self._run_whisper("-", input_bytes=wav_bytes, extra_args=extra_args, timeout=timeout,
+                                        cancel=cancel)
+        except subprocess.TimeoutExpired:
+            print("Transcription timed out")
+            return ""
+        except TranscriptionCancelled:
+            return ""
+        except Exception as e:
+            print(f"Transcription error: {e}")
+            return ""
+
+        if process.returncode != 0:
+            stderr = process.stderr.decode('utf-8', errors='replace')
+            if _pipe_rejected(stderr):
+                logging.warning("whisper.exe could not read audio from stdin, falling back to temp WAV files")
+                self._pipe_supported = False
+                return None
+            if self._pipe_supported is None:
+                logging.debug(f"First stdin decode failed: {stderr}")
+                return None
+            print(f"Whisper Error: {stderr}")
             return ""
 
+        self._pipe_supported = True
+        return process.stdout.decode('utf-8', errors='replace').strip()
+
+    def _run_whisper_file(self, wav_bytes, extra_args=(), timeout=60, cancel=None):
+        """Write the WAV to a temp file for whisper.exe to read back. None if whisper failed."""
         with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
             tmp_wav = tmp.name
 
         try:
-            # Convert float32 to int16 and write WAV
-            audio_int16 = (audio_data * 32767).astype(np.int16)
-            with wave.open(tmp_wav, 'wb') as wf:
-                wf.setnchannels(1)
-                wf.setsampwidth(2)
-                wf.setframerate(sample_rate)
-                wf.writeframes(audio_int16.tobytes())
-
-            # Run whisper.cpp — stdout captures transcribed text, stderr has system info
-            cmd = [
-                self.whisper_path,
-                "-m", self.model_path,
-                "-f", tmp_wav,
-                "-l", self.language,
-                "--no-timestamps"
-            ]
-
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            startupinfo.wShowWindow = subprocess.SW_HIDE
-
-            process = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                encoding='utf-8',
-                timeout=60,
-                startupinfo=startupinfo,
-                creationflags=subprocess.CREATE_NO_WINDOW
-            )
+            with open(tmp_wav, 'wb') as f:
+                f.write(wav_bytes)
+
+            process = self._run_whisper(tmp_wav, extra_args=extra_args, timeout=timeout, cancel=cancel)
 
             if process.returncode != 0:
-                print(f"Whisper Error: {process.stderr}")
-                return ""
+                print(f"Whisper Error: {process.stderr.decode('utf-8', errors='replace')}")
+                return None
 
-            return process.stdout.strip()
+            return process.stdout.decode('utf-8', errors='replace').strip()
 
         except subprocess.TimeoutExpired:
             print("Transcription timed out")
             return ""
+        except TranscriptionCancelled:
+            return ""
         except Exception as e:
             print(f"Transcription error: {e}")
-            return ""
+            return None
         finally:
             if os.path.exists(tmp_wav):
                 os.remove(tmp_wav)
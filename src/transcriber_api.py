@@ -1,91 +1,455 @@
-
 import os
 import io
 import tempfile
-import wave
-import numpy as np
+import threading
 import logging
+import time
+import uuid
+import json
+import statistics
+
+from concurrent.futures import ThreadPoolExecutor
+
+from pcm import PcmBuffer
+from cancellation import CancelToken, linked
+import audio_codec
+import vad
 
 try:
     import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.filepost import encode_multipart_formdata
     REQUESTS_AVAILABLE = True
 except ImportError:
     REQUESTS_AVAILABLE = False
 
+
+DEFAULT_API_URL = "https://api.openai.com/v1/audio/transcriptions"
+AUTH_SCHEMES = ("bearer", "api-key", "none")
+
+
+def auth_headers(api_key, auth_scheme="bearer"):
+    """Request headers carrying the key for the given auth scheme."""
+    if auth_scheme == "bearer":
+        return {"Authorization": f"Bearer {api_key}"}
+    if auth_scheme == "api-key":
+        return {"api-key": api_key}
+    return {}
+
+
+def probe_endpoint(url, api_key="", auth_scheme="bearer", attempts=3, timeout=5):
+    """
+    Check that a transcription endpoint is reachable and measure its latency.
+
+    The first request opens the connection (DNS, TCP, TLS); `attempts` more
+    on the same connection give the round-trip time. Any HTTP answer counts
+    as reachable, except 401/403 which mean the key was refused.
+    Returns a dict with ok, status, connect_ms, rtt_ms and a short message.
+    """
+    result = {"ok": False, "status": None, "connect_ms": None, "rtt_ms": None}
+    if not REQUESTS_AVAILABLE:
+        result["message"] = "requests library not installed"
+        return result
+
+    session = requests.Session()
+    headers = auth_headers(api_key, auth_scheme)
+    try:
+        t0 = time.perf_counter()
+        response = session.get(url, headers=headers, timeout=timeout)
+        result["connect_ms"] = (time.perf_counter() - t0) * 1000
+        rtts = []
+        for _ in range(attempts):
+            t0 = time.perf_counter()
+            response = session.get(url, headers=headers, timeout=timeout)
+            rtts.append((time.perf_counter() - t0) * 1000)
+    except requests.RequestException as e:
+        result["message"] = f"Unreachable: {e.__class__.__name__}"
+        logging.warning(f"Endpoint probe of {url} failed: {e}")
+        return result
+    finally:
+        session.close()
+
+    result["status"] = response.status_code
+    result["rtt_ms"] = statistics.median(rtts) if rtts else result["connect_ms"]
+    if response.status_code in (401, 403):
+        result["message"] = f"Reachable ({result['rtt_ms']:.0f} ms), but the API key was rejected"
+    else:
+        result["ok"] = True
+        result["message"] = (f"Reachable: {result['rtt_ms']:.0f} ms round trip "
+                             f"({result['connect_ms']:.0f} ms first connection)")
+    logging.info(f"Endpoint probe of {url}: {result['message']} (HTTP {response.status_code})")
+    return result
+
+
+class _TimedBody(io.BytesIO):
+    """
+    Request body that records when the last byte was handed to the socket,
+    and aborts the upload once `cancel` (a CancelToken) is cancelled.
+    """
+
+    def __init__(self, data, cancel=None):
+        super().__init__(data)
+        self.size = len(data)
+        self.cancel = cancel
+        self.finished_at = None
+
+    def __len__(self):
+        return self.size
+
+    def read(self, size=-1):
+        if self.cancel and self.cancel.cancelled:
+            raise UploadCancelled()
+        chunk = super().read(size)
+        if not chunk and self.finished_at is None:
+            self.finished_at = time.perf_counter()
+        return chunk
+
+
+def iter_sse_events(response):
+    """Decoded JSON payloads of a text/event-stream response, as they arrive."""
+    data = []
+    # chunk_size=None hands over each network chunk instead of waiting for 512 bytes
+    for raw in response.iter_lines(chunk_size=None):
+        line = raw.decode("utf-8")
+        if line.startswith("data:"):
+            data.append(line[5:].lstrip())
+        elif not line and data:
+            payload, data = "\n".join(data), []
+            if payload == "[DONE]":
+                return
+            yield json.loads(payload)
+    if data and data != ["[DONE]"]:
+        yield json.loads("\n".join(data))
+
+
+class APIError(Exception):
+    """Transcription endpoint answered with an error status."""
+
+    def __init__(self, status_code, body):
+        super().__init__(f"API error {status_code}: {body}")
+        self.status_code = status_code
+
+    @property
+    def retryable(self):
+        return self.status_code == 429 or self.status_code >= 500
+
+
+class UploadCancelled(Exception):
+    """Raised inside a streaming request body to abort the upload."""
+
+
+class ChunkFailed(Exception):
+    """A chunk of a long recording could not be transcribed; the text would have a gap."""
+
+
+class StreamingUpload:
+    """
+    Transcription request opened when recording starts. Audio is sent with
+    chunked transfer encoding as the encoder produces it, so after release
+    only the tail of the upload and the server's processing remain.
+    A recording that grows past what one request may carry abandons the
+    stream (`too_long`); the API then sends it in chunks after release.
+    """
+
+    def __init__(self, api, encoder, timeout=120):
+        self.api = api
+        self.encoder = encoder
+        self.timeout = timeout  # read timeout once the body is complete
+        self.boundary = uuid.uuid4().hex
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+        self._response = None
+        self.stopped_at = None
+        self.upload_finished_at = None
+        recorder = encoder.recorder
+        self.max_frames = int(api._max_chunk_s(recorder.sample_rate, recorder.channels) * recorder.sample_rate)
+        self.too_long = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.encoder.start()
+        self._thread.start()
+        return self
+
+    def _body(self):
+        filename, mime = audio_codec.UPLOAD_FORMATS[self.encoder.upload_format]
+        head = []
+        for name, value in self.api._form_fields().items():
+            head.append(f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n')
+        head.append(f'--{self.boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                    f'Content-Type: {mime}\r\n\r\n')
+        yield "".join(head).encode()
+
+        for chunk in self.encoder.iter_chunks():
+            if not self._cancelled.is_set() and self.encoder.capture.write_pos > self.max_frames:
+                logging.info("Recording too long for one request, abandoning the streaming upload")
+                self.too_long = True
+                self.cancel()
+            if self._cancelled.is_set():
+                raise UploadCancelled()
+            yield chunk
+        if self._cancelled.is_set():
+            raise UploadCancelled()
+
+        yield f"\r\n--{self.boundary}--\r\n".encode()
+        self.upload_finished_at = time.perf_counter()
+
+    def _run(self):
+        self.api._wait_warm()
+        headers = {
+            **self.api.auth_headers(),
+            "Content-Type": f"multipart/form-data; boundary={self.boundary}",
+        }
+        try:
+            # A generator body makes requests use Transfer-Encoding: chunked
+            self._response = self.api.session.post(
+                self.api.url,
+                headers=headers,
+                data=self._body(),
+                timeout=(self.api.WARM_TIMEOUT, self.timeout),
+                stream=self.api.stream_response,
+            )
+        except Exception as e:
+            if self._cancelled.is_set():
+                logging.info("Streaming upload cancelled")
+            else:
+                logging.error(f"Streaming upload failed: {e}")
+        finally:
+            self._done.set()
+
+    def stop(self, total_frames):
+        """Recording ended: send the remaining audio and close the request body."""
+        self.stopped_at = time.perf_counter()
+        self.encoder.stop(total_frames)
+
+    def cancel(self):
+        """Abort the request; nothing will be transcribed."""
+        self._cancelled.set()
+        self.encoder.cancel()
+
+    def result(self, timeout=30, on_text=None):
+        """Transcribed text once the server has answered ("" on failure or timeout)."""
+        if not self._done.wait(timeout):
+            logging.error("API request timed out")
+            self.cancel()
+            self.api._record(False)
+            return ""
+        if self._response is None:
+            if not self._cancelled.is_set():
+                self.api._record(False)
+            return ""
+        t_done = time.perf_counter()
+        if self.stopped_at and self.upload_finished_at:
+            logging.info(f"[TIMING] Streaming upload tail: {(self.upload_finished_at-self.stopped_at)*1000:.0f}ms, "
+                         f"server response: {(t_done-self.upload_finished_at)*1000:.0f}ms")
+        try:
+            text = self.api._read_response(self._response, on_text)
+        except APIError as e:
+            logging.error(str(e))
+            self.api._record(False)
+            return ""
+        except Exception as e:
+            logging.error(f"Reading API response failed: {e}")
+            self.api._record(False)
+            return ""
+        self.api._record(True)
+        return text
+
+
 class TranscriberAPI:
     """
-    Transcriber using OpenAI Whisper API.
-    Fast and accurate, but requires internet and API key.
+    Transcriber using OpenAI Whisper API, or any server with an
+    OpenAI-compatible /audio/transcriptions endpoint (e.g. one on the LAN).
+    Fast and accurate, but requires a network and usually an API key.
+
+    Uses one pooled keep-alive session; prepare() opens the connection
+    (DNS, TCP, TLS) while the user is still speaking. Audio is uploaded
+    as WAV or, to save bandwidth, FLAC encoded while recording. With
+    stream_upload the request itself is opened at record start.
+
+    With stream_response the server sends the transcript as server-sent
+    events and text deltas are handed to `on_text` as they arrive (needs a
+    model that streams, e.g. gpt-4o-mini-transcribe; whisper-1 does not).
+
+    Recordings longer than about `chunk_s` seconds are split at pauses and
+    sent as up to `max_parallel` concurrent requests, which also keeps
+    every upload under the provider's file size limit.
     """
-    
-    WHISPER_API_URL = "https://api.openai.com/v1/audio/transcriptions"
-    
-    def __init__(self, api_key=None, language="en"):
+
+    WARM_TIMEOUT = 5
+    MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+    RETRY_BACKOFF = 0.5  # seconds, doubled per retry
+
+    def __init__(self, api_key=None, language="en", upload_format="wav", stream_upload=False,
+                 stream_response=False, model="whisper-1", chunk_s=30.0, max_parallel=4, chunk_retries=2,
+                 url=None, auth_scheme="bearer"):
         if not REQUESTS_AVAILABLE:
             raise ImportError("requests library required for API mode. Install with: pip install requests")
-        
+
         self.api_key = api_key
         self.language = language
-        
-        if not self.api_key:
+        self.url = url or DEFAULT_API_URL
+        if auth_scheme not in AUTH_SCHEMES:
+            raise ValueError(f"Unknown auth scheme '{auth_scheme}', expected one of {AUTH_SCHEMES}")
+        self.auth_scheme = auth_scheme
+
+        if not self.api_key and auth_scheme != "none":
             raise ValueError("OpenAI API key is required for API transcription mode")
-    
-    def transcribe(self, audio_data, sample_rate=16000):
+
+        self.upload_format = audio_codec.resolve_format(upload_format)
+        self.stream_upload = stream_upload
+        self.stream_response = stream_response
+        self.model = model
+        self.chunk_s = chunk_s
+        self.max_parallel = max(1, max_parallel)
+        self.chunk_retries = chunk_retries
+        self.breaker = None  # CircuitBreaker told about every request outcome, if set
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(4, self.max_parallel))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._warm_thread = None
+        self.last_handshake_ms = None
+
+    def prepare(self):
+        """Start warming the pooled connection in the background (called on record start)."""
+        if self._warm_thread and self._warm_thread.is_alive():
+            return
+        self._warm_thread = threading.Thread(target=self._warm_up, daemon=True)
+        self._warm_thread.start()
+
+    def _warm_up(self):
+        t0 = time.perf_counter()
+        try:
+            # Any response will do: the point is an open, TLS-established pooled connection
+            self.session.head(self.url, timeout=self.WARM_TIMEOUT)
+            self.last_handshake_ms = (time.perf_counter() - t0) * 1000
+            logging.info(f"[TIMING] Connection warm-up (DNS/TCP/TLS): {self.last_handshake_ms:.0f}ms")
+        except requests.RequestException as e:
+            logging.warning(f"API connection warm-up failed: {e}")
+
+    def auth_headers(self):
+        return auth_headers(self.api_key, self.auth_scheme)
+
+    def _wait_warm(self):
+        # Reuse the connection being warmed rather than racing it with a second handshake
+        if self._warm_thread and self._warm_thread.is_alive():
+            self._warm_thread.join(self.WARM_TIMEOUT)
+
+    def _form_fields(self):
+        if self.stream_response:
+            return {
+                "model": self.model,
+                "language": self.language,
+                "response_format": "json",
+                "stream": "true",
+            }
+        return {
+            "model": self.model,
+            "language": self.language,
+            "response_format": "text",
+        }
+
+    def _read_response(self, response, on_text=None):
+        """
+        Transcript from a response. Event streams are consumed delta by
+        delta, calling on_text(delta) for each; returns the full text.
+        """
+        if response.status_code != 200:
+            raise APIError(response.status_code, response.text)
+        content_type = response.headers.get("Content-Type", "")
+        if "text/event-stream" in content_type:
+            t0 = time.perf_counter()
+            parts, final = [], None
+            for event in iter_sse_events(response):
+                kind = event.get("type")
+                if kind == "transcript.text.delta":
+                    delta = event.get("delta", "")
+                    if not parts:
+                        logging.info(f"[TIMING] First text delta: {(time.perf_counter()-t0)*1000:.0f}ms after headers")
+                    parts.append(delta)
+                    if on_text:
+                        on_text(delta)
+                elif kind == "transcript.text.done":
+                    final = event.get("text")
+            logging.info(f"[TIMING] Event stream complete: {(time.perf_counter()-t0)*1000:.0f}ms, {len(parts)} deltas")
+            return (final if final is not None else "".join(parts)).strip()
+        if "application/json" in content_type:
+            return response.json().get("text", "").strip()
+        return response.text.strip()
+
+    def close(self):
+        self.session.close()
+
+    def start_encoder(self, recorder):
+        """
+        Begin encoding (and with stream_upload, sending) the current recording
+        as it is captured. None if there is nothing to do before release.
+        """
+        if self.stream_upload:
+            encoder = audio_codec.IncrementalEncoder(recorder, self.upload_format)
+            return StreamingUpload(self, encoder).start()
+        if self.upload_format != "flac":
+            return None
+        return audio_codec.IncrementalEncoder(recorder).start()
+
+    def _max_chunk_s(self, sample_rate, channels=1):
+        """Longest chunk to send in one request: chunk_s + 50%, and under the upload size limit."""
+        bytes_per_s = sample_rate * channels * 2  # 16-bit PCM; FLAC is smaller
+        return min(self.chunk_s * 1.5, 0.9 * self.MAX_UPLOAD_BYTES / bytes_per_s)
+
+    def transcribe(self, audio_data, sample_rate=16000, timeout=30, encoded_audio=None, on_text=None,
+                   cancel=None):
         """
         Transcribe audio data using OpenAI Whisper API.
+        `encoded_audio` is the IncrementalEncoder or StreamingUpload returned
+        by start_encoder() for this recording; `on_text` receives text deltas
+        when the response is streamed. Cancelling `cancel` (a CancelToken)
+        aborts uploads still in progress and skips requests not yet sent.
         Returns transcribed text.
         """
-        import time
-        
-        if len(audio_data) == 0:
+        if len(audio_data) == 0 or (cancel and cancel.cancelled):
             return ""
-        
-        # TIMING: WAV conversion
+
+        if encoded_audio is not None and cancel:
+            with cancel.registered(encoded_audio.cancel):
+                return self._transcribe(audio_data, sample_rate, timeout, encoded_audio, on_text, cancel)
+        return self._transcribe(audio_data, sample_rate, timeout, encoded_audio, on_text, cancel)
+
+    def _transcribe(self, audio_data, sample_rate, timeout, encoded_audio, on_text, cancel):
+        pcm = PcmBuffer.wrap(audio_data, sample_rate)
+        too_long = pcm.duration > self._max_chunk_s(pcm.sample_rate, pcm.channels)
+        if isinstance(encoded_audio, StreamingUpload):
+            if not too_long and not encoded_audio.too_long:
+                return encoded_audio.result(timeout, on_text)
+            encoded_audio.cancel()  # one request would have no size cap and no per-chunk retry
+            encoded_audio = None
+        if too_long:
+            return self._transcribe_chunked(pcm, timeout, on_text, cancel)
+
+        # TIMING: audio encoding
         t0 = time.perf_counter()
-        wav_buffer = io.BytesIO()
-        audio_int16 = (audio_data * 32767).astype(np.int16)
-        
-        with wave.open(wav_buffer, 'wb') as wf:
-            wf.setnchannels(1)
-            wf.setsampwidth(2)
-            wf.setframerate(sample_rate)
-            wf.writeframes(audio_int16.tobytes())
-        
-        wav_buffer.seek(0)
+        if encoded_audio is not None:
+            payload, filename, mime = encoded_audio.finish()
+        else:
+            payload, filename, mime = audio_codec.encode(pcm, self.upload_format)
         t1 = time.perf_counter()
-        logging.info(f"[TIMING] WAV conversion: {(t1-t0)*1000:.0f}ms")
-        
+        logging.info(f"[TIMING] Audio encoding ({filename}, {len(payload) // 1024} KB): {(t1-t0)*1000:.0f}ms")
+
+        self._wait_warm()
+
         try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}"
-            }
-            
-            files = {
-                "file": ("audio.wav", wav_buffer, "audio/wav"),
-                "model": (None, "whisper-1"),
-                "language": (None, self.language),
-                "response_format": (None, "text")
-            }
-            
-            # TIMING: API call
-            t2 = time.perf_counter()
-            response = requests.post(
-                self.WHISPER_API_URL,
-                headers=headers,
-                files=files,
-                timeout=30
-            )
-            t3 = time.perf_counter()
-            logging.info(f"[TIMING] API call: {(t3-t2)*1000:.0f}ms")
-            
-            if response.status_code == 200:
-                text = response.text.strip()
-                logging.info(f"[TIMING] Total transcribe: {(t3-t0)*1000:.0f}ms")
-                return text
-            else:
-                logging.error(f"API error {response.status_code}: {response.text}")
-                return ""
-                
+            text = self._request(payload, filename, mime, timeout, on_text, cancel)
+            logging.info(f"[TIMING] Total transcribe: {(time.perf_counter()-t0)*1000:.0f}ms")
+            return text
+
+        except UploadCancelled:
+            logging.info("API upload cancelled")
+            return ""
+        except APIError as e:
+            logging.error(str(e))
+            return ""
         except requests.Timeout:
             logging.error("API request timed out")
             return ""
@@ -95,3 +459,120 @@ class TranscriberAPI:
         except Exception as e:
             logging.error(f"Transcription error: {e}")
             return ""
+
+    def _record(self, ok):
+        if self.breaker:
+            if ok:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+
+    def _request(self, payload, filename, mime, timeout, on_text=None, cancel=None):
+        """
+        One transcription request. Raises APIError or requests.RequestException
+        on failure, UploadCancelled if `cancel` fired during the upload.
+        """
+        try:
+            text = self._post_audio(payload, filename, mime, timeout, on_text, cancel)
+        except (APIError, requests.RequestException):
+            self._record(False)
+            raise
+        self._record(True)
+        return text
+
+    def _post_audio(self, payload, filename, mime, timeout, on_text=None, cancel=None):
+        body, content_type = encode_multipart_formdata({
+            "file": (filename, payload, mime),
+            **self._form_fields(),
+        })
+        body = _TimedBody(body, cancel)
+
+        headers = {
+            **self.auth_headers(),
+            "Content-Type": content_type,
+        }
+
+        # TIMING: API call
+        t0 = time.perf_counter()
+        response = self.session.post(
+            self.url,
+            headers=headers,
+            data=body,
+            timeout=timeout,
+            stream=self.stream_response,
+        )
+        t1 = time.perf_counter()
+        logging.info(f"[TIMING] API call: {(t1-t0)*1000:.0f}ms")
+        if body.finished_at:
+            logging.info(f"[TIMING] Upload: {(body.finished_at-t0)*1000:.0f}ms ({body.size // 1024} KB), "
+                         f"server response: {(t1-body.finished_at)*1000:.0f}ms")
+        return self._read_response(response, on_text)
+
+    def _transcribe_chunked(self, pcm, timeout, on_text=None, cancel=None):
+        """
+        Long recording: split at pauses, send the chunks concurrently and
+        join the texts in recording order. on_text receives each chunk's
+        text as soon as it and all earlier chunks are done. Raises
+        ChunkFailed (and stops the other chunks) if a chunk cannot be
+        transcribed, rather than returning text with a hole in it.
+        """
+        max_s = self._max_chunk_s(pcm.sample_rate, pcm.channels)
+        chunks = vad.split_at_pauses(pcm, target_s=min(self.chunk_s, max_s), min_s=min(self.chunk_s, max_s) / 2,
+                                     max_s=max_s)
+        logging.info(f"Long recording ({pcm.duration:.0f}s): {len(chunks)} chunks, "
+                     f"up to {self.max_parallel} requests in parallel")
+        self._wait_warm()
+
+        t0 = time.perf_counter()
+        parts = []
+        batch = CancelToken()  # stops the remaining chunks once one has failed
+        with linked(cancel, batch), \
+                ThreadPoolExecutor(max_workers=self.max_parallel, thread_name_prefix="api-chunk") as pool:
+            futures = [pool.submit(self._transcribe_chunk, i, chunk, timeout, batch)
+                       for i, chunk in enumerate(chunks)]
+            try:
+                for future in futures:
+                    text = future.result()
+                    if text:
+                        if on_text:
+                            on_text(text if not parts else " " + text)
+                        parts.append(text)
+            except ChunkFailed:
+                batch.cancel()
+                for future in futures:
+                    future.cancel()
+                raise
+        logging.info(f"[TIMING] Chunked transcribe: {(time.perf_counter()-t0)*1000:.0f}ms "
+                     f"for {pcm.duration:.0f}s of audio")
+        return " ".join(parts)
+
+    def _transcribe_chunk(self, index, chunk, timeout, cancel=None):
+        """
+        Send one chunk, retrying transient failures. Raises ChunkFailed once
+        retries are used up; only that final outcome counts for the circuit
+        breaker, not each retried attempt. "" if cancelled.
+        """
+        payload, filename, mime = audio_codec.encode(chunk, self.upload_format)
+        for attempt in range(self.chunk_retries + 1):
+            if cancel and cancel.cancelled:
+                return ""
+            try:
+                text = self._post_audio(payload, filename, mime, timeout, cancel=cancel)
+                self._record(True)
+                return text
+            except UploadCancelled:
+                return ""
+            except APIError as e:
+                if not e.retryable:
+                    self._record(False)
+                    raise ChunkFailed(f"Chunk {index + 1}: {e}") from e
+                error = e
+            except requests.RequestException as e:
+                error = e
+            if attempt < self.chunk_retries:
+                logging.warning(f"Chunk {index + 1} attempt {attempt + 1} failed, retrying: {error}")
+                time.sleep(self.RETRY_BACKOFF * 2 ** attempt)
+        if cancel and cancel.cancelled:
+            return ""
+        self._record(False)
+        raise ChunkFailed(f"Chunk {index + 1} failed after {self.chunk_retries + 1} attempts: {error}") from error
@@ -0,0 +1,342 @@
+"""
+In-process whisper.cpp transcription via ctypes.
+Loads libwhisper once and keeps a whisper_context loaded for the session
+(or in the shared ModelResidency cache, which may unload it when idle).
+"""
+
+import os
+import re
+import sys
+import ctypes
+import ctypes.util
+import threading
+import logging
+import time
+import contextlib
+import numpy as np
+
+from pcm import PcmBuffer
+from transcriber import audio_ctx_for, threads_for_load, token_confidence
+from utils import get_resource_path
+from model_manager import model_size_mb, resolve_model_path
+
+WHISPER_SAMPLING_GREEDY = 0
+WHISPER_SAMPLE_RATE = 16000
+
+# whisper.cpp passes its parameter structs by value. Only the leading fields
+# we touch are declared; the rest is reserved space large enough for the full
+# struct, which is safe both when returned by value and when passed by value.
+_PARAMS_RESERVED = 1024
+
+
+class _ContextParams(ctypes.Structure):
+    _fields_ = [("_reserved", ctypes.c_ubyte * _PARAMS_RESERVED)]
+
+
+# whisper_full_params is not stable across releases, and a field written at the
+# wrong offset silently lands on another one (e.g. `language` on
+# `detect_language`, which makes whisper_full detect the language and return no
+# text). Each layout below was checked against the whisper.h of the versions named.
+_FULL_PARAMS_HEAD = [
+    ("strategy", ctypes.c_int),
+    ("n_threads", ctypes.c_int),
+    ("n_max_text_ctx", ctypes.c_int),
+    ("offset_ms", ctypes.c_int),
+    ("duration_ms", ctypes.c_int),
+    ("translate", ctypes.c_bool),
+    ("no_context", ctypes.c_bool),
+    ("no_timestamps", ctypes.c_bool),
+    ("single_segment", ctypes.c_bool),
+    ("print_special", ctypes.c_bool),
+    ("print_progress", ctypes.c_bool),
+    ("print_realtime", ctypes.c_bool),
+    ("print_timestamps", ctypes.c_bool),
+    ("token_timestamps", ctypes.c_bool),
+    ("thold_pt", ctypes.c_float),
+    ("thold_ptsum", ctypes.c_float),
+    ("max_len", ctypes.c_int),
+    ("split_on_word", ctypes.c_bool),
+    ("max_tokens", ctypes.c_int),
+]
+
+
+class _FullParams15(ctypes.Structure):
+    """whisper.cpp 1.5.x (the bundled whisper.dll): has speed_up, no suppress_regex."""
+    _fields_ = _FULL_PARAMS_HEAD + [
+        ("speed_up", ctypes.c_bool),
+        ("debug_mode", ctypes.c_bool),
+        ("audio_ctx", ctypes.c_int),
+        ("tdrz_enable", ctypes.c_bool),
+        ("initial_prompt", ctypes.c_char_p),
+        ("prompt_tokens", ctypes.c_void_p),
+        ("prompt_n_tokens", ctypes.c_int),
+        ("language", ctypes.c_char_p),
+        ("detect_language", ctypes.c_bool),
+    ]
+
+
+class _FullParams16(ctypes.Structure):
+    """whisper.cpp 1.6.0 - 1.7.x: speed_up removed, suppress_regex added."""
+    _fields_ = _FULL_PARAMS_HEAD + [
+        ("debug_mode", ctypes.c_bool),
+        ("audio_ctx", ctypes.c_int),
+        ("tdrz_enable", ctypes.c_bool),
+        ("suppress_regex", ctypes.c_char_p),
+        ("initial_prompt", ctypes.c_char_p),
+        ("prompt_tokens", ctypes.c_void_p),
+        ("prompt_n_tokens", ctypes.c_int),
+        ("language", ctypes.c_char_p),
+        ("detect_language", ctypes.c_bool),
+    ]
+
+
+class _FullParams18(ctypes.Structure):
+    """whisper.cpp 1.8.2 - 1.8.x: carry_initial_prompt added."""
+    _fields_ = _FULL_PARAMS_HEAD + [
+        ("debug_mode", ctypes.c_bool),
+        ("audio_ctx", ctypes.c_int),
+        ("tdrz_enable", ctypes.c_bool),
+        ("suppress_regex", ctypes.c_char_p),
+        ("initial_prompt", ctypes.c_char_p),
+        ("carry_initial_prompt", ctypes.c_bool),
+        ("prompt_tokens", ctypes.c_void_p),
+        ("prompt_n_tokens", ctypes.c_int),
+        ("language", ctypes.c_char_p),
+        ("detect_language", ctypes.c_bool),
+    ]
+
+
+def _params_buffer(params):
+    """The declared fields of `params`, padded to the reserved size."""
+    return type(f"{params.__name__}Buffer", (ctypes.Union,), {
+        "_fields_": [("params", params), ("_reserved", ctypes.c_ubyte * _PARAMS_RESERVED)],
+    })
+
+
+_FULL_PARAMS_BUFFERS = {params: _params_buffer(params) for params in (_FullParams15, _FullParams16, _FullParams18)}
+
+
+def full_params_layout(lib):
+    """
+    The whisper_full_params layout of a loaded libwhisper, from its exports
+    and version. Raises RuntimeError for versions whose layout is not known.
+    """
+    if hasattr(lib, "whisper_pcm_to_mel_phase_vocoder"):  # removed in 1.6.0 together with speed_up
+        return _FullParams15
+    if not hasattr(lib, "whisper_version"):  # added after 1.7.4
+        return _FullParams16
+    lib.whisper_version.restype = ctypes.c_char_p
+    lib.whisper_version.argtypes = []
+    version = lib.whisper_version().decode("utf-8", errors="replace")
+    numbers = tuple(int(n) for n in re.findall(r"\d+", version)[:3])
+    if (1, 8, 2) <= numbers < (1, 9):
+        return _FullParams18
+    raise RuntimeError(f"Unsupported whisper library version {version} (parameter layout unknown)")
+
+
+class _Context:
+    """A loaded whisper_context. whisper_full is not reentrant, so each context has its own lock."""
+
+    def __init__(self, lib, ctx):
+        self._lib = lib
+        self.ctx = ctx
+        self.lock = threading.Lock()
+
+    def close(self):
+        with self.lock:
+            if self.ctx:
+                self._lib.whisper_free(self.ctx)
+                self.ctx = None
+
+
+def _library_name():
+    if os.name == "nt":
+        return "whisper.dll"
+    if sys.platform == "darwin":
+        return "libwhisper.dylib"
+    return "libwhisper.so"
+
+
+def find_library(lib_path=None):
+    """Locate libwhisper: explicit path, bundled external/ copy, then system search."""
+    if lib_path:
+        return get_resource_path(lib_path)
+    bundled = get_resource_path(os.path.join("external", _library_name()))
+    if os.path.exists(bundled):
+        return bundled
+    return ctypes.util.find_library("whisper")
+
+
+class TranscriberLib:
+    """
+    Local speech-to-text by calling libwhisper directly.
+    No process spawn, no WAV encode and no temp file per dictation.
+    """
+
+    def __init__(self, model_path="external/models/ggml-small.bin", lib_path=None, language="de",
+                 audio_ctx_table=None, residency=None, threads=0, busy_threshold=0.75):
+        self.model_path = resolve_model_path(model_path)  # any model_manager.MODELS name, or a file
+        self.language = language
+        self.audio_ctx_table = audio_ctx_table
+        self.threads = threads  # 0 = whisper.cpp default; backed off per call under load
+        self.busy_threshold = busy_threshold
+        self.residency = residency
+        # n_threads is set per call, so one cached context serves every thread count
+        self.resident_key = (os.path.basename(self.model_path), language, 0, 1) if residency else None
+        self._language_b = language.encode("utf-8")  # must outlive whisper_full calls
+
+        if not os.path.exists(self.model_path):
+            raise FileNotFoundError(f"Model not found at {self.model_path}")
+
+        self.lib_path = find_library(lib_path)
+        if not self.lib_path or not os.path.exists(self.lib_path):
+            raise FileNotFoundError(f"whisper library not found ({_library_name()})")
+
+        self._lib = self._load_library(self.lib_path)
+        self._ctx = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load_library(path):
+        if os.name == "nt":
+            # Let the loader find ggml / SDL2 DLLs next to whisper.dll
+            os.add_dll_directory(os.path.dirname(os.path.abspath(path)))
+        lib = ctypes.CDLL(path)
+        layout = full_params_layout(lib)
+        logging.debug(f"libwhisper parameter layout: {layout.__doc__}")
+        params_buffer = _FULL_PARAMS_BUFFERS[layout]
+
+        lib.whisper_context_default_params.restype = _ContextParams
+        lib.whisper_context_default_params.argtypes = []
+        lib.whisper_init_from_file_with_params.restype = ctypes.c_void_p
+        lib.whisper_init_from_file_with_params.argtypes = [ctypes.c_char_p, _ContextParams]
+        lib.whisper_free.restype = None
+        lib.whisper_free.argtypes = [ctypes.c_void_p]
+
+        lib.whisper_full_default_params.restype = params_buffer
+        lib.whisper_full_default_params.argtypes = [ctypes.c_int]
+        lib.whisper_full.restype = ctypes.c_int
+        lib.whisper_full.argtypes = [ctypes.c_void_p, params_buffer,
+                                     ctypes.POINTER(ctypes.c_float), ctypes.c_int]
+        lib.whisper_full_n_segments.restype = ctypes.c_int
+        lib.whisper_full_n_segments.argtypes = [ctypes.c_void_p]
+        lib.whisper_full_get_segment_text.restype = ctypes.c_char_p
+        lib.whisper_full_get_segment_text.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        lib.whisper_full_n_tokens.restype = ctypes.c_int
+        lib.whisper_full_n_tokens.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        lib.whisper_full_get_token_id.restype = ctypes.c_int
+        lib.whisper_full_get_token_id.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_int]
+        lib.whisper_full_get_token_p.restype = ctypes.c_float
+        lib.whisper_full_get_token_p.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_int]
+        lib.whisper_token_eot.restype = ctypes.c_int
+        lib.whisper_token_eot.argtypes = [ctypes.c_void_p]
+        return lib
+
+    def _load_context(self):
+        t0 = time.perf_counter()
+        cparams = self._lib.whisper_context_default_params()
+        ctx = self._lib.whisper_init_from_file_with_params(
+            self.model_path.encode("utf-8"), cparams
+        )
+        if not ctx:
+            raise RuntimeError(f"whisper_init failed for {self.model_path}")
+        logging.info(f"[TIMING] whisper model load: {(time.perf_counter()-t0)*1000:.0f}ms")
+        return _Context(self._lib, ctx)
+
+    def start(self):
+        """Load the model into a whisper_context (kept until close(), or prefetched into the cache)."""
+        if self.resident_key:
+            self.prepare()
+            return
+        with self._lock:
+            if not self._ctx:
+                self._ctx = self._load_context()
+
+    def prepare(self):
+        """Recording started: make sure the cached context is loading (no-op without a cache)."""
+        if self.resident_key:
+            self.residency.prefetch(self.resident_key, self._load_context, model_size_mb(self.model_path))
+
+    def _borrow_context(self):
+        if self.resident_key:
+            return self.residency.use(self.resident_key, self._load_context, model_size_mb(self.model_path))
+        self.start()
+        return contextlib.nullcontext(self._ctx)
+
+    def close(self):
+        """Free an owned whisper_context (cached contexts stay with the ModelResidency)."""
+        with self._lock:
+            if self._ctx:
+                self._ctx.close()
+                self._ctx = None
+
+    def _make_params(self, audio_ctx=0):
+        buf = self._lib.whisper_full_default_params(WHISPER_SAMPLING_GREEDY)
+        p = buf.params
+        p.print_progress = False
+        p.print_realtime = False
+        p.print_timestamps = False
+        p.print_special = False
+        p.no_timestamps = True
+        p.language = self._language_b
+        p.detect_language = False
+        p.audio_ctx = audio_ctx
+        threads = threads_for_load(self.threads, self.busy_threshold)
+        if threads:
+            p.n_threads = threads
+        return buf
+
+    def transcribe(self, audio_data, sample_rate=16000, timeout=None, cancel=None):
+        """
+        Transcribe audio (PcmBuffer or numpy array) to text.
+        `timeout` and `cancel` are accepted for interface parity; an in-process
+        decode cannot be interrupted, so a cancelled call only skips the decode
+        if it has not started yet.
+        """
+        return self._decode(audio_data, sample_rate, scored=False, cancel=cancel)[0]
+
+    def transcribe_scored(self, audio_data, sample_rate=16000, timeout=None, cancel=None):
+        """Like transcribe(), but returns (text, token_confidence() or None)."""
+        return self._decode(audio_data, sample_rate, scored=True, cancel=cancel)
+
+    def _token_confidence(self, ctx, n_segments):
+        eot = self._lib.whisper_token_eot(ctx)
+        probs = [
+            self._lib.whisper_full_get_token_p(ctx, i, j)
+            for i in range(n_segments)
+            for j in range(self._lib.whisper_full_n_tokens(ctx, i))
+            if self._lib.whisper_full_get_token_id(ctx, i, j) < eot  # skip special tokens
+        ]
+        return token_confidence(probs)
+
+    def _decode(self, audio_data, sample_rate, scored, cancel=None):
+        if len(audio_data) == 0 or (cancel and cancel.cancelled):
+            return "", None
+        pcm = PcmBuffer.wrap(audio_data, sample_rate)
+        if pcm.sample_rate != WHISPER_SAMPLE_RATE:
+            logging.error(f"whisper expects {WHISPER_SAMPLE_RATE} Hz audio, got {pcm.sample_rate}")
+            return "", None
+
+        # No copy for float32 capture: whisper_full reads the recorder's buffer directly
+        samples = np.ascontiguousarray(pcm.as_float32())
+        ptr = samples.ctypes.data_as(ctypes.POINTER(ctypes.c_float))
+
+        try:
+            with self._borrow_context() as context, context.lock:
+                if cancel and cancel.cancelled:  # cancelled while waiting for the context
+                    return "", None
+                params = self._make_params(audio_ctx_for(pcm.duration, self.audio_ctx_table))
+                ret = self._lib.whisper_full(context.ctx, params, ptr, len(samples))
+                if ret != 0:
+                    logging.error(f"whisper_full failed with code {ret}")
+                    return "", None
+                n = self._lib.whisper_full_n_segments(context.ctx)
+                parts = [
+                    self._lib.whisper_full_get_segment_text(context.ctx, i).decode("utf-8", errors="replace")
+                    for i in range(n)
+                ]
+                confidence = self._token_confidence(context.ctx, n) if scored else None
+            return "".join(parts).strip(), confidence
+        except Exception as e:
+            logging.error(f"Transcription error: {e}")
+            return "", None
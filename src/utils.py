@@ -1,6 +1,10 @@
+import collections
 import logging
 import os
+import subprocess
 import sys
+import threading
+import time
 
 
 def setup_logging(log_file="voice_typer.log"):
@@ -52,6 +56,147 @@ def get_models_dir():
     return models_dir
 
 
+def hidden_subprocess_kwargs():
+    """Popen kwargs that keep child console windows hidden on Windows."""
+    if os.name != "nt":
+        return {}
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    startupinfo.wShowWindow = subprocess.SW_HIDE
+    return {"startupinfo": startupinfo, "creationflags": subprocess.CREATE_NO_WINDOW}
+
+
+def _windows_cpu_times():
+    import ctypes
+    idle, kernel, user = (ctypes.c_ulonglong(), ctypes.c_ulonglong(), ctypes.c_ulonglong())
+    if not ctypes.windll.kernel32.GetSystemTimes(ctypes.byref(idle), ctypes.byref(kernel), ctypes.byref(user)):
+        return None
+    return idle.value, kernel.value + user.value  # kernel time includes idle time
+
+
+def _system_cpu_times():
+    """(idle, total) CPU time counters of the whole machine, None where unavailable."""
+    if os.name == "nt":
+        return _windows_cpu_times()
+    try:
+        with open("/proc/stat", "r") as f:
+            fields = [int(value) for value in f.readline().split()[1:9]]
+    except (OSError, ValueError):
+        return None
+    if len(fields) < 5:
+        return None
+    return fields[3] + fields[4], sum(fields)  # idle + iowait, of user..steal
+
+
+class _CpuSampler:
+    """Samples the system CPU times in the background; load() covers the last `window_s`."""
+
+    def __init__(self, interval=0.5, window_s=3.0):
+        self.interval = interval
+        self.supported = None  # unknown until start()
+        self._samples = collections.deque(maxlen=int(window_s / interval) + 1)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread or self.supported is False:
+                return
+            sample = _system_cpu_times()
+            self.supported = sample is not None
+            if not self.supported:
+                return
+            self._samples.append(sample)
+            self._thread = threading.Thread(target=self._run, daemon=True, name="cpu-sampler")
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            sample = _system_cpu_times()
+            if sample:
+                with self._lock:
+                    self._samples.append(sample)
+
+    def load(self):
+        with self._lock:
+            if len(self._samples) < 2:
+                return None
+            (idle0, total0), (idle1, total1) = self._samples[0], self._samples[-1]
+        if total1 <= total0:
+            return None
+        return min(1.0, max(0.0, 1.0 - (idle1 - idle0) / (total1 - total0)))
+
+
+_cpu_sampler = _CpuSampler()
+
+
+def start_cpu_sampler():
+    """Start sampling CPU load now, so cpu_load() has data by the first dictation."""
+    _cpu_sampler.start()
+
+
+def cpu_load():
+    """
+    CPU load over the last few seconds as a fraction of all cores (0.0 idle,
+    1.0 saturated), from a background sampler of the system CPU times.
+    Falls back to the 1-minute load average where those are unavailable.
+    None until the sampler has two samples (about half a second).
+    """
+    _cpu_sampler.start()
+    if _cpu_sampler.supported:
+        return _cpu_sampler.load()
+    if hasattr(os, "getloadavg"):
+        try:
+            return min(1.0, os.getloadavg()[0] / (os.cpu_count() or 1))
+        except OSError:
+            return None
+    return None
+
+
+def _windows_process_memory(pid):
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+    PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+    kernel32 = ctypes.windll.kernel32
+    kernel32.OpenProcess.restype = wintypes.HANDLE
+    handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+    if not handle:
+        return None
+    try:
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        if not kernel32.K32GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.WorkingSetSize
+    finally:
+        kernel32.CloseHandle(handle)
+
+
+def process_memory_mb(pid=None):
+    """Current resident memory (working set) of a process in MB, None if unavailable."""
+    pid = pid or os.getpid()
+    if os.name == "nt":
+        size = _windows_process_memory(pid)
+        return size / (1024 * 1024) if size is not None else None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
 def notify(title, message):
     """Send a desktop notification (console fallback)."""
     print(f"NOTIFICATION [{title}]: {message}")
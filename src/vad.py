@@ -0,0 +1,133 @@
+"""
+Lightweight voice activity detection (frame energy + zero-crossing rate).
+Trims leading/trailing silence and rejects recordings that contain no speech.
+"""
+
+import logging
+import numpy as np
+
+from pcm import PcmBuffer
+
+FRAME_MS = 20
+
+
+def frame_view(samples, frame_len):
+    """View the signal as (n_frames, frame_len), dropping the partial tail frame."""
+    n_frames = len(samples) // frame_len
+    return samples[:n_frames * frame_len].reshape(n_frames, frame_len)
+
+
+def speech_mask(pcm, frame_ms=FRAME_MS, threshold_db=-48.0, noise_ratio=2.5, zcr_min=0.25):
+    """
+    Boolean mask with one entry per frame, True where the frame looks like speech.
+
+    A frame counts as speech if its RMS is above both an absolute floor
+    (`threshold_db` dBFS) and `noise_ratio` times the estimated noise floor
+    (capped at a quarter of the loudest frame).
+    Quieter frames with a high zero-crossing rate (fricatives like "s"/"f")
+    are accepted at half that level.
+    """
+    samples = pcm.as_float32()
+    frame_len = max(1, int(pcm.sample_rate * frame_ms / 1000))
+    frames = frame_view(samples, frame_len)
+    if len(frames) == 0:
+        return np.zeros(0, dtype=bool)
+
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+    zcr = np.mean(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1)
+
+    # Relative threshold from the noise floor, capped below the peak so a
+    # window that is speech from start to end is not judged against itself
+    noise_floor = np.percentile(rms, 10)
+    relative = min(noise_floor * noise_ratio, rms.max() / 4)
+    threshold = max(10 ** (threshold_db / 20), relative)
+
+    return (rms > threshold) | ((rms > threshold / 2) & (zcr > zcr_min))
+
+
+def trim_silence(audio, sample_rate=16000, frame_ms=FRAME_MS, threshold_db=-48.0,
+                 min_speech_ms=150, padding_ms=250):
+    """
+    Cut leading and trailing silence from a recording.
+
+    Returns the trimmed PcmBuffer (a view, no copy), or None when the
+    recording holds less than `min_speech_ms` of speech.
+    """
+    pcm = PcmBuffer.wrap(audio, sample_rate)
+    mask = speech_mask(pcm, frame_ms=frame_ms, threshold_db=threshold_db)
+    frame_len = max(1, int(pcm.sample_rate * frame_ms / 1000))
+
+    speech_ms = int(np.count_nonzero(mask)) * frame_ms
+    if speech_ms < min_speech_ms:
+        logging.info(f"VAD: no speech in {pcm.duration:.2f}s recording ({speech_ms}ms voiced), skipping")
+        return None
+
+    voiced = np.flatnonzero(mask)
+    pad = int(pcm.sample_rate * padding_ms / 1000)
+    start = max(0, voiced[0] * frame_len - pad)
+    end = min(len(pcm), (voiced[-1] + 1) * frame_len + pad)
+
+    removed = (len(pcm) - (end - start)) / pcm.sample_rate
+    logging.info(f"VAD: trimmed {removed:.2f}s of silence "
+                 f"({start / pcm.sample_rate:.2f}s lead, {(len(pcm) - end) / pcm.sample_rate:.2f}s tail), "
+                 f"{(end - start) / pcm.sample_rate:.2f}s kept")
+    return pcm.slice(start, end)
+
+
+def find_pauses(audio, sample_rate=16000, min_pause_ms=400, frame_ms=FRAME_MS, threshold_db=-48.0):
+    """
+    Locate silent stretches of at least `min_pause_ms`.
+    Returns a list of (start_sample, end_sample) tuples in order.
+    """
+    pcm = PcmBuffer.wrap(audio, sample_rate)
+    silent = ~speech_mask(pcm, frame_ms=frame_ms, threshold_db=threshold_db)
+    if not silent.any():
+        return []
+    frame_len = max(1, int(pcm.sample_rate * frame_ms / 1000))
+
+    # Run boundaries of the silent mask, vectorized
+    padded = np.concatenate(([False], silent, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    starts, ends = edges[0::2], edges[1::2]
+    min_frames = max(1, min_pause_ms // frame_ms)
+    keep = (ends - starts) >= min_frames
+    return [(int(a) * frame_len, int(b) * frame_len) for a, b in zip(starts[keep], ends[keep])]
+
+
+def quietest_point(pcm, start, end, frame_ms=FRAME_MS):
+    """Sample offset of the centre of the lowest-energy frame in [start, end)."""
+    frame_len = max(1, int(pcm.sample_rate * frame_ms / 1000))
+    window = pcm.as_float32()[start:end]
+    frames = frame_view(window, frame_len)
+    if len(frames) == 0:
+        return (start + end) // 2
+    energy = np.abs(frames).mean(axis=tuple(range(1, frames.ndim)))
+    return start + int(energy.argmin()) * frame_len + frame_len // 2
+
+
+def split_at_pauses(audio, sample_rate=16000, target_s=30.0, min_s=15.0, max_s=45.0,
+                    min_pause_ms=300, threshold_db=-48.0):
+    """
+    Split a long recording into chunks of about `target_s` seconds, cutting
+    in the middle of pauses. Where no pause falls between `min_s` and
+    `max_s`, the cut goes to the quietest frame of the second before `max_s`.
+    Returns a list of PcmBuffer views in order.
+    """
+    pcm = PcmBuffer.wrap(audio, sample_rate)
+    sr = pcm.sample_rate
+    if pcm.duration <= max_s:
+        return [pcm]
+
+    candidates = [(a + b) // 2 for a, b in find_pauses(pcm, min_pause_ms=min_pause_ms, threshold_db=threshold_db)]
+    chunks, start = [], 0
+    while len(pcm) - start > max_s * sr:
+        lo, hi, target = start + int(min_s * sr), start + int(max_s * sr), start + int(target_s * sr)
+        inside = [c for c in candidates if lo <= c <= hi]
+        if inside:
+            cut = min(inside, key=lambda c: abs(c - target))
+        else:
+            cut = quietest_point(pcm, hi - sr, hi)
+        chunks.append(pcm.slice(start, cut))
+        start = cut
+    chunks.append(pcm.slice(start))
+    return chunks
@@ -0,0 +1,228 @@
+"""
+Long-lived whisper.cpp worker process.
+Runs whisper.cpp's server mode so the model stays loaded between dictations.
+"""
+
+import socket
+import subprocess
+import contextlib
+import threading
+import time
+import logging
+
+import requests
+
+from utils import hidden_subprocess_kwargs
+
+
+class WorkerError(Exception):
+    """Raised when the worker process cannot serve a request."""
+
+
+def _find_free_port(host):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+class WhisperWorker:
+    """
+    Manages a whisper.cpp server process bound to localhost.
+
+    Any executable that accepts the whisper.cpp server arguments
+    (-m, -l, --host, --port) and answers POST /inference can stand in
+    for the real binary.
+    """
+
+    HOST = "127.0.0.1"
+    MAX_RESTARTS = 5          # within RESTART_WINDOW seconds
+    RESTART_WINDOW = 60
+
+    def __init__(self, server_path, model_path, language="de",
+                 startup_timeout=60, extra_args=None):
+        self.server_path = server_path
+        self.model_path = model_path
+        self.language = language
+        self.startup_timeout = startup_timeout
+        self.extra_args = list(extra_args or [])
+
+        self.port = None
+        self.process = None
+        self._ready = False
+        self._started_at = 0.0
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._restarts = []
+        self._watchdog = None
+
+    @property
+    def url(self):
+        return f"http://{self.HOST}:{self.port}"
+
+    # ── Lifecycle ──────────────────────────────────────────────
+
+    def start(self):
+        """Spawn the worker (non-blocking) and start the crash watchdog."""
+        with self._lock:
+            self._stopping = False
+            self._spawn()
+
+        if self._watchdog is None or not self._watchdog.is_alive():
+            self._watchdog = threading.Thread(target=self._watch, daemon=True)
+            self._watchdog.start()
+
+    def _spawn(self):
+        self.port = _find_free_port(self.HOST)
+        cmd = [
+            self.server_path,
+            "-m", self.model_path,
+            "-l", self.language,
+            "--host", self.HOST,
+            "--port", str(self.port),
+        ] + self.extra_args
+
+        logging.info(f"Starting whisper worker on port {self.port}")
+        self.process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            **hidden_subprocess_kwargs()
+        )
+        self._started_at = time.perf_counter()
+        self._ready = False
+
+    def stop(self):
+        """Terminate the worker process."""
+        with self._lock:
+            self._stopping = True
+            proc = self.process
+            self.process = None
+
+        if proc and proc.poll() is None:
+            logging.info("Stopping whisper worker...")
+            proc.terminate()
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+
+    def close(self):
+        """Same as stop(); lets ModelResidency unload workers like any other engine."""
+        self.stop()
+
+    def abort(self):
+        """
+        Drop the request in progress. whisper-server cannot stop a decode it
+        has started and serves one request at a time, so the process is
+        replaced (not counted as a crash); other waiting callers retry on it.
+        """
+        with self._lock:
+            if self._stopping or self.process is None or self.process.poll() is not None:
+                return
+            logging.info("Aborting whisper worker request, restarting the worker")
+            self.process.kill()
+            self.process.wait()
+            self._spawn()
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def _watch(self):
+        """Restart the worker if it exits while it is supposed to be running."""
+        while not self._stopping:
+            time.sleep(1)
+            with self._lock:
+                if self._stopping or self.process is None:
+                    continue
+                code = self.process.poll()
+                if code is None:
+                    continue
+                logging.warning(f"Whisper worker exited with code {code}, restarting...")
+                self._restart_locked()
+
+    def _restart_locked(self):
+        now = time.monotonic()
+        self._restarts = [t for t in self._restarts if now - t < self.RESTART_WINDOW]
+        if len(self._restarts) >= self.MAX_RESTARTS:
+            logging.error("Whisper worker keeps crashing, giving up on restarts")
+            self.process = None
+            return False
+        self._restarts.append(now)
+        self._spawn()
+        return True
+
+    def ensure_running(self):
+        """Make sure a worker is running and accepting connections."""
+        with self._lock:
+            if self._stopping:
+                raise WorkerError("Worker has been stopped")
+            if self.process is None or self.process.poll() is not None:
+                if not self._restart_locked():
+                    raise WorkerError("Worker unavailable")
+        self._wait_ready()
+
+    def _wait_ready(self):
+        if self._ready:
+            return
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            proc = self.process
+            if proc is None or proc.poll() is not None:
+                raise WorkerError("Worker exited during startup")
+            try:
+                with socket.create_connection((self.HOST, self.port), timeout=0.5):
+                    self._ready = True
+                    logging.info(f"[TIMING] Whisper worker ready after "
+                                 f"{(time.perf_counter()-self._started_at)*1000:.0f}ms")
+                    return
+            except OSError:
+                time.sleep(0.05)
+        raise WorkerError("Worker did not become ready in time")
+
+    # ── Requests ──────────────────────────────────────────────
+
+    def inference(self, wav_bytes, timeout=60, fields=None, cancel=None):
+        """
+        Send a WAV payload to the worker and return the transcribed text.
+        Retries once on a fresh worker if the connection drops. Cancelling
+        `cancel` (a CancelToken) aborts the request via abort().
+        """
+        data = {"response_format": "text", "temperature": "0.0"}
+        if fields:
+            data.update(fields)
+
+        for attempt in range(2):
+            if cancel and cancel.cancelled:
+                raise WorkerError("Request cancelled")
+            self.ensure_running()
+            process = self.process
+            try:
+                with cancel.registered(self.abort) if cancel else contextlib.nullcontext():
+                    response = requests.post(
+                        f"{self.url}/inference",
+                        files={"file": ("audio.wav", wav_bytes, "audio/wav")},
+                        data=data,
+                        timeout=timeout,
+                    )
+            except requests.ConnectionError as e:
+                if cancel and cancel.cancelled:
+                    raise WorkerError("Request cancelled")
+                if attempt == 0:
+                    logging.warning(f"Whisper worker connection failed ({e}), retrying...")
+                    with self._lock:
+                        # Only the process this request went to; abort() may already have replaced it
+                        if self.process is process and process is not None and process.poll() is None:
+                            process.kill()
+                            process.wait()
+                    continue
+                raise WorkerError(f"Worker connection failed: {e}")
+            except requests.Timeout:
+                raise WorkerError("Worker request timed out")
+
+            if response.status_code != 200:
+                raise WorkerError(f"Worker error {response.status_code}: {response.text}")
+            return response.text.strip()
+
+        raise WorkerError("Worker unavailable")
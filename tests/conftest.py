@@ -0,0 +1,63 @@
+import contextlib
+import json
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), "src"))
+sys.path.insert(0, TESTS_DIR)
+
+
+def _launcher(directory, name, script):
+    """An executable that runs `script` with this Python interpreter."""
+    script = os.path.join(TESTS_DIR, script)
+    if os.name == "nt":
+        launcher = directory / f"{name}.bat"
+        launcher.write_text(f'@"{sys.executable}" "{script}" %*\n')
+    else:
+        launcher = directory / name
+        launcher.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n')
+        launcher.chmod(0o755)
+    return str(launcher)
+
+
+def _fake_binary(tmp_path, name, script):
+    """make(**config) -> (binary path, model path, log path); the "model" is the fake's JSON config."""
+    launcher = _launcher(tmp_path, name, script)
+
+    def make(**config):
+        log = tmp_path / f"{name}.log"
+        config.setdefault("log", str(log))
+        model = tmp_path / f"{name}-model.json"
+        model.write_text(json.dumps(config))
+        return launcher, str(model), log
+
+    return make
+
+
+@pytest.fixture
+def fake_server(tmp_path):
+    """whisper-server stand-in (fake_whisper_server.py)."""
+    return _fake_binary(tmp_path, "whisper-server", "fake_whisper_server.py")
+
+
+@pytest.fixture
+def fake_cli(tmp_path):
+    """whisper.exe stand-in (fake_whisper_cli.py)."""
+    return _fake_binary(tmp_path, "whisper", "fake_whisper_cli.py")
+
+
+@pytest.fixture
+def stub_api():
+    """Transcription endpoint stand-in (fake_transcription_api.py): make(**attributes) -> (url, received)."""
+    from fake_transcription_api import stub_server
+
+    with contextlib.ExitStack() as servers:
+        def make(**attributes):
+            received = []
+            url = servers.enter_context(stub_server(received=received, **attributes))
+            return url, received
+
+        yield make
@@ -0,0 +1,124 @@
+"""
+Stand-in for an OpenAI-compatible /audio/transcriptions endpoint, used by
+the tests and by src/benchmark.py. It checks the multipart framing but does
+not transcribe: every complete upload is answered with `words` words of
+fixed text ("word0 word1 ...").
+"""
+
+import contextlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Accepts a transcription upload at `kbps` and answers with `words` words
+    of fixed text, produced one every `delta_ms`. Requests with stream=true
+    get them as server-sent events (or the raw `events` text, if set),
+    others once the whole text is ready. Complete uploads are appended to
+    `received` as {"chunked": bool, "body": bytes}, if it is a list.
+    """
+
+    kbps = 0  # 0 = unthrottled
+    words = 2
+    delta_ms = 0
+    events = None
+    received = None
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _read(self, size):
+        data = self.rfile.read(size)
+        if self.kbps:
+            time.sleep(len(data) * 8 / (self.kbps * 1000))
+        return data
+
+    def _chunked(self):
+        return self.headers.get("Transfer-Encoding", "").lower() == "chunked"
+
+    def _read_body(self):
+        if self._chunked():
+            parts = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                parts.append(self._read(size))
+                self.rfile.readline()
+            return b"".join(parts)
+        remaining = int(self.headers.get("Content-Length", 0))
+        parts = []
+        while remaining > 0:
+            chunk = self._read(min(4096, remaining))
+            if not chunk:
+                break
+            parts.append(chunk)
+            remaining -= len(chunk)
+        return b"".join(parts)
+
+    def do_POST(self):
+        try:
+            received = self._read_body()
+        except ValueError:  # the client abandoned a chunked upload
+            self.close_connection = True
+            return
+        boundary = self.headers.get("Content-Type", "").partition("boundary=")[2].encode()
+        if not boundary or not received.rstrip().endswith(b"--" + boundary + b"--"):
+            self.send_error(400, "incomplete multipart body")
+            return
+        if self.received is not None:
+            self.received.append({"chunked": self._chunked(), "body": received})
+        words = [f"word{i}" for i in range(self.words)]
+        if b'name="stream"\r\n\r\ntrue' in received:
+            self._send_events(words)
+            return
+        time.sleep(self.delta_ms * len(words) / 1000)
+        body = " ".join(words).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_events(self, words):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(data):
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        if self.events is not None:
+            send(self.events.encode())
+        else:
+            for i, word in enumerate(words):
+                time.sleep(self.delta_ms / 1000)
+                send(f"data: {json.dumps({'type': 'transcript.text.delta', 'delta': word if i == 0 else ' ' + word})}"
+                     f"\n\n".encode())
+            send(f"data: {json.dumps({'type': 'transcript.text.done', 'text': ' '.join(words)})}\n\n".encode())
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, *args):
+        pass
+
+
+@contextlib.contextmanager
+def stub_server(**attributes):
+    """Run a StubHandler server with the given class attributes (kbps, words, ...); yields its URL."""
+    handler = type("Handler", (StubHandler,), attributes)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/v1/audio/transcriptions"
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,68 @@
+"""
+Stand-in for whisper.cpp's whisper.exe in tests.
+Reads the audio named by -f ("-" = stdin) and prints a fixed transcript.
+The "model" file (-m) is a JSON object that sets the behaviour:
+
+    text       transcript to print (default "fake transcript")
+    stdin      false to reject "-f -" the way builds without stdin support do
+    audio_ctx  false to leave -ac out of the usage text and answer it the way
+               older builds do: usage on stderr, exit 0, no transcript
+    fail       true to exit with an error on every run
+    log        file to append "run <audio argument>" to on every run (and
+               "ac <n>" when -ac is accepted)
+"""
+
+import argparse
+import json
+import os
+import sys
+
+
+def _usage(config):
+    sys.stderr.write("usage: whisper [options] file0.wav file1.wav ...\n\n"
+                     "  -t N,      --threads N         number of threads to use during computation\n")
+    if config.get("audio_ctx", True):
+        sys.stderr.write("  -ac N,     --audio-ctx N       audio context size (0 - all)\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("-m", dest="model", required=True)
+    parser.add_argument("-f", dest="audio")
+    parser.add_argument("-ac", dest="audio_ctx")
+    parser.add_argument("-h", dest="help", action="store_true")
+    args, _ = parser.parse_known_args()
+
+    with open(args.model, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    if args.help:
+        _usage(config)
+        return 0
+    if args.audio_ctx is not None and not config.get("audio_ctx", True):
+        sys.stderr.write("error: unknown argument: -ac\n")
+        _usage(config)
+        return 0
+    if config.get("log"):
+        with open(config["log"], "a", encoding="utf-8") as f:
+            f.write(f"run {'stdin' if args.audio == '-' else 'file'}\n")
+            if args.audio_ctx is not None:
+                f.write(f"ac {args.audio_ctx}\n")
+
+    if args.audio == "-":
+        if not config.get("stdin", True):
+            sys.stderr.write("error: input file not found '-'\n")
+            return 2
+        sys.stdin.buffer.read()
+    elif not os.path.exists(args.audio):
+        sys.stderr.write(f"error: input file not found '{args.audio}'\n")
+        return 2
+
+    if config.get("fail"):
+        sys.stderr.write("error: failed to initialize whisper context\n")
+        return 3
+    print(config.get("text", "fake transcript"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Stand-in for whisper.cpp's server binary in tests.
+Accepts the arguments WhisperWorker passes (-m, -l, --host, --port, ...)
+and answers POST /inference. The "model" file is a JSON object that sets
+the behaviour:
+
+    text          reply text (default "fake transcript")
+    delay_s       seconds each request takes to "decode" (default 0)
+    startup_s     seconds before the port is opened (default 0)
+    crash_on      list of request numbers (1-based, per process) on which the
+                  process exits without answering
+    crash_flag    file whose presence makes the next request crash the process
+                  (the file is removed, so only one process crashes)
+    log           file to append one line per event to: "start", "request <n>"
+                  or "done <n>", followed by the process id
+
+Like the real server, requests are decoded one at a time.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _log(config, event):
+    if config.get("log"):
+        with open(config["log"], "a", encoding="utf-8") as f:
+            f.write(f"{event} {os.getpid()}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-m", dest="model", required=True)
+    parser.add_argument("-l", dest="language", default="en")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    args, _ = parser.parse_known_args()
+
+    with open(args.model, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    time.sleep(config.get("startup_s", 0))
+    served = [0]
+    decoding = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            if self.path != "/inference":
+                self.send_error(404)
+                return
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            with decoding:
+                served[0] += 1
+                n = served[0]
+                _log(config, f"request {n}")
+                if n in config.get("crash_on", []):
+                    os._exit(3)
+                flag = config.get("crash_flag")
+                if flag and os.path.exists(flag):
+                    os.remove(flag)
+                    os._exit(3)
+                time.sleep(config.get("delay_s", 0))
+                _log(config, f"done {n}")
+            body = config.get("text", "fake transcript").encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    _log(config, "start")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+import threading
+
+import numpy as np
+
+from capture_buffer import CaptureBuffer
+
+
+def _block(start, n=7):
+    return np.arange(start, start + n, dtype=np.float32).reshape(-1, 1)
+
+
+def test_reserve_grows_off_the_writer():
+    buffer = CaptureBuffer(1, 100)
+    for start in range(0, 56, 7):
+        buffer.write(_block(start))
+    buffer.reserve()  # past GROW_AT: the larger array is prepared here
+    for start in range(56, 196, 7):
+        buffer.write(_block(start))
+
+    assert len(buffer.data) == 200
+    assert buffer.emergency_grows == 0
+    assert (buffer.view()[:, 0] == np.arange(196)).all()
+
+
+def test_concurrent_reserve_keeps_every_sample():
+    buffer = CaptureBuffer(1, 64)
+    done = threading.Event()
+
+    def poller():
+        while not done.is_set():
+            buffer.reserve()
+
+    thread = threading.Thread(target=poller)
+    thread.start()
+    try:
+        for start in range(0, 70000, 7):
+            buffer.write(_block(start))
+    finally:
+        done.set()
+        thread.join()
+    assert (buffer.view()[:, 0] == np.arange(70000)).all()
@@ -0,0 +1,58 @@
+import time
+
+import numpy as np
+
+from hedging import CircuitBreaker, HedgedTranscriber
+
+
+class _Local:
+    def __init__(self, text, delay_s):
+        self.text = text
+        self.delay_s = delay_s
+
+    def transcribe(self, pcm, timeout=60, cancel=None):
+        time.sleep(self.delay_s)
+        return self.text
+
+
+class _SlowCloud:
+    """Keeps "uploading" until cancelled, then returns without an outcome, like an aborted upload."""
+
+    def __init__(self):
+        self.breaker = None
+        self.calls = 0
+
+    def transcribe(self, pcm, timeout=60, cancel=None):
+        self.calls += 1
+        while not cancel.cancelled:
+            time.sleep(0.01)
+        return ""
+
+
+def _open_breaker(cooldown_s):
+    breaker = CircuitBreaker(failure_threshold=1, cooldown_s=cooldown_s)
+    breaker.record_failure()
+    time.sleep(cooldown_s)
+    return breaker
+
+
+def test_cancelled_trial_releases_the_half_open_circuit():
+    cloud = _SlowCloud()
+    breaker = _open_breaker(0.1)
+    hedge = HedgedTranscriber(_Local("local text", delay_s=0.3), cloud, budget_s=0.05, breaker=breaker)
+    try:
+        assert hedge.transcribe(np.zeros(16000, dtype=np.float32)) == "local text"
+        assert cloud.calls == 1  # the trial went out and lost
+        time.sleep(0.1)  # the cancelled cloud call finishes
+        assert breaker.allow()  # the next request may be the trial again
+    finally:
+        hedge.close()
+
+
+def test_trial_outcome_still_settles_the_circuit():
+    breaker = _open_breaker(0.05)
+    assert breaker.allow()
+    assert not breaker.allow()  # only one trial at a time
+    breaker.record_success()
+    assert not breaker.is_open
+    assert breaker.allow()
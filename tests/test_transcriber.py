@@ -0,0 +1,163 @@
+import time
+
+import numpy as np
+import pytest
+
+from pcm import PcmBuffer
+from transcriber import Transcriber, CANDIDATE_AUDIO_CTX_TABLE
+
+
+@pytest.fixture
+def transcriber_factory():
+    transcribers = []
+
+    def make(server, model):
+        # The launcher also stands in for whisper.exe; _decode_cli is replaced in the tests
+        transcriber = Transcriber(model_path=model, whisper_path=server, language="en",
+                                  server_path=server, audio_ctx_table=[])
+        transcriber.worker.startup_timeout = 10
+        transcribers.append(transcriber)
+        return transcriber
+
+    yield make
+    for transcriber in transcribers:
+        transcriber.close()
+
+
+def _record_cli_calls(transcriber):
+    calls = []
+
+    def decode_cli(pcm, extra_args, timeout, scored, cancel=None):
+        calls.append(timeout)
+        return "from whisper.exe", None
+
+    transcriber._decode_cli = decode_cli
+    return calls
+
+
+def _clip():
+    return PcmBuffer(np.zeros(16000, dtype=np.float32), 16000)
+
+
+def test_worker_answer_is_used(fake_server, transcriber_factory):
+    server, model, _ = fake_server(text="from the worker")
+    transcriber = transcriber_factory(server, model)
+    transcriber.start()
+    calls = _record_cli_calls(transcriber)
+
+    assert transcriber.transcribe(_clip(), timeout=10) == "from the worker"
+    assert calls == []
+
+
+def test_fallback_gets_the_remaining_budget(fake_server, transcriber_factory):
+    server, model, _ = fake_server(crash_on=[1], startup_s=0.5)
+    transcriber = transcriber_factory(server, model)
+    transcriber.start()
+    calls = _record_cli_calls(transcriber)
+
+    assert transcriber.transcribe(_clip(), timeout=30) == "from whisper.exe"
+    assert len(calls) == 1
+    assert 1.0 <= calls[0] < 29.5  # worker startup and the failed attempts were spent
+
+
+def test_no_fallback_once_the_worker_used_up_the_budget(fake_server, transcriber_factory):
+    server, model, _ = fake_server(delay_s=5)
+    transcriber = transcriber_factory(server, model)
+    transcriber.start()
+    transcriber.worker.ensure_running()
+    calls = _record_cli_calls(transcriber)
+
+    assert transcriber.transcribe(_clip(), timeout=1.5) == ""
+    assert calls == []
+
+
+def _runs(log):
+    return log.read_text().splitlines() if log.exists() else []
+
+
+def test_pipe_is_used_when_supported(fake_cli):
+    exe, model, log = fake_cli(text="piped")
+    transcriber = Transcriber(model_path=model, whisper_path=exe, language="en", audio_ctx_table=[])
+
+    assert transcriber.transcribe(_clip()) == "piped"
+    assert transcriber.transcribe(_clip()) == "piped"
+    assert _runs(log) == ["run stdin", "run stdin"]
+
+
+def test_rejected_pipe_switches_to_files(fake_cli):
+    exe, model, log = fake_cli(text="from file", stdin=False)
+    transcriber = Transcriber(model_path=model, whisper_path=exe, language="en", audio_ctx_table=[])
+
+    assert transcriber.transcribe(_clip()) == "from file"
+    assert transcriber.transcribe(_clip()) == "from file"
+    assert _runs(log) == ["run stdin", "run file", "run file"]
+
+
+def test_whisper_error_keeps_the_pipe_and_is_not_redecoded(fake_cli):
+    exe, model, log = fake_cli()
+    transcriber = Transcriber(model_path=model, whisper_path=exe, language="en", audio_ctx_table=[])
+    assert transcriber.transcribe(_clip()) == "fake transcript"
+
+    fake_cli(fail=True)  # same files, whisper now fails on every run
+    assert transcriber.transcribe(_clip()) == ""
+    assert transcriber._pipe_supported is True
+    assert _runs(log) == ["run stdin", "run stdin"]
+
+
+def test_failing_first_probe_does_not_disable_the_pipe(fake_cli):
+    exe, model, log = fake_cli(fail=True)
+    transcriber = Transcriber(model_path=model, whisper_path=exe, language="en", audio_ctx_table=[])
+
+    assert transcriber.transcribe(_clip()) == ""
+    assert transcriber._pipe_supported is None  # the file failed as well: not the pipe's fault
+    assert _runs(log) == ["run stdin", "run file"]
+
+
+def test_audio_ctx_is_passed_when_whisper_accepts_it(fake_cli):
+    exe, model, log = fake_cli(text="short")
+    transcriber = Transcriber(model_path=model, whisper_path=exe, language="en",
+                              audio_ctx_table=CANDIDATE_AUDIO_CTX_TABLE)
+
+    assert transcriber.transcribe(_clip()) == "short"
+    assert _runs(log) == ["run stdin", "ac 256"]
+
+
+def test_audio_ctx_is_dropped_when_whisper_lacks_it(fake_cli):
+    exe, model, log = fake_cli(text="short", audio_ctx=False)
+    transcriber = Transcriber(model_path=model, whisper_path=exe, language="en",
+                              audio_ctx_table=CANDIDATE_AUDIO_CTX_TABLE)
+
+    assert transcriber.transcribe(_clip()) == "short"
+    assert transcriber.cli_accepts_audio_ctx() is False
+    assert _runs(log) == ["run stdin"]
+
+
+def test_audio_ctx_is_off_by_default(fake_cli):
+    exe, model, log = fake_cli()
+    transcriber = Transcriber(model_path=model, whisper_path=exe, language="en")
+
+    assert transcriber.transcribe(_clip()) == "fake transcript"
+    assert _runs(log) == ["run stdin"]
+
+
+def test_segments_share_the_job_budget(fake_cli):
+    exe, model, _ = fake_cli()
+    transcriber = Transcriber(model_path=model, whisper_path=exe, language="en", audio_ctx_table=[],
+                              segment_s=1.0)
+    transcriber._parallel_plan = lambda segments: (2, 1)
+    timeouts = []
+
+    def decode_cli(pcm, extra_args, timeout, scored, cancel=None):
+        timeouts.append(timeout)
+        time.sleep(0.4)
+        return "part", None
+
+    transcriber._decode_cli = decode_cli
+    t0 = time.perf_counter()
+    transcriber.transcribe(PcmBuffer(np.zeros(16000 * 6, dtype=np.float32), 16000), timeout=2.0)
+
+    # 8 segments in waves of 2: later waves get less, and the ones past the budget are skipped
+    assert time.perf_counter() - t0 < 2.0
+    assert 4 <= len(timeouts) < 8
+    assert max(timeouts) <= 2.0
+    assert timeouts[-1] < 1.5
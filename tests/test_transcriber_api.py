@@ -0,0 +1,117 @@
+import numpy as np
+
+from capture_buffer import CaptureBuffer
+from pcm import PcmBuffer
+from transcriber_api import TranscriberAPI, iter_sse_events
+
+
+class _Response:
+    def __init__(self, text):
+        self.lines = text.encode().split(b"\n")
+
+    def iter_lines(self, chunk_size=None):
+        return iter(self.lines)
+
+
+class _Recorder:
+    """A finished recording, as far as the encoder can tell."""
+
+    def __init__(self, pcm):
+        self.sample_rate = pcm.sample_rate
+        self.channels = pcm.channels
+        self.buffer = CaptureBuffer(pcm.channels, len(pcm))
+        self.buffer.write(pcm.as_float32().reshape(-1, pcm.channels))
+
+
+def _clip(seconds=1.0):
+    t = np.arange(int(16000 * seconds)) / 16000
+    return PcmBuffer((0.1 * np.sin(2 * np.pi * 220 * t)).astype(np.float32), 16000)
+
+
+def _api(url, **kwargs):
+    kwargs.setdefault("upload_format", "wav")
+    return TranscriberAPI(url=url, auth_scheme="none", **kwargs)
+
+
+def test_sse_multiline_data_and_done():
+    events = list(iter_sse_events(_Response(
+        'data: {"type": "a",\n'
+        'data:  "n": 1}\n'
+        '\n'
+        ': comment\n'
+        'data: {"type": "b"}\n'
+        '\n'
+        'data: [DONE]\n'
+        '\n'
+        'data: {"type": "after done"}\n'
+        '\n')))
+    assert events == [{"type": "a", "n": 1}, {"type": "b"}]
+
+
+def test_sse_trailing_event_without_blank_line():
+    events = list(iter_sse_events(_Response('data: {"type": "a"}\n\ndata: {"type": "last"}')))
+    assert events == [{"type": "a"}, {"type": "last"}]
+
+
+def test_upload_is_one_multipart_request(stub_api):
+    url, received = stub_api(words=3)
+    api = _api(url)
+
+    assert api.transcribe(_clip()) == "word0 word1 word2"
+    assert len(received) == 1
+    assert not received[0]["chunked"]
+    assert b'name="file"; filename="audio.wav"' in received[0]["body"]
+    assert b"RIFF" in received[0]["body"]
+    api.close()
+
+
+def test_streaming_upload_uses_chunked_transfer(stub_api):
+    url, received = stub_api()
+    api = _api(url, stream_upload=True)
+    pcm = _clip()
+
+    upload = api.start_encoder(_Recorder(pcm))
+    upload.stop(len(pcm))
+    assert api.transcribe(pcm, encoded_audio=upload) == "word0 word1"
+    assert len(received) == 1
+    assert received[0]["chunked"]
+    assert b"RIFF" in received[0]["body"]
+    api.close()
+
+
+def test_streamed_response_hands_deltas_over_in_order(stub_api):
+    url, _ = stub_api(words=5)
+    api = _api(url, stream_response=True)
+    deltas = []
+
+    assert api.transcribe(_clip(), on_text=deltas.append) == "word0 word1 word2 word3 word4"
+    assert deltas == ["word0", " word1", " word2", " word3", " word4"]
+    api.close()
+
+
+def test_streamed_response_without_done_event_joins_deltas(stub_api):
+    url, _ = stub_api(events='data: {"type": "transcript.text.delta", "delta": "hel"}\n\n'
+                             'data: {"type": "transcript.text.delta", "delta": "lo"}\n\n'
+                             'data: [DONE]\n\n')
+    api = _api(url, stream_response=True)
+    deltas = []
+
+    assert api.transcribe(_clip(), on_text=deltas.append) == "hello"
+    assert deltas == ["hel", "lo"]
+    api.close()
+
+
+def test_long_streamed_recording_is_sent_in_chunks(stub_api):
+    url, received = stub_api()
+    api = _api(url, stream_upload=True, chunk_s=1.0)  # at most 1.5 s per request
+    pcm = _clip(4.0)
+
+    upload = api.start_encoder(_Recorder(pcm))
+    upload.stop(len(pcm))
+    text = api.transcribe(pcm, encoded_audio=upload)
+
+    assert len(received) >= 3
+    assert not any(request["chunked"] for request in received)  # the stream never completed
+    assert text == " ".join(["word0 word1"] * len(received))
+    assert upload._done.wait(5) and upload._response is None
+    api.close()
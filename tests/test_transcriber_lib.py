@@ -0,0 +1,34 @@
+import types
+
+import pytest
+
+from transcriber_lib import _FullParams15, _FullParams16, _FullParams18, full_params_layout
+
+
+def _fake_lib(*exports, version=None):
+    lib = types.SimpleNamespace(**{name: object() for name in exports})
+    if version is not None:
+        lib.whisper_version = lambda: version.encode()
+    return lib
+
+
+@pytest.mark.parametrize("layout, language, detect_language", [
+    (_FullParams15, 88, 96),   # the bundled whisper.dll
+    (_FullParams16, 96, 104),
+    (_FullParams18, 104, 112),
+])
+def test_language_offsets(layout, language, detect_language):
+    assert layout.language.offset == language
+    assert layout.detect_language.offset == detect_language
+
+
+def test_layout_follows_the_library_version():
+    assert full_params_layout(_fake_lib("whisper_pcm_to_mel_phase_vocoder")) is _FullParams15
+    assert full_params_layout(_fake_lib()) is _FullParams16
+    assert full_params_layout(_fake_lib(version="1.8.2")) is _FullParams18
+
+
+@pytest.mark.parametrize("version", ["1.8.0", "1.9.0"])
+def test_unknown_versions_are_refused(version):
+    with pytest.raises(RuntimeError, match="Unsupported"):
+        full_params_layout(_fake_lib(version=version))
@@ -0,0 +1,122 @@
+import threading
+import time
+
+import pytest
+
+from cancellation import CancelToken
+from whisper_worker import WhisperWorker, WorkerError
+
+
+def _events(log, name):
+    if not log.exists():
+        return []
+    return [line.split() for line in log.read_text().splitlines() if line.startswith(name)]
+
+
+def _wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.fixture
+def worker_factory():
+    workers = []
+
+    def make(server, model, **kwargs):
+        worker = WhisperWorker(server, model, language="en", startup_timeout=10, **kwargs)
+        workers.append(worker)
+        return worker
+
+    yield make
+    for worker in workers:
+        worker.stop()
+
+
+def test_start_and_inference(fake_server, worker_factory):
+    server, model, log = fake_server(text="hello world")
+    worker = worker_factory(server, model)
+    worker.start()
+    worker.ensure_running()
+
+    assert worker.is_alive()
+    assert worker.inference(b"RIFF", timeout=10) == "hello world"
+    assert len(_events(log, "start")) == 1
+
+
+def test_watchdog_restarts_crashed_worker(fake_server, worker_factory):
+    server, model, log = fake_server()
+    worker = worker_factory(server, model)
+    worker.start()
+    worker.ensure_running()
+    first = worker.process
+
+    first.kill()
+    assert _wait_for(lambda: worker.process is not first and worker.is_alive())
+    assert worker.inference(b"RIFF", timeout=10) == "fake transcript"
+    assert len(worker._restarts) == 1
+
+
+def test_inference_retries_once_on_a_fresh_worker(fake_server, worker_factory, tmp_path):
+    flag = tmp_path / "crash"
+    flag.write_text("")
+    server, model, log = fake_server(crash_flag=str(flag))
+    worker = worker_factory(server, model)
+    worker.start()
+
+    # The first process dies mid-request; the request is repeated on a new one
+    assert worker.inference(b"RIFF", timeout=10) == "fake transcript"
+    assert len({pid for _, pid in _events(log, "start")}) == 2
+    assert len(_events(log, "done")) == 1
+
+
+def test_gives_up_after_max_restarts(fake_server, worker_factory):
+    server, model, log = fake_server(crash_on=[1])
+    worker = worker_factory(server, model)
+    worker.MAX_RESTARTS = 2
+    worker.start()
+
+    # Every request crashes its process; restarts come from the retry and the watchdog
+    for _ in range(worker.MAX_RESTARTS + 1):
+        with pytest.raises(WorkerError) as error:
+            worker.inference(b"RIFF", timeout=10)
+        if "unavailable" in str(error.value):
+            break
+    assert "unavailable" in str(error.value)
+    assert worker.process is None
+    assert len(_events(log, "start")) == worker.MAX_RESTARTS + 1
+
+
+def test_stop_terminates_and_is_not_restarted(fake_server, worker_factory):
+    server, model, log = fake_server()
+    worker = worker_factory(server, model)
+    worker.start()
+    worker.ensure_running()
+    process = worker.process
+
+    worker.stop()
+    assert process.poll() is not None
+    time.sleep(1.5)  # one watchdog round
+    assert worker.process is None
+    assert len(_events(log, "start")) == 1
+    with pytest.raises(WorkerError, match="stopped"):
+        worker.ensure_running()
+
+
+def test_cancel_aborts_request_without_counting_a_crash(fake_server, worker_factory):
+    server, model, log = fake_server(delay_s=5)
+    worker = worker_factory(server, model)
+    worker.start()
+    worker.ensure_running()
+    cancel = CancelToken()
+    threading.Timer(0.5, cancel.cancel).start()
+
+    t0 = time.monotonic()
+    with pytest.raises(WorkerError, match="cancelled"):
+        worker.inference(b"RIFF", timeout=10, cancel=cancel)
+    assert time.monotonic() - t0 < 4
+    assert worker._restarts == []
+    assert _wait_for(lambda: len(_events(log, "start")) == 2)